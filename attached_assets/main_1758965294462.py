@@ -1,16 +1,53 @@
 # main.py - ПОЛНЫЙ ПРОЕКТ ДЛЯ REPLIT
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_app_context, stream_with_context
 import sqlite3
 import requests
 import json
-import schedule
 import time
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import random
 import os
+import socket
+import atexit
 import hashlib
 import re
+import string
+import bisect
+import mmap
+import struct
+import zlib
+import queue
+import heapq
+import math
+import collections
+import copy
+import concurrent.futures
+import asyncio
+import gzip
+import csv
+import io
+import numpy as np
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём gzip
+    brotli = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow - extra "parquet": без него экспорт только в CSV/NDJSON
+    pa = pq = None
+try:
+    import httpx
+except ImportError:  # httpx - extra "live": без него живые API платформ недоступны
+    httpx = None
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+try:
+    import fcntl
+except ImportError:  # Windows: разделяемый mmap-бэкенд недоступен
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -944,9 +981,481 @@ def start(message):
 </html>
 '''
 
+DB_PATH = 'lucifer_analytics.db'
+
+class ConnectionPool:
+    """Пул SQLite-соединений: открываем один раз с WAL и кэшем подготовленных запросов"""
+
+    def __init__(self, db_path, max_idle=8):
+        self.db_path = db_path
+        self.idle = queue.LifoQueue(maxsize=max_idle)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=256)
+        # Действует только на новый файл, до перехода в WAL (см. migration_incremental_vacuum)
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, conn):
+        # Незавершённая транзакция не должна достаться следующему запросу
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+db_pool = ConnectionPool(DB_PATH)
+db_local = threading.local()
+db_write_listeners = []  # вызываются после запроса, который что-то записал в БД
+
+def get_db():
+    """Соединение с БД: на время запроса из пула, в фоновых потоках - своё на поток"""
+    if has_app_context():
+        if 'db' not in g:
+            g.db = db_pool.acquire()
+            g.db_changes = g.db.total_changes
+        return g.db
+    conn = getattr(db_local, 'conn', None)
+    if conn is None:
+        conn = db_local.conn = db_pool.connect()
+    # Повторный вызов из вспомогательной функции продолжает ту же транзакцию
+    return conn
+
+def finish_thread_db():
+    """Граница фоновой задачи - аналог teardown запроса: если задача упала до commit,
+    откатываем её транзакцию здесь, чтобы не держать блокировку записи дальше"""
+    conn = getattr(db_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        wrote = conn.total_changes != g.pop('db_changes', conn.total_changes)
+        db_pool.release(conn)
+        if wrote:
+            for listener in db_write_listeners:
+                listener()
+
+class ActionLedger:
+    """Журнал действий по ключу (platform, action_type) с поминутными корзинами"""
+
+    def __init__(self, retention_hours=48):
+        self.retention_minutes = retention_hours * 60
+        self.buckets = {}  # key -> [минуты, накопленные суммы, смещение головы]
+        self.last_timestamps = {}
+        self.last_epoch = 0.0
+        self.lock = threading.Lock()
+
+    def now(self):
+        # Монотонное epoch-время: системные часы не должны откатываться назад
+        self.last_epoch = max(time.time(), self.last_epoch)
+        return self.last_epoch
+
+    def record(self, platform, action_type, timestamp=None):
+        with self.lock:
+            self._record(platform, action_type, self.now() if timestamp is None else timestamp)
+
+    def count(self, platform, action_type, hours):
+        with self.lock:
+            return self._count(platform, action_type, hours)
+
+    def try_acquire(self, platform, action_type, cap, hours, min_interval=0):
+        """Атомарная проверка лимита и запись действия: (допущено, счётчик, последнее действие)"""
+        with self.lock:
+            ts = self.now()
+            count = self._count(platform, action_type, hours)
+            last = self.last_timestamps.get((platform, action_type))
+            admitted = count < cap and (not count or last is None or ts - last >= min_interval)
+            if admitted:
+                self._record(platform, action_type, ts)
+            return admitted, count, last
+
+    def try_acquire_many(self, platform, action_type, requested, cap, hours):
+        """Резерв до requested действий одной операцией; возвращает число выданных"""
+        with self.lock:
+            granted = max(0, min(requested, math.ceil(cap - self._count(platform, action_type, hours))))
+            if granted:
+                self._record(platform, action_type, self.now(), granted)
+            return granted
+
+    def release(self, platform, action_type, amount, timestamp):
+        """Возврат неиспользованного резерва в корзину минуты timestamp"""
+        with self.lock:
+            ring = self.buckets.get((platform, action_type))
+            if ring is None:
+                return
+            minutes, totals, head = ring
+            minute = int(timestamp // 60)
+            idx = bisect.bisect_left(minutes, minute, head)
+            if idx == len(minutes) or minutes[idx] != minute:
+                return  # корзина уже вытеснена
+            amount = min(amount, totals[idx] - (totals[idx - 1] if idx else 0))
+            for i in range(idx, len(totals)):
+                totals[i] -= amount
+
+    def _record(self, platform, action_type, ts, amount=1):
+        minute = int(ts // 60)
+        key = (platform, action_type)
+        ring = self.buckets.get(key)
+        if ring is None:
+            ring = self.buckets[key] = [[], [], 0]
+        minutes, totals, head = ring
+
+        if minutes and minutes[-1] == minute:
+            totals[-1] += amount
+        elif not minutes or minutes[-1] < minute:
+            minutes.append(minute)
+            totals.append((totals[-1] if totals else 0) + amount)
+        elif minute >= minutes[-1] - self.retention_minutes:
+            # Запись задним числом (явный timestamp): корзина встаёт на своё место, чтобы
+            # minutes оставался отсортированным для bisect, а суммы правее сдвигаются - O(n),
+            # обычные записи идут по времени и сюда не попадают
+            idx = bisect.bisect_left(minutes, minute, head)
+            if minutes[idx] != minute:
+                minutes.insert(idx, minute)
+                totals.insert(idx, totals[idx - 1] if idx else 0)
+            for i in range(idx, len(totals)):
+                totals[i] += amount
+        else:
+            return  # старше хранимого окна - такие корзины уже вытеснены
+
+        self.last_timestamps[key] = max(ts, self.last_timestamps.get(key, 0.0))
+        self._evict(ring, minute - self.retention_minutes)
+
+    def _count(self, platform, action_type, hours):
+        ring = self.buckets.get((platform, action_type))
+        if ring is None:
+            return 0
+        minutes, totals, head = ring
+        if head >= len(minutes):
+            return 0
+        # Корзина на границе окна учитывается целиком - оценка сверху безопаснее
+        cutoff_minute = int((self.now() - hours * 3600) // 60)
+        idx = bisect.bisect_left(minutes, cutoff_minute, head)
+        before = totals[idx - 1] if idx else 0
+        return totals[-1] - before
+
+    def last_action(self, platform, action_type):
+        return self.last_timestamps.get((platform, action_type))
+
+    def evict(self, hours):
+        with self.lock:
+            cutoff_minute = int((self.now() - hours * 3600) // 60)
+            for ring in self.buckets.values():
+                self._evict(ring, cutoff_minute)
+
+    def _evict(self, ring, cutoff_minute):
+        minutes, totals, head = ring
+        head = bisect.bisect_left(minutes, cutoff_minute, head)
+        # Физически сжимаем списки, только когда устаревшая часть перевешивает живую
+        if head > 64 and head * 2 > len(minutes):
+            base = totals[head - 1]
+            ring[0] = minutes[head:]
+            ring[1] = [total - base for total in totals[head:]]
+            head = 0
+        ring[2] = head
+
+class SQLiteLimitBackend:
+    """Общее для всех воркеров состояние лимитов в SQLite (WAL), переживает рестарт"""
+
+    def __init__(self, db_path=None, retention_hours=48):
+        self.db_path = db_path or DB_PATH
+        self.retention_minutes = retention_hours * 60
+        self.local = threading.local()
+        self.last_evict_minute = 0
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS safety_action_buckets (
+                platform TEXT NOT NULL,
+                action_type TEXT NOT NULL,
+                minute INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (platform, action_type, minute)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS safety_action_last (
+                platform TEXT NOT NULL,
+                action_type TEXT NOT NULL,
+                last_ts REAL NOT NULL,
+                PRIMARY KEY (platform, action_type)
+            ) WITHOUT ROWID
+        ''')
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # isolation_level=None - транзакциями управляем вручную через BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def now(self):
+        return time.time()
+
+    def record(self, platform, action_type, timestamp=None):
+        ts = self.now() if timestamp is None else timestamp
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._record(conn, platform, action_type, ts)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_evict(ts)
+
+    def count(self, platform, action_type, hours):
+        return self._count(self._conn(), platform, action_type, hours)
+
+    def last_action(self, platform, action_type):
+        row = self._conn().execute(
+            'SELECT last_ts FROM safety_action_last WHERE platform = ? AND action_type = ?',
+            (platform, action_type)
+        ).fetchone()
+        return row[0] if row else None
+
+    def try_acquire(self, platform, action_type, cap, hours, min_interval=0):
+        conn = self._conn()
+        # BEGIN IMMEDIATE берёт блокировку записи сразу: проверка и инкремент атомарны между процессами
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ts = self.now()
+            count = self._count(conn, platform, action_type, hours)
+            row = conn.execute(
+                'SELECT last_ts FROM safety_action_last WHERE platform = ? AND action_type = ?',
+                (platform, action_type)
+            ).fetchone()
+            last = row[0] if row else None
+            admitted = count < cap and (not count or last is None or ts - last >= min_interval)
+            if admitted:
+                self._record(conn, platform, action_type, ts)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_evict(ts)
+        return admitted, count, last
+
+    def try_acquire_many(self, platform, action_type, requested, cap, hours):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ts = self.now()
+            granted = max(0, min(requested, math.ceil(cap - self._count(conn, platform, action_type, hours))))
+            if granted:
+                self._record(conn, platform, action_type, ts, granted)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._maybe_evict(ts)
+        return granted
+
+    def release(self, platform, action_type, amount, timestamp):
+        self._conn().execute('''
+            UPDATE safety_action_buckets SET count = MAX(count - ?, 0)
+            WHERE platform = ? AND action_type = ? AND minute = ?
+        ''', (amount, platform, action_type, int(timestamp // 60)))
+
+    def evict(self, hours):
+        cutoff_minute = int((self.now() - hours * 3600) // 60)
+        self._conn().execute('DELETE FROM safety_action_buckets WHERE minute < ?', (cutoff_minute,))
+
+    def _record(self, conn, platform, action_type, ts, amount=1):
+        conn.execute('''
+            INSERT INTO safety_action_buckets (platform, action_type, minute, count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (platform, action_type, minute) DO UPDATE SET count = count + excluded.count
+        ''', (platform, action_type, int(ts // 60), amount))
+        conn.execute('''
+            INSERT INTO safety_action_last (platform, action_type, last_ts)
+            VALUES (?, ?, ?)
+            ON CONFLICT (platform, action_type) DO UPDATE SET last_ts = MAX(last_ts, excluded.last_ts)
+        ''', (platform, action_type, ts))
+
+    def _count(self, conn, platform, action_type, hours):
+        cutoff_minute = int((self.now() - hours * 3600) // 60)
+        row = conn.execute('''
+            SELECT COALESCE(SUM(count), 0) FROM safety_action_buckets
+            WHERE platform = ? AND action_type = ? AND minute >= ?
+        ''', (platform, action_type, cutoff_minute)).fetchone()
+        return row[0]
+
+    def _maybe_evict(self, ts):
+        # Устаревшие корзины удаляем не чаще раза в минуту на процесс
+        minute = int(ts // 60)
+        if minute != self.last_evict_minute:
+            self.last_evict_minute = minute
+            self.evict(self.retention_minutes / 60)
+
+class MmapLimitBackend:
+    """Состояние лимитов в разделяемом mmap-файле: проверка без обращения к БД"""
+
+    MAGIC = b'LCFRSAF1'
+    HEADER = struct.Struct('<8sq')
+    SLOTS = 64
+    KEY_SIZE = 48
+
+    def __init__(self, path='lucifer_safety_state.bin', retention_hours=48):
+        self.path = path
+        self.retention_minutes = retention_hours * 60
+        # Слот: ключ, время последнего действия, кольцо меток минут, кольцо счётчиков
+        self.ring_format = struct.Struct(f'<{self.retention_minutes}q')
+        self.slot_size = self.KEY_SIZE + 8 + self.retention_minutes * 16
+        self.size = self.HEADER.size + self.SLOTS * self.slot_size
+        self.slot_index = {}
+        self.lock = threading.Lock()
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._locked():
+            if os.fstat(self.fd).st_size != self.size:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+            self.map = mmap.mmap(self.fd, self.size)
+            magic, retention = self.HEADER.unpack_from(self.map, 0)
+            if magic != self.MAGIC or retention != self.retention_minutes:
+                self.map[:] = bytes(self.size)
+                self.HEADER.pack_into(self.map, 0, self.MAGIC, self.retention_minutes)
+
+    @contextmanager
+    def _locked(self):
+        # flock разделяет процессы, threading.Lock - потоки внутри процесса
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def now(self):
+        return time.time()
+
+    def record(self, platform, action_type, timestamp=None):
+        with self._locked():
+            ts = self.now() if timestamp is None else timestamp
+            self._record(self._slot(platform, action_type, create=True), ts)
+
+    def count(self, platform, action_type, hours):
+        with self._locked():
+            base = self._slot(platform, action_type)
+            return 0 if base is None else self._count(base, hours)
+
+    def last_action(self, platform, action_type):
+        with self._locked():
+            base = self._slot(platform, action_type)
+            if base is None:
+                return None
+            last = struct.unpack_from('<d', self.map, base + self.KEY_SIZE)[0]
+            return last or None
+
+    def try_acquire(self, platform, action_type, cap, hours, min_interval=0):
+        with self._locked():
+            ts = self.now()
+            base = self._slot(platform, action_type, create=True)
+            count = self._count(base, hours)
+            last = struct.unpack_from('<d', self.map, base + self.KEY_SIZE)[0] or None
+            admitted = count < cap and (not count or last is None or ts - last >= min_interval)
+            if admitted:
+                self._record(base, ts)
+            return admitted, count, last
+
+    def try_acquire_many(self, platform, action_type, requested, cap, hours):
+        with self._locked():
+            base = self._slot(platform, action_type, create=True)
+            granted = max(0, min(requested, math.ceil(cap - self._count(base, hours))))
+            if granted:
+                self._record(base, self.now(), granted)
+            return granted
+
+    def release(self, platform, action_type, amount, timestamp):
+        with self._locked():
+            base = self._slot(platform, action_type)
+            if base is None:
+                return
+            minute = int(timestamp // 60)
+            tag_offset = base + self.KEY_SIZE + 8 + (minute % self.retention_minutes) * 8
+            if struct.unpack_from('<q', self.map, tag_offset)[0] != minute:
+                return  # слот кольца уже занят другой минутой
+            count_offset = tag_offset + self.retention_minutes * 8
+            count = struct.unpack_from('<q', self.map, count_offset)[0]
+            struct.pack_into('<q', self.map, count_offset, max(count - amount, 0))
+
+    def evict(self, hours):
+        # Кольцо перезаписывает устаревшие минуты само, отдельная очистка не нужна
+        pass
+
+    def _slot(self, platform, action_type, create=False):
+        key = f'{platform}:{action_type}'.encode()[:self.KEY_SIZE]
+        base = self.slot_index.get(key)
+        if base is not None:
+            return base
+        padded = key.ljust(self.KEY_SIZE, b'\0')
+        start = zlib.crc32(key) % self.SLOTS
+        for probe in range(self.SLOTS):
+            base = self.HEADER.size + ((start + probe) % self.SLOTS) * self.slot_size
+            stored = self.map[base:base + self.KEY_SIZE]
+            if stored == padded:
+                self.slot_index[key] = base
+                return base
+            if stored == bytes(self.KEY_SIZE):
+                if not create:
+                    return None
+                self.map[base:base + self.KEY_SIZE] = padded
+                self.slot_index[key] = base
+                return base
+        raise RuntimeError('Таблица лимитов в mmap переполнена')
+
+    def _record(self, base, ts, amount=1):
+        minute = int(ts // 60)
+        pos = minute % self.retention_minutes
+        tag_offset = base + self.KEY_SIZE + 8 + pos * 8
+        count_offset = tag_offset + self.retention_minutes * 8
+        if struct.unpack_from('<q', self.map, tag_offset)[0] != minute:
+            struct.pack_into('<q', self.map, tag_offset, minute)
+            struct.pack_into('<q', self.map, count_offset, 0)
+        count = struct.unpack_from('<q', self.map, count_offset)[0]
+        struct.pack_into('<q', self.map, count_offset, count + amount)
+        last = struct.unpack_from('<d', self.map, base + self.KEY_SIZE)[0]
+        struct.pack_into('<d', self.map, base + self.KEY_SIZE, max(last, ts))
+
+    def _count(self, base, hours):
+        cutoff_minute = int((self.now() - hours * 3600) // 60)
+        tags_offset = base + self.KEY_SIZE + 8
+        tags = self.ring_format.unpack_from(self.map, tags_offset)
+        counts = self.ring_format.unpack_from(self.map, tags_offset + self.retention_minutes * 8)
+        return sum(count for tag, count in zip(tags, counts) if tag >= cutoff_minute)
+
+def create_limit_backend(kind=None):
+    """Бэкенд состояния лимитов: memory, sqlite или mmap (SAFETY_STATE_BACKEND)"""
+    kind = kind or os.environ.get('SAFETY_STATE_BACKEND', 'mmap')
+    try:
+        if kind == 'sqlite':
+            return SQLiteLimitBackend(os.environ.get('SAFETY_STATE_DB', DB_PATH))
+        if kind == 'mmap' and fcntl is not None:
+            return MmapLimitBackend(os.environ.get('SAFETY_STATE_FILE', 'lucifer_safety_state.bin'))
+    except Exception as e:
+        print(f"❌ Ошибка бэкенда лимитов {kind}: {e}")
+    return ActionLedger(retention_hours=48)
+
 class SafetyController:
-    def __init__(self):
-        self.actions_log = []
+    def __init__(self, backend=None):
+        self.ledger = backend if backend is not None else ActionLedger(retention_hours=48)
         self.platform_limits = {
             'tiktok': {'posts': 50, 'likes': 500, 'comments': 200},
             'instagram': {'posts': 30, 'likes': 350, 'comments': 150, 'dms': 150, 'actions': 150},
@@ -958,130 +1467,600 @@ class SafetyController:
     
     def check_action_safety(self, platform, action_type):
         try:
-            recent_actions = self.get_recent_actions(platform, action_type, 24)
+            recent_count = self.get_recent_actions(platform, action_type, 24)
             limit = self.platform_limits[platform].get(action_type, 10)
+            last_action = self.ledger.last_action(platform, action_type)
+            smart_delay = random.uniform(120, 300)  # Случайная задержка 2-5 минут
+            return self._verdict(recent_count, limit, last_action, smart_delay)
+        except Exception as e:
+            return {'safe': False, 'reason': f'Ошибка: {str(e)}'}
+    
+    def acquire_action(self, platform, action_type):
+        """Проверка безопасности и запись действия одной атомарной операцией"""
+        try:
+            limit = self.platform_limits[platform].get(action_type, 10)
+            smart_delay = random.uniform(120, 300)
+            admitted, recent_count, last_action = self.ledger.try_acquire(
+                platform, action_type, limit * 0.8, 24, smart_delay
+            )
+            if admitted:
+                return {'safe': True}
+            return self._verdict(recent_count, limit, last_action, smart_delay)
+        except Exception as e:
+            return {'safe': False, 'reason': f'Ошибка: {str(e)}'}
+    
+    def reserve_actions(self, platform, action_type, requested):
+        """Резерв ёмкости под пакет действий одной атомарной операцией.
+        Пакет ограничен дневным лимитом (порог автостопа 80%); умная задержка
+        между элементами пакета не применяется"""
+        limit = self.platform_limits[platform].get(action_type, 10)
+        return self.ledger.try_acquire_many(platform, action_type, requested, limit * 0.8, 24)
+    
+    def release_actions(self, platform, action_type, count, reserved_at):
+        """Возврат зарезервированных, но не выполненных действий; reserved_at - время
+        резерва, ёмкость возвращается в ту же минутную корзину"""
+        if count > 0:
+            self.ledger.release(platform, action_type, count, reserved_at)
+    
+    def _verdict(self, recent_count, limit, last_action, smart_delay):
+        # Проверка 80% лимита для автостопа
+        if recent_count >= limit * 0.8:
+            return {
+                'safe': False,
+                'reason': f'Достигнуто 80% от дневного лимита ({limit})',
+                'wait_time': '24 часа',
+                'auto_stop': True
+            }
+        
+        if recent_count >= limit:
+            return {
+                'safe': False,
+                'reason': f'Дневной лимит {limit} превышен',
+                'wait_time': '24 часа'
+            }
+        
+        # Умные задержки между действиями
+        if recent_count and last_action is not None:
+            time_diff = self.ledger.now() - last_action
             
-            # Проверка 80% лимита для автостопа
-            if len(recent_actions) >= limit * 0.8:
-                return {
-                    'safe': False,
-                    'reason': f'Достигнуто 80% от дневного лимита ({limit})',
-                    'wait_time': '24 часа',
-                    'auto_stop': True
-                }
-            
-            if len(recent_actions) >= limit:
+            if time_diff < smart_delay:
                 return {
                     'safe': False,
-                    'reason': f'Дневной лимит {limit} превышен',
-                    'wait_time': '24 часа'
+                    'reason': 'Требуется умная задержка',
+                    'wait_time': f'{int(smart_delay - time_diff)} сек',
+                    'retry_after': int(smart_delay - time_diff) + 1
                 }
-            
-            # Умные задержки между действиями
-            if recent_actions:
-                last_action = datetime.fromisoformat(recent_actions[-1]['timestamp'])
-                time_diff = (datetime.now() - last_action).total_seconds()
-                smart_delay = random.uniform(120, 300)  # Случайная задержка 2-5 минут
-                
-                if time_diff < smart_delay:
-                    return {
-                        'safe': False,
-                        'reason': 'Требуется умная задержка',
-                        'wait_time': f'{int(smart_delay - time_diff)} сек'
-                    }
-            
-            return {'safe': True}
-        except Exception as e:
-            return {'safe': False, 'reason': f'Ошибка: {str(e)}'}
+        
+        return {'safe': True}
     
     def get_recent_actions(self, platform, action_type, hours):
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        return [
-            action for action in self.actions_log
-            if action['platform'] == platform 
-            and action['type'] == action_type
-            and datetime.fromisoformat(action['timestamp']) > cutoff_time
-        ]
-    
-    def log_action(self, platform, action_type, content=''):
-        action = {
-            'platform': platform,
-            'type': action_type,
-            'content_hash': hash(content) % 10000,
-            'timestamp': datetime.now().isoformat()
-        }
-        self.actions_log.append(action)
-        self.clean_old_logs(48)
+        """Количество действий за последние hours часов"""
+        return self.ledger.count(platform, action_type, hours)
+
+class ColumnarHistory:
+    """История одной платформы в колонках NumPy с амортизированным дозаписыванием"""
+    
+    COLUMNS = ('created_at', 'followers', 'engagement', 'views')
+    
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.columns = {name: np.empty(capacity, dtype=np.float64) for name in self.COLUMNS}
     
-    def clean_old_logs(self, hours):
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        self.actions_log = [
-            action for action in self.actions_log
-            if datetime.fromisoformat(action['timestamp']) > cutoff_time
-        ]
+    def append(self, rows):
+        """rows: последовательность кортежей (created_at, followers, engagement, views)"""
+        if not rows:
+            return
+        block = np.asarray(rows, dtype=np.float64)
+        needed = self.size + len(block)
+        capacity = len(self.columns['created_at'])
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self.columns.items():
+                grown = np.empty(capacity, dtype=np.float64)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        previous_last = self.columns['created_at'][self.size - 1] if self.size else -np.inf
+        for index, name in enumerate(self.COLUMNS):
+            self.columns[name][self.size:needed] = block[:, index]
+        self.size = needed
+        # Массовая загрузка может принести строки задним числом: восстанавливаем порядок по времени
+        if block[:, 0].min() < previous_last or np.any(np.diff(block[:, 0]) < 0):
+            order = np.argsort(self.columns['created_at'][:self.size], kind='stable')
+            for column in self.columns.values():
+                column[:self.size] = column[:self.size][order]
+    
+    def __getitem__(self, name):
+        return self.columns[name][:self.size]
 
 class AnalyticsEngine:
-    def __init__(self):
-        self.performance_data = []
+    """Колоночное ядро аналитики поверх platform_stats.
+    История держится в памяти и дочитывается по id > last_id; счётчик
+    table_versions показывает, были ли удаления (тогда история перечитывается)"""
+    
+    def __init__(self, window=7):
+        self.window = window
+        self.history = {}
+        self.last_id = 0
+        self.version = None
+        self.metrics = None
+        self.lock = threading.Lock()
+    
+    def refresh(self, cursor=None):
+        cursor = cursor or get_db().cursor()
+        with self.lock:
+            version = read_table_versions(cursor, ('platform_stats',)).get('platform_stats', 0)
+            if version == self.version:
+                return
+            cursor.execute('''
+                SELECT id, platform, created_at, followers, engagement, views
+                FROM platform_stats WHERE id > ? ORDER BY id
+            ''', (self.last_id,))
+            rows = cursor.fetchall()
+            # Каждая вставка и каждое удаление увеличивают версию на 1:
+            # если прирост версии больше числа новых строк, были удаления или правки
+            if self.version is None or version - self.version != len(rows):
+                self.history, self.last_id = {}, 0
+                cursor.execute('''
+                    SELECT id, platform, created_at, followers, engagement, views
+                    FROM platform_stats ORDER BY created_at, id
+                ''')
+                rows = cursor.fetchall()
+            self._append(rows)
+            self.version = version
+            self.metrics = None
+    
+    def _append(self, rows):
+        grouped = {}
+        for row_id, platform, created_at, followers, engagement, views in rows:
+            grouped.setdefault(platform, []).append(
+                (created_at or 0, followers or 0, engagement or 0.0, views or 0))
+            self.last_id = max(self.last_id, row_id)
+        for platform, platform_rows in grouped.items():
+            self.history.setdefault(platform, ColumnarHistory()).append(platform_rows)
+    
+    def platform_metrics(self, cursor=None):
+        """Скользящие средние, темпы роста, перцентили и z-score вовлечённости по платформам"""
+        self.refresh(cursor)
+        with self.lock:
+            # Пересчёт только после появления новых строк; повторные вызовы отдают готовый результат
+            if self.metrics is None:
+                self.metrics = {platform: self._series_metrics(series)
+                                for platform, series in self.history.items() if series.size}
+            return self.metrics
+    
+    def _series_metrics(self, series):
+        followers = series['followers']
+        engagement = series['engagement']
+        views = series['views']
+        window = min(self.window, len(engagement))
+        
+        # Скользящее среднее через кумулятивную сумму: один проход на весь ряд
+        cumsum = np.concatenate(([0.0], np.cumsum(engagement)))
+        rolling = (cumsum[window:] - cumsum[:-window]) / window
+        
+        base = followers[-window]
+        growth_rate = (followers[-1] - base) / base * 100 if base else 0.0
+        std = engagement.std()
+        zscore = (engagement[-1] - engagement.mean()) / std if std else 0.0
+        p25, p50, p90 = np.percentile(engagement, [25, 50, 90])
+        
+        return {
+            'samples': int(series.size),
+            'followers': int(followers[-1]),
+            'engagement': round(float(engagement[-1]), 2),
+            'views': int(views[-1]),
+            'engagement_rolling_mean': round(float(rolling[-1]), 2),
+            'followers_growth_rate': round(float(growth_rate), 2),
+            'engagement_percentiles': {'p25': round(float(p25), 2), 'p50': round(float(p50), 2),
+                                       'p90': round(float(p90), 2)},
+            'engagement_zscore': round(float(zscore), 2)
+        }
     
     def analyze_platform_stats(self, stats):
         try:
-            total_followers = sum(s.get('followers', 0) for s in stats.values())
-            avg_engagement = sum(s.get('engagement', 0) for s in stats.values()) / len(stats)
+            platforms = list(stats)
+            if not platforms:
+                return {'error': 'Нет данных по платформам'}
+            followers = np.array([stats[p].get('followers', 0) for p in platforms], dtype=np.float64)
+            engagement = np.array([stats[p].get('engagement', 0) for p in platforms], dtype=np.float64)
             
             return {
-                'total_followers': total_followers,
-                'avg_engagement': round(avg_engagement, 2),
-                'top_platform': max(stats.items(), key=lambda x: x[1].get('followers', 0))[0],
+                'total_followers': int(followers.sum()),
+                'avg_engagement': round(float(engagement.mean()), 2),
+                'top_platform': platforms[int(followers.argmax())],
                 'timestamp': datetime.now().isoformat()
             }
         except Exception as e:
             return {'error': str(e)}
 
+class GrowthForecaster:
+    """Прогноз роста подписчиков методом Хольта (двойное экспоненциальное сглаживание).
+    Ряды берутся из колонок AnalyticsEngine и сводятся к дневным точкам; дни окна
+    старше горячей таблицы берутся из stats_rollup_daily (среднее за день); параметры
+    сглаживания подбираются перебором по сетке, все платформы и все узлы сетки
+    считаются одним векторным проходом. Модель платформы переобучается только
+    при появлении у неё новых строк"""
+    
+    DISPLAY_NAMES = {'instagram': 'Instagram', 'tiktok': 'TikTok', 'youtube': 'YouTube', 'telegram': 'Telegram'}
+    
+    def __init__(self, analytics_engine, horizon_days=30, lookback_days=90):
+        self.analytics_engine = analytics_engine
+        self.horizon_days = horizon_days
+        self.lookback_days = lookback_days
+        alphas, betas = np.meshgrid(np.linspace(0.1, 0.9, 9), np.linspace(0.05, 0.5, 10))
+        self.alphas = alphas.ravel()
+        self.betas = betas.ravel()
+        self.models = {}
+        self.version = None
+        self.summary = {}
+        self.lock = threading.Lock()
+    
+    def rollup_days(self, cursor):
+        """Дневные средние подписчиков из роллапов за окно: {платформа: (дни, значения)}.
+        Роллапы пополняются при вставке и переживают перенос сырых строк в партиции"""
+        since = (int(time.time()) // 86400 - self.lookback_days) * 86400
+        cursor.execute('''
+            SELECT platform, bucket / 86400, sum_followers * 1.0 / samples
+            FROM stats_rollup_daily WHERE bucket >= ? ORDER BY platform, bucket
+        ''', (since,))
+        grouped = {}
+        for platform, day, value in cursor.fetchall():
+            days, values = grouped.setdefault(platform, ([], []))
+            days.append(day)
+            values.append(value)
+        return {platform: (np.array(days, dtype=np.int64), np.array(values, dtype=np.float64))
+                for platform, (days, values) in grouped.items()}
+    
+    def daily_series(self, series, rollup=None):
+        """Последнее значение подписчиков за каждый день окна, пропуски интерполируются;
+        дни раньше первой сырой строки дополняются из роллапа"""
+        days = (series['created_at'] // 86400).astype(np.int64)
+        followers = series['followers']
+        unique_days, reversed_index = np.unique(days[::-1], return_index=True)
+        values = followers[len(days) - 1 - reversed_index]
+        if rollup is not None:
+            older = rollup[0] < unique_days[0]
+            unique_days = np.concatenate((rollup[0][older], unique_days))
+            values = np.concatenate((rollup[1][older], values))
+        keep = unique_days >= unique_days[-1] - self.lookback_days
+        unique_days, values = unique_days[keep], values[keep]
+        full_range = np.arange(unique_days[0], unique_days[-1] + 1)
+        return np.interp(full_range, unique_days, values)
+    
+    def fit(self, series_list):
+        """Подбор (alpha, beta) для набора рядов разом: матрица платформы x узлы сетки"""
+        length = max(len(values) for values in series_list)
+        matrix = np.full((len(series_list), length), np.nan)
+        starts = np.empty(len(series_list), dtype=np.int64)
+        for row, values in enumerate(series_list):
+            starts[row] = length - len(values)
+            matrix[row, starts[row]:] = values
+        
+        rows = np.arange(len(series_list))
+        first = matrix[rows, starts]
+        second = matrix[rows, np.minimum(starts + 1, length - 1)]
+        level = np.repeat(first[:, None], len(self.alphas), axis=1)
+        trend = np.repeat((second - first)[:, None], len(self.alphas), axis=1)
+        sse = np.zeros_like(level)
+        
+        for t in range(1, length):
+            active = (t > starts)[:, None]
+            observed = matrix[:, t][:, None]
+            predicted = level + trend
+            new_level = self.alphas * observed + (1 - self.alphas) * predicted
+            new_trend = self.betas * (new_level - level) + (1 - self.betas) * trend
+            sse = np.where(active, sse + (observed - predicted) ** 2, sse)
+            level = np.where(active, new_level, level)
+            trend = np.where(active, new_trend, trend)
+        
+        best = sse.argmin(axis=1)
+        return [{
+            'level': float(level[row, best[row]]),
+            'trend': float(trend[row, best[row]]),
+            'alpha': round(float(self.alphas[best[row]]), 2),
+            'beta': round(float(self.betas[best[row]]), 2),
+            'days': int(len(series_list[row]))
+        } for row in rows]
+    
+    def refresh(self, cursor=None):
+        cursor = cursor or get_db().cursor()
+        engine = self.analytics_engine
+        engine.refresh(cursor)
+        with self.lock:
+            if engine.version == self.version:
+                return
+            rollups = self.rollup_days(cursor)
+            with engine.lock:
+                stale = {}
+                for platform, series in engine.history.items():
+                    if not series.size:
+                        continue
+                    key = (series.size, float(series['created_at'][-1]), float(series['followers'][-1]))
+                    model = self.models.get(platform)
+                    if model is None or model['key'] != key:
+                        stale[platform] = (key, self.daily_series(series, rollups.get(platform)))
+                version = engine.version
+                for platform in set(self.models) - set(engine.history):
+                    del self.models[platform]
+            if stale:
+                fitted = self.fit([values for _, values in stale.values()])
+                for (platform, (key, _)), model in zip(stale.items(), fitted):
+                    model['key'] = key
+                    model['fitted_at'] = datetime.now().isoformat()
+                    self.models[platform] = model
+            self.summary = self._summary(self.horizon_days)
+            self.version = version
+    
+    def _summary(self, horizon_days):
+        summary = {}
+        for platform, model in self.models.items():
+            expected = model['trend'] * horizon_days
+            summary[self.DISPLAY_NAMES.get(platform, platform)] = {
+                'expectedGrowth': int(round(expected)),
+                'percentage': round(expected / model['level'] * 100, 1) if model['level'] else 0.0
+            }
+        return summary
+    
+    def forecast(self, cursor=None):
+        """Сводка для дашборда: ожидаемый прирост за горизонт по каждой платформе"""
+        self.refresh(cursor)
+        return self.summary
+    
+    def forecast_all(self, horizon_days=None, cursor=None):
+        """Пакетный режим: параметры и дневная траектория прогноза для всех аккаунтов"""
+        self.refresh(cursor)
+        horizon_days = horizon_days or self.horizon_days
+        steps = np.arange(1, horizon_days + 1)
+        with self.lock:
+            return {platform: {
+                'level': round(model['level'], 2),
+                'trend_per_day': round(model['trend'], 4),
+                'alpha': model['alpha'],
+                'beta': model['beta'],
+                'history_days': model['days'],
+                'fitted_at': model['fitted_at'],
+                'forecast': np.round(model['level'] + model['trend'] * steps).astype(np.int64).tolist()
+            } for platform, model in self.models.items()}
+
+def dm_message_hash(message_text):
+    """Хэш текста DM для ключа дедупликации (sender_id, message_hash)"""
+    normalized = ' '.join(message_text.split()).casefold()
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=12).hexdigest()
+
+class SeenDMFilter:
+    """Фильтр Блума над ключами (sender_id, message_hash).
+    Положительный ответ перепроверяется по уникальному индексу instagram_dms.
+    Отрицательный - лишь подсказка: в фильтре только последние записи
+    (rebuild берёт capacity строк, пересборка при переполнении - capacity // 2)
+    и ответы этого процесса, чужие воркеры пишут мимо него. Пропущенный дубль
+    ловит ON CONFLICT при вставке, а вызывающий возвращает потраченный лимит"""
+    
+    def __init__(self, capacity=500000, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.lock = threading.Lock()
+    
+    def _positions(self, sender_id, message_hash):
+        digest = hashlib.blake2b(f'{sender_id}\x1f{message_hash}'.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def _add(self, sender_id, message_hash):
+        for pos in self._positions(sender_id, message_hash):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+    
+    def add(self, sender_id, message_hash):
+        with self.lock:
+            if self.count >= self.capacity:
+                self.bits = bytearray(len(self.bits))
+                self.count = 0
+                self._load(get_db().cursor(), self.capacity // 2)
+            self._add(sender_id, message_hash)
+    
+    def might_contain(self, sender_id, message_hash):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(sender_id, message_hash))
+    
+    def rebuild(self, cursor):
+        with self.lock:
+            self.bits = bytearray(len(self.bits))
+            self.count = 0
+            self._load(cursor, self.capacity)
+    
+    def _load(self, cursor, limit):
+        cursor.execute('''
+            SELECT sender_id, message_hash FROM instagram_dms
+            WHERE message_hash IS NOT NULL
+            ORDER BY id DESC LIMIT ?
+        ''', (limit,))
+        for sender_id, message_hash in cursor:
+            self._add(sender_id, message_hash)
+
 class InstagramDMAutomation:
     def __init__(self, safety_controller):
         self.safety_controller = safety_controller
         self.auto_reply_message = "Привет! Добро пожаловать в Lucifer Trading 🔥 VIP-сигналы тут: t.me/Lucifer_tradera"
-        self.processed_dms = set()
+        self.processed_dms = SeenDMFilter()
+        self.processed_dms.rebuild(get_db().cursor())
         self.enabled = False
-        
+    
+    def is_processed(self, sender_id, message_hash, cursor=None):
+        if not self.processed_dms.might_contain(sender_id, message_hash):
+            return False
+        cursor = cursor or get_db().cursor()
+        cursor.execute('''
+            SELECT 1 FROM instagram_dms WHERE sender_id = ? AND message_hash = ?
+        ''', (sender_id, message_hash))
+        return cursor.fetchone() is not None
+    
+    def _insert_replies(self, cursor, rows):
+        """Вставка ответов с ON CONFLICT DO NOTHING; возвращает реально записанные строки"""
+        now = datetime.now().isoformat()
+        now_epoch = int(time.time())
+        written = []
+        for sender_id, message_text, message_hash in rows:
+            cursor.execute('''
+                INSERT INTO instagram_dms (sender_id, message_text, message_hash, replied, reply_text, timestamp, created_at)
+                VALUES (?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT (sender_id, message_hash) DO NOTHING
+            ''', (sender_id, message_text, message_hash, self.auto_reply_message, now, now_epoch))
+            if cursor.rowcount:
+                written.append((sender_id, message_hash))
+        return written
+    
     def process_new_dm(self, sender_id, message_text):
         try:
-            # Проверка безопасности перед отправкой
-            safety_check = self.safety_controller.check_action_safety('instagram', 'dms')
+            message_hash = dm_message_hash(message_text)
+            conn = get_db()
+            cursor = conn.cursor()
+            if self.is_processed(sender_id, message_hash, cursor):
+                return {'status': 'duplicate', 'sender_id': sender_id}
+            
+            # Проверка безопасности и резерв лимита перед отправкой
+            reserved_at = time.time()
+            safety_check = self.safety_controller.acquire_action('instagram', 'dms')
             if not safety_check['safe']:
                 return {'status': 'delayed', 'reason': safety_check['reason']}
             
-            # Логирование в БД
-            conn = sqlite3.connect('lucifer_analytics.db')
+            # Логирование в БД; уникальный индекс защищает от гонки двух воркеров
+            try:
+                written = self._insert_replies(cursor, [(sender_id, message_text, message_hash)])
+                conn.commit()
+            except Exception:
+                # Ответ не записан - резерв не должен висеть до конца суток
+                conn.rollback()
+                self.safety_controller.release_actions('instagram', 'dms', 1, reserved_at)
+                raise
+            for key in written:
+                self.processed_dms.add(*key)
+            if not written:
+                # Дубль, которого не было в фильтре: ответ не отправлен, лимит возвращаем
+                self.safety_controller.release_actions('instagram', 'dms', 1, reserved_at)
+                return {'status': 'duplicate', 'sender_id': sender_id}
+            
+            return {
+                'status': 'success',
+                'reply_sent': self.auto_reply_message,
+                'sender_id': sender_id
+            }
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}
+    
+    def process_dm_batch(self, dms):
+        """Пакетная обработка DM: один резерв лимита, одна транзакция на все ответы,
+        не поместившиеся в лимит сообщения уходят в отложенную очередь"""
+        try:
+            conn = get_db()
+            cursor = conn.cursor()
+            fresh, batch_keys, duplicates = [], set(), 0
+            for dm in dms:
+                sender_id, message_text = str(dm.get('sender_id', '')), str(dm.get('message_text', ''))
+                if not sender_id or not message_text:
+                    continue
+                message_hash = dm_message_hash(message_text)
+                key = (sender_id, message_hash)
+                if key in batch_keys or self.is_processed(sender_id, message_hash, cursor):
+                    duplicates += 1
+                    continue
+                batch_keys.add(key)
+                fresh.append((sender_id, message_text, message_hash))
+            
+            reserved_at = time.time()
+            granted = self.safety_controller.reserve_actions('instagram', 'dms', len(fresh))
+            accepted, overflow = fresh[:granted], fresh[granted:]
+            
+            now_epoch = int(time.time())
+            try:
+                written = self._insert_replies(cursor, accepted)
+                cursor.executemany('''
+                    INSERT INTO instagram_dm_deferred (sender_id, message_text, created_at)
+                    VALUES (?, ?, ?)
+                ''', [(sender_id, message_text, now_epoch) for sender_id, message_text, _ in overflow])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self.safety_controller.release_actions('instagram', 'dms', granted, reserved_at)
+                raise
+            for key in written:
+                self.processed_dms.add(*key)
+            self.safety_controller.release_actions('instagram', 'dms', len(accepted) - len(written), reserved_at)
+            
+            return {
+                'status': 'success' if not overflow else 'partial',
+                'processed': len(written),
+                'deferred': len(overflow),
+                'duplicates': duplicates + len(accepted) - len(written),
+                'reply_sent': self.auto_reply_message
+            }
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}
+    
+    def process_deferred_dms(self, limit=500):
+        """Повторная попытка для отложенных DM в порядке поступления"""
+        try:
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO instagram_dms (sender_id, message_text, replied, reply_text, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (sender_id, message_text, 1, self.auto_reply_message, datetime.now().isoformat()))
-            conn.commit()
-            conn.close()
+                SELECT id, sender_id, message_text FROM instagram_dm_deferred
+                ORDER BY id LIMIT ?
+            ''', (limit,))
+            rows = cursor.fetchall()
+            if not rows:
+                return {'status': 'success', 'processed': 0, 'deferred': 0, 'duplicates': 0}
             
-            # Отметка действия для контроля лимитов
-            self.safety_controller.log_action('instagram', 'dms', f'Reply to {sender_id}')
+            # Пока сообщение ждало, на него мог ответить другой путь: такие не тратят лимит
+            fresh, batch_keys, duplicate_ids = [], set(), []
+            for deferred_id, sender_id, message_text in rows:
+                message_hash = dm_message_hash(message_text)
+                key = (sender_id, message_hash)
+                if key in batch_keys or self.is_processed(sender_id, message_hash, cursor):
+                    duplicate_ids.append(deferred_id)
+                    continue
+                batch_keys.add(key)
+                fresh.append((deferred_id, sender_id, message_text, message_hash))
             
+            reserved_at = time.time()
+            granted = self.safety_controller.reserve_actions('instagram', 'dms', len(fresh)) if fresh else 0
+            accepted = fresh[:granted]
+            
+            try:
+                written = self._insert_replies(cursor, [row[1:] for row in accepted])
+                cursor.executemany('DELETE FROM instagram_dm_deferred WHERE id = ?',
+                                   [(row[0],) for row in accepted] + [(deferred_id,) for deferred_id in duplicate_ids])
+                cursor.execute('''
+                    UPDATE instagram_dm_deferred SET attempts = attempts + 1
+                    WHERE id IN (SELECT id FROM instagram_dm_deferred ORDER BY id LIMIT ?)
+                ''', (len(fresh) - len(accepted),))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self.safety_controller.release_actions('instagram', 'dms', granted, reserved_at)
+                raise
+            for key in written:
+                self.processed_dms.add(*key)
+            self.safety_controller.release_actions('instagram', 'dms', len(accepted) - len(written), reserved_at)
             return {
                 'status': 'success',
-                'reply_sent': self.auto_reply_message,
-                'sender_id': sender_id
+                'processed': len(written),
+                'deferred': len(fresh) - len(accepted),
+                'duplicates': len(duplicate_ids) + len(accepted) - len(written)
             }
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
     def get_dm_stats(self):
         try:
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('SELECT COUNT(*) FROM instagram_dms WHERE replied = 1')
             total_replies = cursor.fetchone()[0]
             cursor.execute('SELECT COUNT(DISTINCT sender_id) FROM instagram_dms')
             unique_senders = cursor.fetchone()[0]
-            conn.close()
             
             return {
                 'total_replies': total_replies,
@@ -1091,10 +2070,157 @@ class InstagramDMAutomation:
         except Exception as e:
             return {'error': str(e)}
 
+class NearDuplicateIndex:
+    """MinHash-индекс недавних текстов content_plan с LSH-корзинами по платформам.
+    Подпись - минимумы 64 хэш-функций по словесным биграммам; текст попадает в
+    16 корзин (полосы по 4 значения), кандидаты ищутся только в своих корзинах,
+    а сходство по Жаккару оценивается долей совпавших позиций подписи"""
+    
+    NUM_PERM = 64
+    BANDS = 16
+    TOKEN_RE = re.compile(r'\w+')
+    
+    def __init__(self, threshold=0.8, window_days=30, max_per_platform=5000, seed=20240917):
+        self.threshold = threshold
+        self.window = window_days * 86400
+        self.max_per_platform = max_per_platform
+        rng = np.random.default_rng(seed)
+        self.perm_mul = rng.integers(1, 2 ** 63, self.NUM_PERM, dtype=np.uint64) | np.uint64(1)
+        self.perm_add = rng.integers(0, 2 ** 63, self.NUM_PERM, dtype=np.uint64)
+        self.rows = self.NUM_PERM // self.BANDS
+        self.docs = {}
+        self.buckets = {}
+        self.recent = collections.defaultdict(collections.deque)
+        self.last_id = 0
+        self.lock = threading.Lock()
+    
+    def signature(self, text):
+        tokens = self.TOKEN_RE.findall(text.casefold())
+        shingles = [' '.join(pair) for pair in zip(tokens, tokens[1:])] or tokens or [text]
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+             for shingle in set(shingles)),
+            dtype=np.uint64)
+        # Переполнение uint64 здесь ожидаемо: арифметика по модулю 2^64
+        return (hashes[:, None] * self.perm_mul + self.perm_add).min(axis=0)
+    
+    def _band_keys(self, platform, signature):
+        return [(platform, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.BANDS)]
+    
+    def sync(self, cursor=None):
+        """Дочитываем тексты, записанные другими воркерами, по id > last_id"""
+        cursor = cursor or get_db().cursor()
+        cursor.execute('''
+            SELECT id, platform, content_text, created_at FROM content_plan
+            WHERE id > ? AND created_at >= ? ORDER BY id
+        ''', (self.last_id, int(time.time()) - self.window))
+        rows = cursor.fetchall()
+        with self.lock:
+            for row_id, platform, content_text, created_at in rows:
+                self._add(row_id, platform, content_text, created_at)
+            # last_id двигает только sync: add() получает свои id вне очереди,
+            # и более ранние строки других воркеров ещё не прочитаны
+            if rows:
+                self.last_id = max(self.last_id, rows[-1][0])
+    
+    def _add(self, row_id, platform, text, created_at):
+        if row_id in self.docs:
+            return
+        signature = self.signature(text)
+        self.docs[row_id] = (platform, signature)
+        for key in self._band_keys(platform, signature):
+            self.buckets.setdefault(key, set()).add(row_id)
+        recent = self.recent[platform]
+        recent.append((created_at, row_id))
+        cutoff = int(time.time()) - self.window
+        while recent and (len(recent) > self.max_per_platform or recent[0][0] < cutoff):
+            self._remove(recent.popleft()[1])
+    
+    def _remove(self, row_id):
+        platform, signature = self.docs.pop(row_id)
+        for key in self._band_keys(platform, signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(row_id)
+                if not bucket:
+                    del self.buckets[key]
+    
+    def add(self, row_id, platform, text, created_at=None):
+        with self.lock:
+            self._add(row_id, platform, text, created_at or int(time.time()))
+    
+    def find_duplicate(self, platform, text, cursor=None):
+        """(id похожей записи, оценка сходства) или (None, лучшая оценка)"""
+        self.sync(cursor)
+        signature = self.signature(text)
+        with self.lock:
+            candidates = set()
+            for key in self._band_keys(platform, signature):
+                candidates.update(self.buckets.get(key, ()))
+            if not candidates:
+                return None, 0.0
+            candidates = list(candidates)
+            # Все кандидаты сравниваются одной векторной операцией
+            matches = np.count_nonzero(np.stack([self.docs[row_id][1] for row_id in candidates]) == signature, axis=1)
+            best_index = int(matches.argmax())
+            best_id, best = candidates[best_index], float(matches[best_index]) / self.NUM_PERM
+        if best >= self.threshold:
+            return best_id, round(best, 2)
+        return None, round(best, 2)
+
+def compile_content_template(template, sources, constants):
+    """Шаблон -> (литералы, сэмплеры): константы подставляются при компиляции,
+    при рендере остаётся только склейка строк и выбор значений для реально
+    используемых полей"""
+    literals, samplers = [''], []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        literals[-1] += literal
+        if field is None:
+            continue
+        if field in constants:
+            literals[-1] += constants[field]
+        else:
+            samplers.append(sources[field])
+            literals.append('')
+    return tuple(literals), tuple(samplers)
+
+def render_content_template(compiled, rng):
+    literals, samplers = compiled
+    parts = [literals[0]]
+    for sampler, literal in zip(samplers, literals[1:]):
+        parts.append(sampler(rng))
+        parts.append(literal)
+    return ''.join(parts)
+
 class ContentGenerator:
-    def __init__(self, safety_controller):
+    CONTENT_TYPES = ('trading_signal', 'market_analysis', 'motivation')
+    
+    # Пулы значений - кортежи, собираются один раз, а не на каждый вызов
+    ASSETS = ('EUR/USD', 'BTC/USDT', 'GOLD', 'ETH/USDT', 'GBP/USD')
+    MARKETS = ('Форекс', 'Крипта', 'Металлы')
+    TRENDS = ('бычий тренд', 'коррекцию', 'консолидацию')
+    SENTIMENTS = ('Позитивное', 'Нейтральное', 'Осторожное')
+    DIRECTIONS = ('ЛОНГ', 'ШОРТ')
+    QUOTES = (
+        "Дисциплина побеждает талант",
+        "Риск-менеджмент - ключ к успеху",
+        "Тренд - твой друг",
+        "Терпение приносит прибыль"
+    )
+    RULES = (
+        "Никогда не рискуй больше 2% на сделку",
+        "Следуй своей стратегии",
+        "Эмоции - враг трейдера"
+    )
+    
+    def __init__(self, safety_controller, seed=None, dedup_index=None, max_attempts=5):
         self.safety_controller = safety_controller
+        self.dedup_index = dedup_index
+        self.max_attempts = max_attempts
         self.hashtags = "#trading #форекс #криптовалюта #lucifer_trading"
+        # Свой генератор на экземпляр: с seed выборка воспроизводима (A/B-наборы кандидатов)
+        self.rng = random.Random(seed)
         self.content_templates = {
             'trading_signal': [
                 "📈 СИГНАЛ: {asset}\n💰 Вход: {entry}\n🎯 Цель: {target}\n⛔ Стоп: {stop}\n\n{hashtags}",
@@ -1112,86 +2238,185 @@ class ContentGenerator:
                 "🔥 ПРАВИЛО УСПЕХА\n{rule}\n\nСледуй за нами для больших профитов!\n\n{hashtags}"
             ]
         }
+        self.compile_templates()
+    
+    def compile_templates(self):
+        constants = {
+            'hashtags': self.hashtags,
+            'analysis': "Пробой ключевого уровня",
+            'levels': "1.1050, 1.1100, 1.1150",
+            'assets': "EUR/USD, GOLD, BTC",
+            'insight': "Доллар слабеет на фоне данных ФРС",
+            'strategy': "Ищем лонги в евро",
+            'success_tip': "Анализируй свои ошибки"
+        }
+        pick = self.pick
+        sources = {
+            'asset': pick(self.ASSETS),
+            'entry': self.uniform(1.0, 2.0),
+            'target': self.uniform(1.1, 2.1),
+            'stop': self.uniform(0.9, 1.0),
+            'direction': pick(self.DIRECTIONS),
+            'potential': pick(tuple(str(value) for value in range(5, 31))),
+            'market': pick(self.MARKETS),
+            'trend': pick(self.TRENDS),
+            'sentiment': pick(self.SENTIMENTS),
+            'quote': pick(self.QUOTES),
+            'rule': pick(self.RULES)
+        }
+        self.renderers = {
+            content_type: tuple(compile_content_template(template, sources, constants) for template in templates)
+            for content_type, templates in self.content_templates.items()
+        }
+    
+    @staticmethod
+    def pick(pool):
+        # rng.random() и индекс заметно дешевле rng.choice на горячем пути
+        size = len(pool)
+        return lambda rng: pool[int(rng.random() * size)]
+    
+    @staticmethod
+    def uniform(low, high):
+        span = high - low
+        return lambda rng: f"{low + span * rng.random():.4f}"
+    
+    def _resolve_type(self, content_type):
+        if content_type == 'random':
+            return self.rng.choice(self.CONTENT_TYPES)
+        return content_type if content_type in self.renderers else 'motivation'
         
     def generate_trading_content(self, content_type='random'):
         try:
-            if content_type == 'random':
-                content_type = random.choice(['trading_signal', 'market_analysis', 'motivation'])
-            
-            templates = self.content_templates.get(content_type, self.content_templates['motivation'])
-            template = random.choice(templates)
-            
-            # Генерация контента на основе типа
-            if content_type == 'trading_signal':
-                assets = ['EUR/USD', 'BTC/USDT', 'GOLD', 'ETH/USDT', 'GBP/USD']
-                content = template.format(
-                    asset=random.choice(assets),
-                    entry=f"{random.uniform(1.0, 2.0):.4f}",
-                    target=f"{random.uniform(1.1, 2.1):.4f}",
-                    stop=f"{random.uniform(0.9, 1.0):.4f}",
-                    analysis="Пробой ключевого уровня",
-                    direction=random.choice(["ЛОНГ", "ШОРТ"]),
-                    potential=random.randint(5, 30),
-                    hashtags=self.hashtags
-                )
-            elif content_type == 'market_analysis':
-                content = template.format(
-                    market=random.choice(['Форекс', 'Крипта', 'Металлы']),
-                    trend=random.choice(['бычий тренд', 'коррекцию', 'консолидацию']),
-                    levels="1.1050, 1.1100, 1.1150",
-                    assets="EUR/USD, GOLD, BTC",
-                    sentiment=random.choice(['Позитивное', 'Нейтральное', 'Осторожное']),
-                    insight="Доллар слабеет на фоне данных ФРС",
-                    strategy="Ищем лонги в евро",
-                    hashtags=self.hashtags
-                )
-            else:  # motivation
-                quotes = [
-                    "Дисциплина побеждает талант",
-                    "Риск-менеджмент - ключ к успеху",
-                    "Тренд - твой друг",
-                    "Терпение приносит прибыль"
-                ]
-                rules = [
-                    "Никогда не рискуй больше 2% на сделку",
-                    "Следуй своей стратегии",
-                    "Эмоции - враг трейдера"
-                ]
-                content = template.format(
-                    quote=random.choice(quotes),
-                    success_tip="Анализируй свои ошибки",
-                    rule=random.choice(rules),
-                    hashtags=self.hashtags
-                )
+            content_type = self._resolve_type(content_type)
+            compiled = self.rng.choice(self.renderers[content_type])
             
             return {
-                'content': content,
+                'content': render_content_template(compiled, self.rng),
                 'type': content_type,
                 'timestamp': datetime.now().isoformat()
             }
         except Exception as e:
             return {'error': str(e)}
     
+    def generate_many(self, n, content_type='random'):
+        """Пакетная генерация n постов за вызов (наборы кандидатов для A/B-тестов)"""
+        rng = self.rng
+        choice = rng.choice
+        timestamp = datetime.now().isoformat()
+        posts = []
+        for _ in range(n):
+            resolved = self._resolve_type(content_type)
+            content = render_content_template(choice(self.renderers[resolved]), rng)
+            posts.append({'content': content, 'type': resolved, 'timestamp': timestamp})
+        return posts
+    
+    def generate_unique_content(self, platform, content_type='random', cursor=None):
+        """Генерация с перегенерацией почти-дубликатов недавних постов платформы.
+        None, если за max_attempts попыток уникальный текст не получился"""
+        for _ in range(self.max_attempts):
+            content = self.generate_trading_content(content_type)
+            if content.get('error'):
+                return content
+            if self.dedup_index is None:
+                return content
+            duplicate_id, _ = self.dedup_index.find_duplicate(platform, content['content'], cursor)
+            if duplicate_id is None:
+                return content
+        return None
+    
     def schedule_content(self, platforms=['instagram', 'telegram']):
         try:
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             times = ['09:00', '14:00', '19:00']
+            scheduled, rejected = 0, 0
             for platform in platforms:
                 for time_slot in times:
-                    content = self.generate_trading_content()
-                    cursor.execute('''
-                        INSERT INTO content_plan (platform, content_text, schedule_time, status)
-                        VALUES (?, ?, ?, 'scheduled')
-                    ''', (platform, content['content'], time_slot))
+                    content = self.generate_unique_content(platform, cursor=cursor)
+                    if content is None:
+                        rejected += 1
+                        continue
+                    now_epoch = int(time.time())
+                    # Слот - отдельная короткая транзакция: индекс видит только закоммиченные
+                    # посты, а следующий слот этой же платформы уже сверяется с этим
+                    try:
+                        cursor.execute('''
+                            INSERT INTO content_plan (platform, content_text, schedule_time, status, created_at)
+                            VALUES (?, ?, ?, 'scheduled', ?)
+                        ''', (platform, content['content'], time_slot, now_epoch))
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    if self.dedup_index is not None:
+                        self.dedup_index.add(cursor.lastrowid, platform, content['content'], now_epoch)
+                    scheduled += 1
             
-            conn.commit()
-            conn.close()
-            return {'status': 'success', 'scheduled': len(platforms) * len(times)}
+            return {'status': 'success', 'scheduled': scheduled, 'rejected_duplicates': rejected}
         except Exception as e:
             return {'error': str(e)}
 
+class KeywordAutomaton:
+    """Автомат Ахо-Корасик: все ключевые слова ищутся за один проход по сообщению"""
+
+    def __init__(self, patterns):
+        # patterns: {ключевое слово: (приоритет, ..., ключ шаблона)}, меньший кортеж важнее
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [None]
+        for word, match in patterns.items():
+            word = normalize_keyword_text(word)
+            if not word:
+                continue
+            node = 0
+            for char in word:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(None)
+                node = next_node
+            if self.best[node] is None or match < self.best[node]:
+                self.best[node] = match
+        # Лучшее возможное совпадение: найдя его, дальше текст можно не читать
+        self.floor = min(patterns.values(), default=None)
+
+        # BFS: ссылки неудач и лучшее совпадение по всей цепочке суффиксов узла
+        pending = collections.deque(self.goto[0].values())
+        while pending:
+            node = pending.popleft()
+            inherited = self.best[self.fail[node]]
+            if inherited is not None and (self.best[node] is None or inherited < self.best[node]):
+                self.best[node] = inherited
+            for char, child in self.goto[node].items():
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                pending.append(child)
+
+    def match(self, text):
+        goto, fail, best = self.goto, self.fail, self.best
+        node = 0
+        found = None
+        for char in normalize_keyword_text(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            candidate = best[node]
+            if candidate is not None and (found is None or candidate < found):
+                found = candidate
+                if found == self.floor:
+                    break
+        return found[-1] if found else None
+
+def normalize_keyword_text(text):
+    return text.lower().replace('ё', 'е')
+
 class SmartAutoReply:
     def __init__(self):
         self.templates = {
@@ -1201,52 +2426,270 @@ class SmartAutoReply:
             'цена': "💰 Наши тарифы:\n• Базовый: $49/мес\n• VIP: $99/мес\n• Premium: $199/мес\n\nВсе детали: t.me/Lucifer_tradera",
             'default': "Спасибо за интерес к Lucifer Trading! 🔥\nПрисоединяйся к нашему каналу для получения бесплатных сигналов: t.me/Lucifer_tradera"
         }
-        
-    def get_smart_reply(self, message_text):
-        message_lower = message_text.lower()
-        
-        for keyword, reply in self.templates.items():
-            if keyword != 'default' and keyword in message_lower:
-                return reply
-        
-        return self.templates['default']
+        # Синонимы и словоформы; основы слов ловят падежные окончания
+        self.keywords = {
+            'обучение': ['обучени', 'обучит', 'обучаю', 'научит', 'научиться', 'курс', 'урок', 'ментор'],
+            'сигналы': ['сигнал', 'сетап', 'точки входа', 'прогноз'],
+            'vip': ['vip', 'вип', 'випк', 'premium', 'премиум', 'приватн'],
+            'цена': ['цена', 'цены', 'цену', 'ценой', 'ценник', 'стоимост', 'сколько стоит', 'прайс', 'тариф', 'оплат']
+        }
+        self.priorities = {}
+        # Встроенная конфигурация; правки через reload() хранятся в smart_reply_overrides
+        # и накладываются поверх неё в каждом воркере при смене версии таблицы
+        self.base = (self.templates, self.keywords, self.priorities)
+        self.automaton = self.build_automaton(self.templates, self.keywords, self.priorities)
+        self.active = (self.templates, self.automaton)
+        self.version = None
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def build_automaton(templates, keywords, priorities):
+        patterns = {}
+        for order, key in enumerate(k for k in templates if k != 'default'):
+            # По умолчанию приоритет - порядок шаблонов, как в прежнем линейном поиске
+            priority = priorities.get(key, order)
+            for word in [key] + keywords.get(key, []):
+                # При равном приоритете побеждает шаблон, объявленный раньше
+                match = (priority, order, key)
+                if word not in patterns or match < patterns[word]:
+                    patterns[word] = match
+        return KeywordAutomaton(patterns)
+    
+    @staticmethod
+    def merge(current, templates=None, keywords=None, priorities=None):
+        """Новая конфигурация поверх current с проверкой типов; current не меняется.
+        ValueError - правка отклонена целиком"""
+        sections = {'templates': templates, 'keywords': keywords, 'priorities': priorities}
+        for name, section in sections.items():
+            if section is not None and not isinstance(section, dict):
+                raise ValueError(f'{name}: ожидается объект')
+        merged_templates = {**current[0], **(templates or {})}
+        for key, text in (templates or {}).items():
+            if not isinstance(text, str) or not text:
+                raise ValueError(f'templates.{key}: ожидается непустая строка')
+        for key, words in (keywords or {}).items():
+            if not isinstance(words, list) or not all(isinstance(word, str) and word.strip() for word in words):
+                raise ValueError(f'keywords.{key}: ожидается список непустых строк')
+        for key, priority in (priorities or {}).items():
+            if isinstance(priority, bool) or not isinstance(priority, int):
+                raise ValueError(f'priorities.{key}: ожидается целое число')
+        for key in list(keywords or {}) + list(priorities or {}):
+            if key not in merged_templates or key == 'default':
+                raise ValueError(f'{key}: нет такого шаблона ответа')
+        return merged_templates, {**current[1], **(keywords or {})}, {**current[2], **(priorities or {})}
+    
+    def _apply(self, config, version):
+        templates, keywords, priorities = config
+        automaton = self.build_automaton(templates, keywords, priorities)
+        # Шаблоны и автомат подменяются одним присваиванием: ответ не увидит их вперемешку
+        self.templates, self.keywords, self.priorities, self.automaton = templates, keywords, priorities, automaton
+        self.active = (templates, automaton)
+        self.version = version
+    
+    def refresh(self, cursor=None):
+        """Подхватывает правки, сохранённые любым воркером"""
+        cursor = cursor or get_db().cursor()
+        version = read_table_versions(cursor, ('smart_reply_overrides',)).get('smart_reply_overrides', 0)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            overrides = {'templates': {}, 'keywords': {}, 'priorities': {}}
+            cursor.execute('SELECT section, key, value FROM smart_reply_overrides ORDER BY updated_at, section, key')
+            for section, key, value in cursor.fetchall():
+                overrides[section][key] = json.loads(value)
+            self._apply(self.merge(self.base, **overrides), version)
+    
+    def reload(self, templates=None, keywords=None, priorities=None):
+        """Горячая перезагрузка: конфигурация проверяется и собирается в локальных
+        переменных, в БД и в self попадает только после успешной сборки автомата"""
+        self.refresh()
+        config = self.merge((self.templates, self.keywords, self.priorities), templates, keywords, priorities)
+        self.build_automaton(*config)
+        conn = get_db()
+        now = int(time.time())
+        try:
+            conn.executemany('''
+                INSERT INTO smart_reply_overrides (section, key, value, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (section, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', [(section, key, json.dumps(value, ensure_ascii=False), now)
+                  for section, values in (('templates', templates), ('keywords', keywords), ('priorities', priorities))
+                  for key, value in (values or {}).items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.refresh()
+        
+    def get_smart_reply(self, message_text, cursor=None):
+        self.refresh(cursor)
+        templates, automaton = self.active
+        key = automaton.match(message_text)
+        return templates[key] if key else templates['default']
 
 class ReportGenerator:
-    def __init__(self, analytics_engine):
+    # От каких таблиц зависит каждый тип отчёта: их счётчики table_versions входят в ключ кэша
+    REPORT_TABLES = {
+        'daily': ('platform_stats', 'instagram_dms', 'content_plan'),
+        'weekly': ('platform_stats',),
+        'range': ('platform_stats',)
+    }
+    
+    def __init__(self, analytics_engine, cache_size=64):
         self.analytics_engine = analytics_engine
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+    
+    def cache_key(self, cursor, kind, *parts):
+        """Ключ: тип отчёта, выровненное окно и версии зависимых таблиц.
+        Пока данные не менялись и окно не сдвинулось на следующий час, ключ тот же"""
+        versions = read_table_versions(cursor, self.REPORT_TABLES[kind])
+        window = ':'.join(str(part) for part in parts)
+        return f"{kind}:{window}:" + ','.join(f"{table}={versions.get(table, 0)}"
+                                             for table in self.REPORT_TABLES[kind])
+    
+    # Кэш хранит собственные копии отчётов: вызывающий может менять полученный dict
+    def _cache_get(self, key):
+        with self.cache_lock:
+            report = self.cache.get(key)
+            if report is None:
+                return None
+            self.cache.move_to_end(key)
+        return copy.deepcopy(report)
+    
+    def _cache_put(self, key, report):
+        report = copy.deepcopy(report)
+        with self.cache_lock:
+            self.cache[key] = report
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+    
+    def cached_report(self, kind, build, *parts, persist=False):
+        """Отчёт из LRU, затем из daily_reports (persist=True), и только потом пересчёт.
+        Возвращает (report, cached)"""
+        cursor = get_db().cursor()
+        key = self.cache_key(cursor, kind, *parts)
+        report = self._cache_get(key)
+        if report is not None:
+            return report, True
+        
+        if persist:
+            cursor.execute('''
+                SELECT report_data FROM daily_reports
+                WHERE cache_key = ? ORDER BY id DESC LIMIT 1
+            ''', (key,))
+            row = cursor.fetchone()
+            if row:
+                report = json.loads(row[0])
+                self._cache_put(key, report)
+                return report, True
+        
+        report = build()
+        if report.get('error'):
+            return report, False
+        if persist:
+            conn = get_db()
+            conn.execute('''
+                INSERT INTO daily_reports (report_date, report_data, sent, created_at, report_type, cache_key)
+                VALUES (?, ?, 1, ?, ?, ?)
+            ''', (report['date'], json.dumps(report), int(time.time()), kind, key))
+            conn.commit()
+        self._cache_put(key, report)
+        return report, False
+    
+    def get_daily_report(self):
+        return self.cached_report('daily', self.generate_daily_report, int(time.time()) // 3600, persist=True)
+    
+    def get_weekly_report(self):
+        return self.cached_report('weekly', self.generate_weekly_report, int(time.time()) // 3600, persist=True)
+    
+    def get_range_report(self, since, until):
+        # Окно выравнивается по часу так же, как в aggregate_stats
+        since, until = since // 3600 * 3600, -(-until // 3600) * 3600
+        return self.cached_report('range', lambda: self.generate_range_report(since, until), since, until)
+    
+    def aggregate_stats(self, cursor, since, until=None):
+        """Агрегаты platform_stats за [since, until) из роллапов, без чтения сырых строк.
+        Границы выравниваются по часу; целые сутки внутри диапазона берутся из
+        дневного роллапа, края - из часового"""
+        until = until or int(time.time()) + 1
+        start_hour = since // 3600 * 3600
+        end_hour = -(-until // 3600) * 3600
+        first_day = -(-start_hour // 86400) * 86400
+        last_day = end_hour // 86400 * 86400
+        if last_day <= first_day:
+            first_day = last_day = end_hour
+        
+        cursor.execute('''
+            SELECT platform,
+                   SUM(sum_followers) * 1.0 / SUM(samples) AS avg_followers,
+                   SUM(sum_engagement) / SUM(samples) AS avg_engagement,
+                   SUM(sum_views) AS total_views,
+                   MAX(max_followers) - MIN(min_followers) AS follower_growth
+            FROM (
+                SELECT platform, samples, sum_followers, min_followers, max_followers, sum_engagement, sum_views
+                FROM stats_rollup_daily WHERE bucket >= ? AND bucket < ?
+                UNION ALL
+                SELECT platform, samples, sum_followers, min_followers, max_followers, sum_engagement, sum_views
+                FROM stats_rollup_hourly
+                WHERE (bucket >= ? AND bucket < ?) OR (bucket >= ? AND bucket < ?)
+            )
+            GROUP BY platform
+        ''', (first_day, last_day, start_hour, first_day, last_day, end_hour))
+        
+        return {row[0]: {
+            'followers': int(row[1]) if row[1] else 0,
+            'engagement': round(row[2], 2) if row[2] else 0,
+            'views': int(row[3]) if row[3] else 0,
+            'follower_growth': int(row[4]) if row[4] else 0
+        } for row in cursor.fetchall()}
+    
+    def generate_range_report(self, since, until=None):
+        try:
+            cursor = get_db().cursor()
+            until = until or int(time.time())
+            platforms = self.aggregate_stats(cursor, since, until)
+            analysis = self.analytics_engine.analyze_platform_stats(platforms) if platforms else {}
+            return {
+                'type': 'range',
+                'since': datetime.fromtimestamp(since, timezone.utc).isoformat(),
+                'until': datetime.fromtimestamp(until, timezone.utc).isoformat(),
+                'metrics': {
+                    'total_followers': analysis.get('total_followers', 0),
+                    'avg_engagement': analysis.get('avg_engagement', 0),
+                    'platforms': platforms
+                },
+                'timestamp': datetime.now().isoformat()
+            }
+        except Exception as e:
+            return {'error': str(e)}
         
     def generate_daily_report(self):
         try:
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
+            # Окно выровнено по часу: в пределах часа при тех же данных отчёт не меняется
+            since = (int(time.time()) - 86400) // 3600 * 3600
             
-            # Сбор метрик за день
-            cursor.execute('''
-                SELECT platform, 
-                       AVG(followers) as avg_followers,
-                       AVG(engagement) as avg_engagement,
-                       SUM(views) as total_views
-                FROM platform_stats
-                WHERE datetime(timestamp) >= datetime('now', '-1 day')
-                GROUP BY platform
-            ''')
-            
+            # Сбор метрик за день из часового роллапа (24-25 строк на платформу)
             platform_metrics = {}
-            for row in cursor.fetchall():
-                platform_metrics[row[0]] = {
-                    'followers': int(row[1]) if row[1] else 0,
-                    'engagement': round(row[2], 2) if row[2] else 0,
-                    'views': int(row[3]) if row[3] else 0
+            for platform, metrics in self.aggregate_stats(cursor, since).items():
+                platform_metrics[platform] = {
+                    'followers': metrics['followers'],
+                    'engagement': metrics['engagement'],
+                    'views': metrics['views']
                 }
             
             # Подсчет автоматизаций
-            cursor.execute('SELECT COUNT(*) FROM instagram_dms WHERE datetime(timestamp) >= datetime("now", "-1 day")')
+            cursor.execute('SELECT COUNT(*) FROM instagram_dms WHERE created_at >= ?', (since,))
             dm_count = cursor.fetchone()[0]
             
-            cursor.execute('SELECT COUNT(*) FROM content_plan WHERE status = "posted" AND datetime(schedule_time) >= datetime("now", "-1 day")')
+            cursor.execute("SELECT COUNT(*) FROM content_plan WHERE status = 'posted' AND schedule_epoch >= ?", (since,))
             posts_count = cursor.fetchone()[0]
             
-            conn.close()
             
             # Анализ общих метрик
             analysis = self.analytics_engine.analyze_platform_stats(platform_metrics)
@@ -1272,27 +2715,17 @@ class ReportGenerator:
     
     def generate_weekly_report(self):
         try:
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
             
-            # Метрики за неделю
-            cursor.execute('''
-                SELECT platform,
-                       MAX(followers) - MIN(followers) as follower_growth,
-                       AVG(engagement) as avg_engagement
-                FROM platform_stats
-                WHERE datetime(timestamp) >= datetime('now', '-7 days')
-                GROUP BY platform
-            ''')
-            
+            # Метрики за неделю из роллапов
             weekly_growth = {}
-            for row in cursor.fetchall():
-                weekly_growth[row[0]] = {
-                    'follower_growth': int(row[1]) if row[1] else 0,
-                    'avg_engagement': round(row[2], 2) if row[2] else 0
+            for platform, metrics in self.aggregate_stats(cursor, (int(time.time()) - 7 * 86400) // 3600 * 3600).items():
+                weekly_growth[platform] = {
+                    'follower_growth': metrics['follower_growth'],
+                    'avg_engagement': metrics['engagement']
                 }
             
-            conn.close()
             
             return {
                 'date': datetime.now().strftime('%Y-%m-%d'),
@@ -1304,63 +2737,506 @@ class ReportGenerator:
         except Exception as e:
             return {'error': str(e)}
 
-def crosspost_to_platforms(content, platforms=['instagram', 'telegram', 'tiktok']):
-    try:
-        safety_controller = SafetyController()
-        results = []
-        
+def adapt_content_for_platform(content, platform):
+    # Адаптация контента под платформу
+    if platform == 'instagram':
+        return content[:2200]  # Instagram caption limit
+    if platform == 'tiktok':
+        return content[:150] + "\n\n#fyp #foryou"
+    if platform == 'telegram':
+        return content + "\n\n@antonalekseevich_je"
+    return content
+
+def crosspost_to_platform(content, platform):
+    """Один шаг кросспостинга: резерв лимита и запись в план контента"""
+    adapted_content = adapt_content_for_platform(content, platform)
+    duplicate_id, similarity = content_dedup_index.find_duplicate(platform, adapted_content)
+    if duplicate_id is not None:
+        return {
+            'platform': platform,
+            'status': 'skipped',
+            'reason': f'Почти дубликат недавнего поста #{duplicate_id} (сходство {similarity})'
+        }
+    
+    # Общий контроллер модуля: лимиты видят все действия процесса и других воркеров
+    safety_check = safety_controller.acquire_action(platform, 'posts')
+    if not safety_check['safe']:
+        return {
+            'platform': platform,
+            'status': 'skipped',
+            'reason': safety_check['reason'],
+            'retry_after': safety_check.get('retry_after')
+        }
+    
+    # Сохранение в план контента
+    now_epoch = int(time.time())
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO content_plan (platform, content_text, schedule_time, status, created_at)
+        VALUES (?, ?, ?, 'crossposted', ?)
+    ''', (platform, adapted_content, datetime.now().strftime('%H:%M'), now_epoch))
+    conn.commit()
+    content_dedup_index.add(cursor.lastrowid, platform, adapted_content, now_epoch)
+    
+    return {
+        'platform': platform,
+        'status': 'success',
+        'content_length': len(adapted_content)
+    }
+
+class CrosspostQueue:
+    """Очередь кросспостинга в SQLite: шаги по платформам выполняются пулом потоков
+    из min-heap по времени готовности с умной задержкой на каждую платформу"""
+
+    STALE_RUNNING_SECONDS = 600
+
+    def __init__(self, workers=3):
+        self.workers = workers
+        self.heap = []  # (eligible_at, step_id, platform)
+        self.next_slot = {}  # platform -> самое раннее время следующего поста
+        self.cond = threading.Condition()
+        self.threads = []
+
+    def start(self):
+        self.recover()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.worker_loop, name=f'crosspost-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, content, platforms):
+        now = time.time()
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO crosspost_jobs (content, platforms, status, created_at, updated_at)
+            VALUES (?, ?, 'queued', ?, ?)
+        ''', (content, json.dumps(platforms), int(now), int(now)))
+        job_id = cursor.lastrowid
+        steps = []
         for platform in platforms:
-            # Проверка безопасности для каждой платформы
-            safety_check = safety_controller.check_action_safety(platform, 'posts')
-            
-            if not safety_check['safe']:
-                results.append({
-                    'platform': platform,
-                    'status': 'skipped',
-                    'reason': safety_check['reason']
-                })
-                continue
-            
-            # Адаптация контента под платформу
-            adapted_content = content
-            if platform == 'instagram':
-                adapted_content = content[:2200]  # Instagram caption limit
-            elif platform == 'tiktok':
-                adapted_content = content[:150] + "\n\n#fyp #foryou"
-            elif platform == 'telegram':
-                adapted_content = content + "\n\n@antonalekseevich_je"
-            
-            # Сохранение в план контента
-            conn = sqlite3.connect('lucifer_analytics.db')
-            cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO content_plan (platform, content_text, schedule_time, status)
-                VALUES (?, ?, ?, 'crossposted')
-            ''', (platform, adapted_content, datetime.now().strftime('%H:%M')))
+                INSERT INTO crosspost_steps (job_id, platform, status, eligible_at, attempts, updated_at)
+                VALUES (?, ?, 'pending', ?, 0, ?)
+            ''', (job_id, platform, now, int(now)))
+            steps.append((now, cursor.lastrowid, platform))
+        conn.commit()
+
+        with self.cond:
+            for step in steps:
+                heapq.heappush(self.heap, step)
+            self.cond.notify_all()
+        return job_id
+
+    def recover(self):
+        # После рестарта возвращаем в кучу незавершённые шаги, зависшие в running - тоже
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE crosspost_steps SET status = 'pending'
+            WHERE status = 'running' AND updated_at < ?
+        ''', (int(time.time()) - self.STALE_RUNNING_SECONDS,))
+        conn.commit()
+        cursor.execute("SELECT eligible_at, id, platform FROM crosspost_steps WHERE status = 'pending'")
+        with self.cond:
+            for row in cursor.fetchall():
+                heapq.heappush(self.heap, tuple(row))
+            self.cond.notify_all()
+
+    def get_status(self, job_id):
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, status, platforms, created_at, updated_at FROM crosspost_jobs WHERE id = ?', (job_id,))
+        job = cursor.fetchone()
+        if not job:
+            return None
+        cursor.execute('''
+            SELECT platform, status, eligible_at, attempts, result
+            FROM crosspost_steps WHERE job_id = ? ORDER BY id
+        ''', (job_id,))
+        steps = [{
+            'platform': row[0],
+            'status': row[1],
+            'eligible_at': datetime.fromtimestamp(row[2]).isoformat(),
+            'attempts': row[3],
+            'result': json.loads(row[4]) if row[4] else None
+        } for row in cursor.fetchall()]
+        return {
+            'job_id': job[0],
+            'status': job[1],
+            'platforms': json.loads(job[2]),
+            'created_at': datetime.fromtimestamp(job[3]).isoformat(),
+            'updated_at': datetime.fromtimestamp(job[4]).isoformat(),
+            'steps': steps
+        }
+
+    def next_step(self):
+        with self.cond:
+            while True:
+                now = time.time()
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                eligible_at, step_id, platform = self.heap[0]
+                if eligible_at > now:
+                    self.cond.wait(eligible_at - now)
+                    continue
+                heapq.heappop(self.heap)
+                # Платформа ещё "остывает" после прошлого поста - переносим шаг
+                slot = self.next_slot.get(platform, 0)
+                if slot > now:
+                    heapq.heappush(self.heap, (slot, step_id, platform))
+                    continue
+                # Слот резервируется до захвата шага, чтобы два воркера процесса не взяли
+                # одну платформу подряд; если захват не удастся, release_slot его вернёт
+                reserved = now + random.uniform(120, 300)  # Умная задержка 2-5 минут
+                self.next_slot[platform] = reserved
+                return step_id, platform, (slot, reserved)
+    
+    def release_slot(self, platform, reservation):
+        previous, reserved = reservation
+        with self.cond:
+            if self.next_slot.get(platform) == reserved:
+                self.next_slot[platform] = previous
+                self.cond.notify_all()
+
+    def reschedule(self, step_id, platform, eligible_at):
+        with self.cond:
+            heapq.heappush(self.heap, (eligible_at, step_id, platform))
+            self.cond.notify_all()
+
+    def worker_loop(self):
+        while True:
+            step_id, platform, reservation = self.next_step()
+            try:
+                if not self.run_step(step_id, platform):
+                    self.release_slot(platform, reservation)
+            except Exception as e:
+                print(f"❌ Ошибка кросспостинга (шаг {step_id}): {e}")
+            finally:
+                finish_thread_db()
+
+    def run_step(self, step_id, platform):
+        """False - шаг захвачен другим процессом, пост не отправлялся"""
+        conn = get_db()
+        cursor = conn.cursor()
+        # Захват шага: в другом воркере gunicorn тот же шаг мог быть поднят при recover
+        cursor.execute('''
+            UPDATE crosspost_steps SET status = 'running', attempts = attempts + 1, updated_at = ?
+            WHERE id = ? AND status = 'pending'
+        ''', (int(time.time()), step_id))
+        conn.commit()
+        if cursor.rowcount != 1:
+            return False
+
+        cursor.execute('''
+            SELECT j.id, j.content FROM crosspost_steps s JOIN crosspost_jobs j ON j.id = s.job_id
+            WHERE s.id = ?
+        ''', (step_id,))
+        job_id, content = cursor.fetchone()
+        try:
+            result = crosspost_to_platform(content, platform)
+        except Exception as e:
+            result = {'platform': platform, 'status': 'error', 'reason': str(e)}
+
+        now = time.time()
+        if result['status'] == 'skipped' and result.get('retry_after'):
+            # Лимит не исчерпан, нужна только пауза - возвращаем шаг в очередь
+            cursor.execute('''
+                UPDATE crosspost_steps SET status = 'pending', eligible_at = ?, result = ?, updated_at = ?
+                WHERE id = ?
+            ''', (now + result['retry_after'], json.dumps(result), int(now), step_id))
             conn.commit()
-            conn.close()
-            
-            # Логирование действия
-            safety_controller.log_action(platform, 'posts', adapted_content)
-            
-            results.append({
-                'platform': platform,
-                'status': 'success',
-                'content_length': len(adapted_content)
-            })
-            
-            # Умная задержка между платформами
-            time.sleep(random.uniform(120, 300))
-        
-        return {'status': 'completed', 'results': results}
+            self.reschedule(step_id, platform, now + result['retry_after'])
+            return True
+
+        cursor.execute('''
+            UPDATE crosspost_steps SET status = ?, result = ?, updated_at = ?
+            WHERE id = ?
+        ''', (result['status'], json.dumps(result), int(now), step_id))
+        cursor.execute('''
+            UPDATE crosspost_jobs SET updated_at = ?, status = CASE
+                WHEN NOT EXISTS (
+                    SELECT 1 FROM crosspost_steps WHERE job_id = ? AND status IN ('pending', 'running')
+                ) THEN 'completed' ELSE 'running' END
+            WHERE id = ?
+        ''', (int(now), job_id, job_id))
+        conn.commit()
+        return True
+
+def crosspost_to_platforms(content, platforms=['instagram', 'telegram', 'tiktok']):
+    try:
+        # Шаги выполняются фоновыми воркерами, запрос не ждёт задержек между платформами
+        job_id = crosspost_queue.submit(content, platforms)
+        return {'status': 'queued', 'job_id': job_id, 'status_url': f'/api/automation/crosspost/{job_id}'}
     except Exception as e:
         return {'error': str(e)}
 
+STATS_FIELDS = ('platform', 'followers', 'engagement', 'views', 'timestamp')
+
+def parse_stats_timestamp(value):
+    """Epoch-секунды или ISO-строка (без зоны считается UTC) -> целые epoch-секунды"""
+    if value is None or value == '':
+        return int(time.time())
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    if re.fullmatch(r'\d+(\.\d+)?', value):
+        return int(float(value))
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def iter_stats_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None  # битая строка учитывается как rejected, пакет не прерывается
+
+def iter_stats_csv(lines):
+    yield from csv.DictReader(lines)
+
+def ingest_platform_stats(records, chunk_size=5000):
+    """Пакетная запись platform_stats: executemany по чанкам в отдельных транзакциях,
+    дубликаты по (platform, timestamp) пропускаются - и в горячей таблице, и в партициях"""
+    conn = get_db()
+    started = time.perf_counter()
+    received = inserted = rejected = 0
+    chunk = []
+    # Старше границы хранения строку некуда положить: партиции этих месяцев уже удалены
+    history_floor = stats_partitions.history_floor()
+
+    def flush():
+        nonlocal inserted
+        if not chunk:
+            return
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Под блокировкой записи реестр и партиции согласованы с горячей таблицей:
+            # перенос регистрирует месяц до удаления строк, так что ключ виден хотя бы в одном месте
+            sealed_until = stats_partitions.sealed_until(cursor)
+            sealed = [(row[0], row[5]) for row in chunk if row[5] < sealed_until]
+            if sealed:
+                existing = stats_partitions.existing_keys(sealed, cursor)
+                chunk[:] = [row for row in chunk if (row[0], row[5]) not in existing]
+            # NOT EXISTS опирается на индекс (platform, created_at) и видит строки этого же чанка
+            cursor.executemany('''
+                INSERT INTO platform_stats (platform, followers, engagement, views, timestamp, created_at)
+                SELECT ?, ?, ?, ?, datetime(?, 'unixepoch'), ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM platform_stats WHERE platform = ? AND created_at = ?
+                )
+            ''', chunk)
+            # rowcount у executemany суммирует вставки и не учитывает строки из триггеров
+            inserted += cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        chunk.clear()
+
+    for record in records:
+        received += 1
+        try:
+            platform = str(record['platform']).strip().lower()
+            created_at = parse_stats_timestamp(record.get('timestamp'))
+            row = (
+                platform,
+                int(float(record.get('followers') or 0)),
+                float(record.get('engagement') or 0),
+                int(float(record.get('views') or 0)),
+                created_at,
+                created_at,
+                platform,
+                created_at
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            rejected += 1
+            continue
+        if not platform or created_at < history_floor:
+            rejected += 1
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    seconds = time.perf_counter() - started
+    return {
+        'received': received,
+        'inserted': inserted,
+        'duplicates': received - rejected - inserted,
+        'rejected': rejected,
+        'seconds': round(seconds, 3),
+        'rows_per_second': int(received / seconds) if seconds else received
+    }
+
+# Экспортируемые таблицы: колонки с типами, ключ постраничного курсора и колонка времени
+EXPORT_TABLES = {
+    'platform_stats': {
+        'columns': (('id', 'int'), ('platform', 'str'), ('followers', 'int'), ('engagement', 'float'),
+                    ('views', 'int'), ('timestamp', 'str'), ('created_at', 'int')),
+        'key': ('id',), 'time': 'created_at'
+    },
+    'content_plan': {
+        'columns': (('id', 'int'), ('platform', 'str'), ('content_text', 'str'), ('schedule_time', 'str'),
+                    ('status', 'str'), ('schedule_epoch', 'int'), ('created_at', 'int')),
+        'key': ('id',), 'time': 'created_at'
+    },
+    'instagram_dms': {
+        'columns': (('id', 'int'), ('sender_id', 'str'), ('message_text', 'str'), ('replied', 'int'),
+                    ('reply_text', 'str'), ('timestamp', 'str'), ('created_at', 'int')),
+        'key': ('id',), 'time': 'created_at'
+    },
+    'daily_reports': {
+        'columns': (('id', 'int'), ('report_date', 'str'), ('report_type', 'str'), ('report_data', 'str'),
+                    ('sent', 'int'), ('created_at', 'int')),
+        'key': ('id',), 'time': 'created_at'
+    },
+    'stats_rollup_hourly': {
+        'columns': (('platform', 'str'), ('bucket', 'int'), ('samples', 'int'), ('sum_followers', 'int'),
+                    ('min_followers', 'int'), ('max_followers', 'int'), ('sum_engagement', 'float'),
+                    ('sum_views', 'int')),
+        'key': ('platform', 'bucket'), 'time': 'bucket'
+    },
+    'stats_rollup_daily': {
+        'columns': (('platform', 'str'), ('bucket', 'int'), ('samples', 'int'), ('sum_followers', 'int'),
+                    ('min_followers', 'int'), ('max_followers', 'int'), ('sum_engagement', 'float'),
+                    ('sum_views', 'int')),
+        'key': ('platform', 'bucket'), 'time': 'bucket'
+    }
+}
+
+# История platform_stats целиком: запечатанные месячные партиции плюс горячая таблица
+EXPORT_TABLES['platform_stats_history'] = dict(EXPORT_TABLES['platform_stats'], partitioned=True)
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+def iter_export_pages(table, since=None, until=None, page_size=5000):
+    """Страницы строк таблицы по keyset-курсору: каждая страница - отдельный короткий
+    запрос "ключ > последний выданный", память не зависит от объёма выгрузки"""
+    spec = EXPORT_TABLES[table]
+    if spec.get('partitioned'):
+        yield from stats_partitions.iter_history(since, until, page_size)
+        return
+    columns = ', '.join(name for name, _ in spec['columns'])
+    key = spec['key']
+    key_index = [[name for name, _ in spec['columns']].index(name) for name in key]
+    key_expr = f"({', '.join(key)})" if len(key) > 1 else key[0]
+    
+    filters, params = [], []
+    if since is not None:
+        filters.append(f"{spec['time']} >= ?")
+        params.append(since)
+    if until is not None:
+        filters.append(f"{spec['time']} < ?")
+        params.append(until)
+    
+    cursor = get_db().cursor()
+    last_key = None
+    while True:
+        conditions = list(filters)
+        page_params = list(params)
+        if last_key is not None:
+            placeholders = ', '.join('?' for _ in key)
+            conditions.append(f"{key_expr} > ({placeholders})" if len(key) > 1 else f"{key_expr} > ?")
+            page_params.extend(last_key)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cursor.execute(f'''
+            SELECT {columns} FROM {table} {where}
+            ORDER BY {', '.join(key)} LIMIT ?
+        ''', (*page_params, page_size))
+        page = cursor.fetchall()
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_key = [page[-1][index] for index in key_index]
+
+def export_csv(table, pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in EXPORT_TABLES[table]['columns'])
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def export_ndjson(table, pages):
+    names = [name for name, _ in EXPORT_TABLES[table]['columns']]
+    for page in pages:
+        yield ''.join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in page).encode('utf-8')
+
+class ParquetChunkSink(io.RawIOBase):
+    """Приёмник для ParquetWriter: копит байты очередной группы строк и отдаёт их наружу.
+    tell() возвращает полную позицию, чтобы смещения в футере файла оставались верными"""
+    
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_parquet(table, pages):
+    """Одна группа строк Parquet на страницу курсора"""
+    arrow_types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    columns = EXPORT_TABLES[table]['columns']
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+    sink = ParquetChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for page in pages:
+            arrays = [pa.array([row[index] for row in page], type=schema.field(index).type)
+                      for index in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+EXPORT_WRITERS = {'csv': export_csv, 'ndjson': export_ndjson, 'parquet': export_parquet}
+
 def init_database():
+    """Схема и миграции. Ошибка здесь - отказ старта: воркер не должен работать
+    с наполовину мигрированной БД"""
+    conn = get_db()
+    cursor = conn.cursor()
+    # Воркеры gunicorn стартуют одновременно: базовые таблицы и начальные статусы
+    # создаёт тот, кто первым взял блокировку записи, остальные видят готовую схему
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
-        cursor = conn.cursor()
-        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS platform_stats (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -1425,19 +3301,618 @@ def init_database():
                 ''', (feature,))
         
         conn.commit()
-        conn.close()
-        print("✅ База данных инициализирована")
-    except Exception as e:
-        print(f"❌ Ошибка БД: {e}")
+    except Exception:
+        conn.rollback()
+        raise
+    migrate_database(conn)
+    print("✅ База данных инициализирована")
+
+def migration_epoch_indexes(cursor):
+    """v1: целочисленные epoch-метки времени и индексы под оконные запросы"""
+    # Колонка created_at хранит секунды Unix; исходные текстовые timestamp оставляем для совместимости
+    cursor.execute('ALTER TABLE platform_stats ADD COLUMN created_at INTEGER')
+    cursor.execute('ALTER TABLE instagram_dms ADD COLUMN created_at INTEGER')
+    cursor.execute('ALTER TABLE content_plan ADD COLUMN created_at INTEGER')
+    cursor.execute('ALTER TABLE content_plan ADD COLUMN schedule_epoch INTEGER')
+    cursor.execute('ALTER TABLE daily_reports ADD COLUMN created_at INTEGER')
+
+    # platform_stats и daily_reports пишутся через CURRENT_TIMESTAMP (UTC), instagram_dms - локальным isoformat
+    cursor.execute("UPDATE platform_stats SET created_at = CAST(strftime('%s', timestamp) AS INTEGER)")
+    cursor.execute("UPDATE daily_reports SET created_at = CAST(strftime('%s', timestamp) AS INTEGER)")
+    cursor.execute("UPDATE instagram_dms SET created_at = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)")
+    # schedule_time бывает слотом 'HH:MM' - эпоху получают только полные даты
+    cursor.execute('''
+        UPDATE content_plan SET schedule_epoch = CAST(strftime('%s', schedule_time) AS INTEGER)
+        WHERE schedule_time LIKE '____-__-__%'
+    ''')
+    cursor.execute('UPDATE content_plan SET created_at = COALESCE(schedule_epoch, CAST(strftime(\'%s\', \'now\') AS INTEGER))')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_platform_stats_platform_created ON platform_stats (platform, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_platform_stats_created ON platform_stats (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_instagram_dms_created ON instagram_dms (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_plan_status_schedule ON content_plan (status, schedule_epoch)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_reports_date ON daily_reports (report_date)')
+
+def migration_platform_latest(cursor):
+    """v2: таблица последних значений по платформам, поддерживается триггерами"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS platform_latest (
+            platform TEXT PRIMARY KEY,
+            stats_id INTEGER NOT NULL,
+            followers INTEGER DEFAULT 0,
+            engagement REAL DEFAULT 0.0,
+            views INTEGER DEFAULT 0,
+            created_at INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_platform_stats_latest_insert
+        AFTER INSERT ON platform_stats
+        BEGIN
+            INSERT INTO platform_latest (platform, stats_id, followers, engagement, views, created_at)
+            VALUES (NEW.platform, NEW.id, NEW.followers, NEW.engagement, NEW.views,
+                    COALESCE(NEW.created_at, CAST(strftime('%s', 'now') AS INTEGER)))
+            ON CONFLICT (platform) DO UPDATE SET
+                stats_id = excluded.stats_id,
+                followers = excluded.followers,
+                engagement = excluded.engagement,
+                views = excluded.views,
+                created_at = excluded.created_at
+            WHERE excluded.created_at >= platform_latest.created_at;
+        END
+    ''')
+    # Если удалили именно текущий снимок - поднимаем следующую по свежести запись
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_platform_stats_latest_delete
+        AFTER DELETE ON platform_stats
+        WHEN OLD.id = (SELECT stats_id FROM platform_latest WHERE platform = OLD.platform)
+        BEGIN
+            DELETE FROM platform_latest WHERE platform = OLD.platform;
+            INSERT INTO platform_latest (platform, stats_id, followers, engagement, views, created_at)
+            SELECT platform, id, followers, engagement, views, created_at
+            FROM platform_stats
+            WHERE platform = OLD.platform
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1;
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO platform_latest (platform, stats_id, followers, engagement, views, created_at)
+        SELECT s.platform, s.id, s.followers, s.engagement, s.views, s.created_at
+        FROM platform_stats s
+        WHERE s.id = (
+            SELECT id FROM platform_stats
+            WHERE platform = s.platform
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        )
+    ''')
+
+def migration_crosspost_queue(cursor):
+    """v3: персистентная очередь кросспостинга"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crosspost_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            platforms TEXT NOT NULL,
+            status TEXT DEFAULT 'queued',
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crosspost_steps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL REFERENCES crosspost_jobs (id),
+            platform TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            eligible_at REAL NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            result TEXT,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crosspost_steps_job ON crosspost_steps (job_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crosspost_steps_status ON crosspost_steps (status, eligible_at)')
+
+def migration_table_versions(cursor):
+    """v4: счётчики изменений таблиц для инвалидации кэшей во всех воркерах"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in ('platform_stats', 'content_plan', 'instagram_dms', 'automation_status'):
+        cursor.execute('INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+
+def read_table_versions(cursor, tables):
+    placeholders = ', '.join('?' for _ in tables)
+    cursor.execute(f'SELECT name, version FROM table_versions WHERE name IN ({placeholders})', tuple(tables))
+    return dict(cursor.fetchall())
+
+def migration_dm_deferred(cursor):
+    """v5: очередь DM, не поместившихся в лимит при пакетной обработке"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS instagram_dm_deferred (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id TEXT NOT NULL,
+            message_text TEXT NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+
+def migration_dm_dedup(cursor):
+    """v6: ключ идемпотентности DM (sender_id, message_hash) с уникальным индексом"""
+    cursor.execute('ALTER TABLE instagram_dms ADD COLUMN message_hash TEXT')
+    cursor.execute('SELECT id, sender_id, message_text FROM instagram_dms ORDER BY id')
+    seen, updates = set(), []
+    for row_id, sender_id, message_text in cursor.fetchall():
+        message_hash = dm_message_hash(message_text)
+        # Исторические дубликаты оставляем с NULL: они не участвуют в уникальном индексе
+        if (sender_id, message_hash) not in seen:
+            seen.add((sender_id, message_hash))
+            updates.append((message_hash, row_id))
+    cursor.executemany('UPDATE instagram_dms SET message_hash = ? WHERE id = ?', updates)
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_instagram_dms_dedup
+        ON instagram_dms (sender_id, message_hash)
+    ''')
+
+def migration_stats_rollups(cursor):
+    """v7: часовые и дневные роллапы platform_stats, пополняются триггером на вставку.
+    Удаления сырых строк роллапы не трогают - долгосрочная история переживает очистку"""
+    for table, width in (('stats_rollup_hourly', 3600), ('stats_rollup_daily', 86400)):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                platform TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                sum_followers INTEGER NOT NULL,
+                min_followers INTEGER NOT NULL,
+                max_followers INTEGER NOT NULL,
+                sum_engagement REAL NOT NULL,
+                sum_views INTEGER NOT NULL,
+                PRIMARY KEY (platform, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_platform_stats_{table}
+            AFTER INSERT ON platform_stats
+            BEGIN
+                INSERT INTO {table} (platform, bucket, samples, sum_followers, min_followers,
+                                     max_followers, sum_engagement, sum_views)
+                VALUES (NEW.platform,
+                        COALESCE(NEW.created_at, CAST(strftime('%s', 'now') AS INTEGER)) / {width} * {width},
+                        1, COALESCE(NEW.followers, 0), COALESCE(NEW.followers, 0), COALESCE(NEW.followers, 0),
+                        COALESCE(NEW.engagement, 0), COALESCE(NEW.views, 0))
+                ON CONFLICT (platform, bucket) DO UPDATE SET
+                    samples = samples + 1,
+                    sum_followers = sum_followers + excluded.sum_followers,
+                    min_followers = MIN(min_followers, excluded.min_followers),
+                    max_followers = MAX(max_followers, excluded.max_followers),
+                    sum_engagement = sum_engagement + excluded.sum_engagement,
+                    sum_views = sum_views + excluded.sum_views;
+            END
+        ''')
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO {table} (platform, bucket, samples, sum_followers, min_followers,
+                                            max_followers, sum_engagement, sum_views)
+            SELECT platform, created_at / {width} * {width}, COUNT(*),
+                   SUM(COALESCE(followers, 0)), MIN(COALESCE(followers, 0)), MAX(COALESCE(followers, 0)),
+                   SUM(COALESCE(engagement, 0)), SUM(COALESCE(views, 0))
+            FROM platform_stats
+            WHERE created_at IS NOT NULL
+            GROUP BY platform, created_at / {width}
+        ''')
+
+def migration_report_cache(cursor):
+    """v8: ключ кэша отчётов в daily_reports, там же хранятся недельные отчёты"""
+    cursor.execute("ALTER TABLE daily_reports ADD COLUMN report_type TEXT DEFAULT 'daily'")
+    cursor.execute('ALTER TABLE daily_reports ADD COLUMN cache_key TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_reports_cache_key ON daily_reports (cache_key)')
+
+def migration_job_runs(cursor):
+    """v9: история запусков фоновых задач планировщика"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job TEXT NOT NULL,
+            scheduled_for INTEGER NOT NULL,
+            started_at INTEGER NOT NULL,
+            late_ms REAL,
+            duration_ms REAL,
+            status TEXT NOT NULL,
+            error TEXT,
+            missed INTEGER DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job, scheduled_for)')
+
+def migration_leader_leases(cursor):
+    """v10: аренда лидерства для фоновых задач (один исполнитель на развёртывание)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leader_leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL,
+            acquired_at REAL NOT NULL
+        )
+    ''')
+
+def migration_incremental_vacuum(cursor):
+    """v11: auto_vacuum=INCREMENTAL, чтобы очистка могла возвращать страницы порциями.
+    Новая БД получает режим при первом подключении; существующая - только после полного VACUUM,
+    его запускают один раз вручную: flask convert-incremental-vacuum"""
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+def migration_stats_partitions(cursor):
+    """v12: реестр месячных партиций истории platform_stats"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_partitions (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            start_epoch INTEGER NOT NULL,
+            end_epoch INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            min_created INTEGER,
+            max_created INTEGER,
+            sealed_at INTEGER NOT NULL
+        )
+    ''')
+
+def migration_retention_indexes(cursor):
+    """v13: индексы по времени для таблиц, которые чистит RetentionEngine,
+    - границы порций очистки ищутся диапазоном по индексу, а не полным сканом"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_plan_created ON content_plan (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_reports_created ON daily_reports (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_instagram_dm_deferred_created ON instagram_dm_deferred (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_job_runs_started ON job_runs (started_at)')
+
+def migration_partition_max_id(cursor):
+    """v14: максимальный скопированный id месяца - из горячей таблицы удаляется ровно перенесённое"""
+    cursor.execute('ALTER TABLE stats_partitions ADD COLUMN max_id INTEGER')
+
+def migration_smart_reply_overrides(cursor):
+    """v15: правки шаблонов и ключевых слов SmartAutoReply - общие для всех воркеров,
+    версия таблицы говорит каждому процессу пересобрать автомат"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS smart_reply_overrides (
+            section TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (section, key)
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('smart_reply_overrides', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_smart_reply_overrides_version_{event.lower()}
+            AFTER {event} ON smart_reply_overrides
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'smart_reply_overrides';
+            END
+        ''')
+
+# Порядок важен: номер миграции = индекс + 1, текущая версия хранится в PRAGMA user_version
+SCHEMA_MIGRATIONS = [
+    migration_epoch_indexes,
+    migration_platform_latest,
+    migration_crosspost_queue,
+    migration_table_versions,
+    migration_dm_deferred,
+    migration_dm_dedup,
+    migration_stats_rollups,
+    migration_report_cache,
+    migration_job_runs,
+    migration_leader_leases,
+    migration_incremental_vacuum,
+    migration_stats_partitions,
+    migration_retention_indexes,
+    migration_partition_max_id,
+    migration_smart_reply_overrides,
+]
+
+def migrate_database(conn):
+    """Каждая миграция - одна транзакция BEGIN IMMEDIATE: DDL в SQLite транзакционен,
+    так что упавший шаг откатывается целиком вместе с user_version. Версия
+    перечитывается под блокировкой - параллельный воркер не повторит чужой шаг"""
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(SCHEMA_MIGRATIONS):
+                conn.rollback()
+                return
+            migration = SCHEMA_MIGRATIONS[version]
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"✅ Миграция БД v{version + 1}: {migration.__name__}")
+
+HTML_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Analytics Dashboard</title>
+    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+    <link rel="stylesheet" href="{{ asset_url('dashboard.css') }}">
+</head>
+<body>
+    <div class="header">
+        <div class="header-content">
+            <div>
+                <h1>Analytics Dashboard</h1>
+                <p>Social Media Integration Platform</p>
+            </div>
+        </div>
+    </div>
+
+    <div class="container">
+        <div class="controls">
+            <button class="btn" onclick="runAnalysis()">Run Analysis</button>
+            <button class="btn" onclick="generatePlan()">Generate Plan</button>
+            <button class="btn" onclick="testSystem()">Test System</button>
+            <button class="btn" onclick="refreshDashboard()">Refresh Data</button>
+            <button class="btn" onclick="toggleAllAutomations()">Automations</button>
+        </div>
+    
+        <!-- Platform tabs -->
+        <div class="platform-tabs">
+            <div class="platform-tab instagram active" onclick="showPlatformTab('instagram')">
+                Instagram
+            </div>
+            <div class="platform-tab tiktok" onclick="showPlatformTab('tiktok')">
+                TikTok
+            </div>
+            <div class="platform-tab youtube" onclick="showPlatformTab('youtube')">
+                YouTube
+            </div>
+            <div class="platform-tab telegram" onclick="showPlatformTab('telegram')">
+                Telegram
+            </div>
+        </div>
+
+        <!-- Контент Instagram -->
+        <div id="instagram-tab" class="tab-content active">
+            <div class="platform-content">
+                <!-- Левая колонка: Статистика -->
+                <div class="card">
+                    <h2>Instagram Statistics</h2>
+                    <div class="stat-card">
+                        <div class="stat-value">1,534</div>
+                        <div class="stat-label">Followers</div>
+                        <div class="stat-change change-positive">+125 this week</div>
+                    </div>
+                    <div class="stat-card">
+                        <div class="stat-value">4.2%</div>
+                        <div class="stat-label">Engagement</div>
+                        <div class="stat-change change-positive">+0.3%</div>
+                    </div>
+                    <div class="stat-card">
+                        <div class="stat-value">25.3K</div>
+                        <div class="stat-label">Monthly Views</div>
+                    </div>
+                    <div class="chart-container">
+                        <canvas id="instagramChart"></canvas>
+                    </div>
+                    <button class="btn" onclick="updateInstagramStats()" style="width: 100%; margin-top: 1rem;">Update Stats</button>
+                </div>
+                
+                <!-- Центральная колонка: Возможности -->
+                <div class="card">
+                    <h2>Automation Features</h2>
+                    <div class="feature-grid">
+                        <div class="feature-card">
+                            <h3>Auto-posting</h3>
+                            <p>Schedule content publication</p>
+                            <button class="try-btn" onclick="tryFeature('instagram', 'autopost')">Create Post</button>
+                        </div>
+                        <div class="feature-card">
+                            <h3>Auto-replies</h3>
+                            <p>AI-powered DM responses</p>
+                            <button class="try-btn" onclick="tryFeature('instagram', 'autoreply')">Configure</button>
+                        </div>
+                        <div class="feature-card">
+                            <h3>Analytics</h3>
+                            <p>Track growth and engagement</p>
+                            <button class="try-btn" onclick="tryFeature('instagram', 'analytics')">View Report</button>
+                        </div>
+                        <div class="feature-card">
+                            <h3>Sales Funnels</h3>
+                            <p>Automated client management</p>
+                            <button class="try-btn" onclick="tryFeature('instagram', 'funnel')">Setup Funnel</button>
+                        </div>
+                    </div>
+                    
+                    <h3>Quick Setup</h3>
+                    <ul class="checklist">
+                        <li>
+                            <input type="checkbox" id="ig-api" onchange="updateProgress('instagram')">
+                            <label for="ig-api">Connect Instagram API</label>
+                        </li>
+                        <li>
+                            <input type="checkbox" id="ig-business" onchange="updateProgress('instagram')">
+                            <label for="ig-business">Switch to Business Account</label>
+                        </li>
+                        <li>
+                            <input type="checkbox" id="ig-token" onchange="updateProgress('instagram')">
+                            <label for="ig-token">Get Access Token</label>
+                        </li>
+                    </ul>
+                    <div class="progress-bar">
+                        <div class="progress-fill" id="ig-progress" style="width: 0%;">0%</div>
+                    </div>
+                    <button class="btn" onclick="connectInstagramAPI()" style="width: 100%;">Connect API</button>
+                </div>
+                
+                <!-- Правая колонка: Обучение -->
+                <div class="card">
+                    <h2>Instagram Guide</h2>
+                    
+                    <h3>What is it?</h3>
+                    <p>Instagram - это соцсеть для фото и видео. Пользователи выкладывают контент, ставят лайки и пишут комментарии.</p>
+                    
+                    <h3>How to Monetize?</h3>
+                    <ul style="list-style: none; padding: 0;">
+                        <li>Course Sales: 5,000-50,000₽</li>
+                        <li>VIP Channels: $50-200/mo</li>
+                        <li>Advertising: 50₽ per 1000 followers</li>
+                    </ul>
+                    
+                    <h3>Security</h3>
+                    <div class="warning">
+                        <strong>Avoid:</strong> Mass following (>100/day)<br>
+                        <strong>Do:</strong> Post quality content regularly
+                    </div>
+                    
+                    <h3>Profit Calculator</h3>
+                    <div class="calculator">
+                        <input type="number" id="ig-calc-followers" placeholder="Подписчики" value="1534">
+                        <input type="number" id="ig-calc-engagement" placeholder="Engagement %" value="4.2">
+                        <input type="number" id="ig-calc-price" placeholder="Цена продукта (₽)" value="10000">
+                        <button onclick="calculateProfit('instagram')">💵 Рассчитать</button>
+                        <div id="ig-calc-result" class="result" style="display:none;"></div>
+                    </div>
+                </div>
+            </div>
+        </div>
+        
+        <!-- Контент TikTok, YouTube, Telegram по аналогии -->
+        <div id="tiktok-tab" class="tab-content" style="display: none;">
+            <!-- TikTok content here -->
+        </div>
+        <div id="youtube-tab" class="tab-content" style="display: none;">
+            <!-- YouTube content here -->
+        </div>
+        <div id="telegram-tab" class="tab-content" style="display: none;">
+            <!-- Telegram content here -->
+        </div>
+        
+        <!-- Панели графиков и статистики -->
+        <div class="activity-panel">
+            <!-- Графики и статистика -->
+            <div class="card">
+                <h2>📈 Тренды вовлеченности</h2>
+                <div class="chart-container" style="height: 300px;">
+                    <canvas id="engagementChart"></canvas>
+                </div>
+            </div>
+            
+            <!-- Планы контента -->
+            <div class="card">
+                <h2>📅 Планы контента</h2>
+                <div id="contentPlans" class="content-plans loading">
+                    <div>Загрузка планов...</div>
+                </div>
+            </div>
+            
+            <!-- Прогноз роста -->
+            <div class="card">
+                <h2>📊 Прогноз роста</h2>
+                <div id="growthForecast" class="growth-forecast">
+                    <div>Загрузка прогноза...</div>
+                </div>
+            </div>
+            <!-- Топ-5 лучших постов -->
+            <div class="card">
+                <h2>🏆 Топ-5 постов</h2>
+                <div id="topPosts" class="top-posts loading">
+                    <div>Загрузка топа...</div>
+                </div>
+            </div>
+            
+            <!-- Последние действия системы -->
+            <div class="card">
+                <h2>📝 Последние действия</h2>
+                <div id="recentActions" class="recent-actions loading">
+                    <div>Загрузка действий...</div>
+                </div>
+            </div>
+            
+            <!-- Статус автоматизаций -->
+            <div class="card">
+                <h2>🤖 Статус автоматизаций</h2>
+                <div id="automationStatus">
+                    <div class="automation-toggle">
+                        <span>📧 Автоответы в DM</span>
+                        <div class="toggle-switch" id="dmToggle" onclick="toggleAutomation('dm_automation')">
+                            <div class="toggle-slider"></div>
+                        </div>
+                    </div>
+                    <div class="automation-toggle">
+                        <span>📝 Генерация контента</span>
+                        <div class="toggle-switch" id="contentToggle" onclick="toggleAutomation('content_generation')">
+                            <div class="toggle-slider"></div>
+                        </div>
+                    </div>
+                    <div class="automation-toggle">
+                        <span>🔄 Кросспостинг</span>
+                        <div class="toggle-switch" id="crosspostToggle" onclick="toggleAutomation('crossposting')">
+                            <div class="toggle-slider"></div>
+                        </div>
+                    </div>
+                    <div class="automation-toggle">
+                        <span>📊 Ежедневные отчёты</span>
+                        <div class="toggle-switch" id="reportsToggle" onclick="toggleAutomation('daily_reports')">
+                            <div class="toggle-slider"></div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+            
+            <!-- Алерты и уведомления -->
+            <div class="card">
+                <h2>⚠️ Уведомления системы</h2>
+                <div id="systemStatus">
+                    {% if analysis %}
+                    <div class="success">
+                        <strong>Система активна</strong><br>
+                        Всего подписчиков: <span class="stat-value">{{ analysis.total_followers }}</span><br>
+                        Средняя вовлеченность: <span class="stat-value">{{ analysis.avg_engagement }}%</span><br>
+                        Лучшая платформа: <span class="stat-value">{{ analysis.top_platform }}</span>
+                    </div>
+                    {% endif %}
+                    
+                    {% if alerts %}
+                    <div class="alert">
+                        <h3>⚠️ Требует внимания</h3>
+                        {% for alert in alerts %}
+                        <p>{{ alert }}</p>
+                        {% endfor %}
+                    </div>
+                    {% endif %}
+                </div>
+            </div>
+        </div>
+    </div>
+    
 
-HTML_TEMPLATE = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Analytics Dashboard</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
+    <script src="{{ asset_url('dashboard.js') }}"></script>
+</body>
+</html>
+'''
+
+# Статика дашборда вынесена из шаблона: отдаётся сжатой, с ETag и долгим кэшем
+DASHBOARD_CSS = '''
         * { margin: 0; padding: 0; box-sizing: border-box; }
         
         body { 
@@ -1979,323 +4454,120 @@ HTML_TEMPLATE = '''
             cursor: pointer;
             transition: all 0.15s;
             display: flex;
-            align-items: center;
-            gap: 0.5rem;
-            font-size: 0.875rem;
-        }
-        .quick-btn:hover {
-            background: #f9fafb;
-            border-color: #9ca3af;
-        }
-        .status-indicator {
-            width: 10px;
-            height: 10px;
-            border-radius: 50%;
-            display: inline-block;
-            margin-left: 0.5rem;
-        }
-        .status-active { background: #4CAF50; animation: pulse 2s infinite; }
-        .status-inactive { background: #666; }
-        .status-error { background: #f44336; }
-        
-        @keyframes pulse {
-            0% { opacity: 1; }
-            50% { opacity: 0.5; }
-            100% { opacity: 1; }
-        }
-        
-        .recent-actions {
-            max-height: 300px;
-            overflow-y: auto;
-        }
-        .action-item {
-            background: #ffffff;
-            padding: 0.75rem;
-            margin: 0.5rem 0;
-            border-radius: 4px;
-            display: flex;
-            align-items: center;
-            gap: 0.5rem;
-            border: 1px solid #e5e7eb;
-        }
-        .action-time {
-            font-size: 0.75rem;
-            color: #9ca3af;
-            margin-left: auto;
-        }
-        
-        @media (max-width: 768px) {
-            .dashboard { grid-template-columns: 1fr; }
-            .controls { flex-direction: column; align-items: center; }
-            .platforms-grid { grid-template-columns: 1fr; }
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <div class="header-content">
-            <div>
-                <h1>Analytics Dashboard</h1>
-                <p>Social Media Integration Platform</p>
-            </div>
-        </div>
-    </div>
-
-    <div class="container">
-        <div class="controls">
-            <button class="btn" onclick="runAnalysis()">Run Analysis</button>
-            <button class="btn" onclick="generatePlan()">Generate Plan</button>
-            <button class="btn" onclick="testSystem()">Test System</button>
-            <button class="btn" onclick="refreshDashboard()">Refresh Data</button>
-            <button class="btn" onclick="toggleAllAutomations()">Automations</button>
-        </div>
-    
-        <!-- Platform tabs -->
-        <div class="platform-tabs">
-            <div class="platform-tab instagram active" onclick="showPlatformTab('instagram')">
-                Instagram
-            </div>
-            <div class="platform-tab tiktok" onclick="showPlatformTab('tiktok')">
-                TikTok
-            </div>
-            <div class="platform-tab youtube" onclick="showPlatformTab('youtube')">
-                YouTube
-            </div>
-            <div class="platform-tab telegram" onclick="showPlatformTab('telegram')">
-                Telegram
-            </div>
-        </div>
-
-        <!-- Контент Instagram -->
-        <div id="instagram-tab" class="tab-content active">
-            <div class="platform-content">
-                <!-- Левая колонка: Статистика -->
-                <div class="card">
-                    <h2>Instagram Statistics</h2>
-                    <div class="stat-card">
-                        <div class="stat-value">1,534</div>
-                        <div class="stat-label">Followers</div>
-                        <div class="stat-change change-positive">+125 this week</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-value">4.2%</div>
-                        <div class="stat-label">Engagement</div>
-                        <div class="stat-change change-positive">+0.3%</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-value">25.3K</div>
-                        <div class="stat-label">Monthly Views</div>
-                    </div>
-                    <div class="chart-container">
-                        <canvas id="instagramChart"></canvas>
-                    </div>
-                    <button class="btn" onclick="updateInstagramStats()" style="width: 100%; margin-top: 1rem;">Update Stats</button>
-                </div>
-                
-                <!-- Центральная колонка: Возможности -->
-                <div class="card">
-                    <h2>Automation Features</h2>
-                    <div class="feature-grid">
-                        <div class="feature-card">
-                            <h3>Auto-posting</h3>
-                            <p>Schedule content publication</p>
-                            <button class="try-btn" onclick="tryFeature('instagram', 'autopost')">Create Post</button>
-                        </div>
-                        <div class="feature-card">
-                            <h3>Auto-replies</h3>
-                            <p>AI-powered DM responses</p>
-                            <button class="try-btn" onclick="tryFeature('instagram', 'autoreply')">Configure</button>
-                        </div>
-                        <div class="feature-card">
-                            <h3>Analytics</h3>
-                            <p>Track growth and engagement</p>
-                            <button class="try-btn" onclick="tryFeature('instagram', 'analytics')">View Report</button>
-                        </div>
-                        <div class="feature-card">
-                            <h3>Sales Funnels</h3>
-                            <p>Automated client management</p>
-                            <button class="try-btn" onclick="tryFeature('instagram', 'funnel')">Setup Funnel</button>
-                        </div>
-                    </div>
-                    
-                    <h3>Quick Setup</h3>
-                    <ul class="checklist">
-                        <li>
-                            <input type="checkbox" id="ig-api" onchange="updateProgress('instagram')">
-                            <label for="ig-api">Connect Instagram API</label>
-                        </li>
-                        <li>
-                            <input type="checkbox" id="ig-business" onchange="updateProgress('instagram')">
-                            <label for="ig-business">Switch to Business Account</label>
-                        </li>
-                        <li>
-                            <input type="checkbox" id="ig-token" onchange="updateProgress('instagram')">
-                            <label for="ig-token">Get Access Token</label>
-                        </li>
-                    </ul>
-                    <div class="progress-bar">
-                        <div class="progress-fill" id="ig-progress" style="width: 0%;">0%</div>
-                    </div>
-                    <button class="btn" onclick="connectInstagramAPI()" style="width: 100%;">Connect API</button>
-                </div>
-                
-                <!-- Правая колонка: Обучение -->
-                <div class="card">
-                    <h2>Instagram Guide</h2>
-                    
-                    <h3>What is it?</h3>
-                    <p>Instagram - это соцсеть для фото и видео. Пользователи выкладывают контент, ставят лайки и пишут комментарии.</p>
-                    
-                    <h3>How to Monetize?</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li>Course Sales: 5,000-50,000₽</li>
-                        <li>VIP Channels: $50-200/mo</li>
-                        <li>Advertising: 50₽ per 1000 followers</li>
-                    </ul>
-                    
-                    <h3>Security</h3>
-                    <div class="warning">
-                        <strong>Avoid:</strong> Mass following (>100/day)<br>
-                        <strong>Do:</strong> Post quality content regularly
-                    </div>
-                    
-                    <h3>Profit Calculator</h3>
-                    <div class="calculator">
-                        <input type="number" id="ig-calc-followers" placeholder="Подписчики" value="1534">
-                        <input type="number" id="ig-calc-engagement" placeholder="Engagement %" value="4.2">
-                        <input type="number" id="ig-calc-price" placeholder="Цена продукта (₽)" value="10000">
-                        <button onclick="calculateProfit('instagram')">💵 Рассчитать</button>
-                        <div id="ig-calc-result" class="result" style="display:none;"></div>
-                    </div>
-                </div>
-            </div>
-        </div>
+            align-items: center;
+            gap: 0.5rem;
+            font-size: 0.875rem;
+        }
+        .quick-btn:hover {
+            background: #f9fafb;
+            border-color: #9ca3af;
+        }
+        .status-indicator {
+            width: 10px;
+            height: 10px;
+            border-radius: 50%;
+            display: inline-block;
+            margin-left: 0.5rem;
+        }
+        .status-active { background: #4CAF50; animation: pulse 2s infinite; }
+        .status-inactive { background: #666; }
+        .status-error { background: #f44336; }
         
-        <!-- Контент TikTok, YouTube, Telegram по аналогии -->
-        <div id="tiktok-tab" class="tab-content" style="display: none;">
-            <!-- TikTok content here -->
-        </div>
-        <div id="youtube-tab" class="tab-content" style="display: none;">
-            <!-- YouTube content here -->
-        </div>
-        <div id="telegram-tab" class="tab-content" style="display: none;">
-            <!-- Telegram content here -->
-        </div>
+        @keyframes pulse {
+            0% { opacity: 1; }
+            50% { opacity: 0.5; }
+            100% { opacity: 1; }
+        }
         
-        <!-- Панели графиков и статистики -->
-        <div class="activity-panel">
-            <!-- Графики и статистика -->
-            <div class="card">
-                <h2>📈 Тренды вовлеченности</h2>
-                <div class="chart-container" style="height: 300px;">
-                    <canvas id="engagementChart"></canvas>
-                </div>
-            </div>
-            
-            <!-- Планы контента -->
-            <div class="card">
-                <h2>📅 Планы контента</h2>
-                <div id="contentPlans" class="content-plans loading">
-                    <div>Загрузка планов...</div>
-                </div>
-            </div>
-            
-            <!-- Прогноз роста -->
-            <div class="card">
-                <h2>📊 Прогноз роста</h2>
-                <div id="growthForecast" class="growth-forecast">
-                    <div>Загрузка прогноза...</div>
-                </div>
-            </div>
-            <!-- Топ-5 лучших постов -->
-            <div class="card">
-                <h2>🏆 Топ-5 постов</h2>
-                <div id="topPosts" class="top-posts loading">
-                    <div>Загрузка топа...</div>
-                </div>
-            </div>
-            
-            <!-- Последние действия системы -->
-            <div class="card">
-                <h2>📝 Последние действия</h2>
-                <div id="recentActions" class="recent-actions loading">
-                    <div>Загрузка действий...</div>
-                </div>
-            </div>
-            
-            <!-- Статус автоматизаций -->
-            <div class="card">
-                <h2>🤖 Статус автоматизаций</h2>
-                <div id="automationStatus">
-                    <div class="automation-toggle">
-                        <span>📧 Автоответы в DM</span>
-                        <div class="toggle-switch" id="dmToggle" onclick="toggleAutomation('dm_automation')">
-                            <div class="toggle-slider"></div>
-                        </div>
-                    </div>
-                    <div class="automation-toggle">
-                        <span>📝 Генерация контента</span>
-                        <div class="toggle-switch" id="contentToggle" onclick="toggleAutomation('content_generation')">
-                            <div class="toggle-slider"></div>
-                        </div>
-                    </div>
-                    <div class="automation-toggle">
-                        <span>🔄 Кросспостинг</span>
-                        <div class="toggle-switch" id="crosspostToggle" onclick="toggleAutomation('crossposting')">
-                            <div class="toggle-slider"></div>
-                        </div>
-                    </div>
-                    <div class="automation-toggle">
-                        <span>📊 Ежедневные отчёты</span>
-                        <div class="toggle-switch" id="reportsToggle" onclick="toggleAutomation('daily_reports')">
-                            <div class="toggle-slider"></div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <!-- Алерты и уведомления -->
-            <div class="card">
-                <h2>⚠️ Уведомления системы</h2>
-                <div id="systemStatus">
-                    {% if analysis %}
-                    <div class="success">
-                        <strong>Система активна</strong><br>
-                        Всего подписчиков: <span class="stat-value">{{ analysis.total_followers }}</span><br>
-                        Средняя вовлеченность: <span class="stat-value">{{ analysis.avg_engagement }}%</span><br>
-                        Лучшая платформа: <span class="stat-value">{{ analysis.top_platform }}</span>
-                    </div>
-                    {% endif %}
-                    
-                    {% if alerts %}
-                    <div class="alert">
-                        <h3>⚠️ Требует внимания</h3>
-                        {% for alert in alerts %}
-                        <p>{{ alert }}</p>
-                        {% endfor %}
-                    </div>
-                    {% endif %}
-                </div>
-            </div>
-        </div>
-    </div>
-    
+        .recent-actions {
+            max-height: 300px;
+            overflow-y: auto;
+        }
+        .action-item {
+            background: #ffffff;
+            padding: 0.75rem;
+            margin: 0.5rem 0;
+            border-radius: 4px;
+            display: flex;
+            align-items: center;
+            gap: 0.5rem;
+            border: 1px solid #e5e7eb;
+        }
+        .action-time {
+            font-size: 0.75rem;
+            color: #9ca3af;
+            margin-left: auto;
+        }
+        
+        @media (max-width: 768px) {
+            .dashboard { grid-template-columns: 1fr; }
+            .controls { flex-direction: column; align-items: center; }
+            .platforms-grid { grid-template-columns: 1fr; }
+        }
+'''
 
-    <script>
+DASHBOARD_JS = '''
         let engagementChart = null;
         let refreshInterval = null;
         let selectedPlatform = 'instagram';
         let currentTab = 'instagram';
         
+        let liveEvents = null;
+        
         // Инициализация дашборда
         document.addEventListener('DOMContentLoaded', function() {
             refreshDashboard();
             loadAutomationStatus();
             initPlatformTabs();
-            // Автообновление каждые 30 секунд
-            refreshInterval = setInterval(refreshDashboard, 30000);
+            startLiveUpdates();
         });
         
+        // Автообновление каждые 30 секунд - только запасной вариант, если push недоступен
+        function startPolling() {
+            if (!refreshInterval) {
+                refreshInterval = setInterval(refreshDashboard, 30000);
+            }
+        }
+        
+        function stopPolling() {
+            if (refreshInterval) {
+                clearInterval(refreshInterval);
+                refreshInterval = null;
+            }
+        }
+        
+        function startLiveUpdates() {
+            if (!window.EventSource) {
+                startPolling();
+                return;
+            }
+            liveEvents = new EventSource('/api/events');
+            liveEvents.onopen = () => {
+                stopPolling();
+                refreshDashboard();
+            };
+            liveEvents.onerror = () => {
+                // Пока EventSource переподключается, данные подтягиваем опросом
+                startPolling();
+                if (liveEvents.readyState === EventSource.CLOSED) {
+                    // Ответ не 200 (например, 503 при исчерпании потоков) - браузер сам не переподключится
+                    setTimeout(startLiveUpdates, 60000);
+                }
+            };
+            const handlers = {
+                platform_stats: loadPlatformStats,
+                engagement_trends: loadEngagementTrends,
+                content_plans: loadContentPlans,
+                automation_status: loadAutomationStatus,
+                dm_stats: (stats) => showNotification(`Direct: ответов ${stats.total_replies}, отправителей ${stats.unique_senders}`, 'info'),
+                safety: (state) => showNotification(`Лимит ${state.platform}/${state.action_type}: ${state.count} из ${state.limit}`, 'warning'),
+                resync: () => refreshDashboard()
+            };
+            Object.entries(handlers).forEach(([event, handler]) => {
+                liveEvents.addEventListener(event, (e) => handler(JSON.parse(e.data)));
+            });
+        }
+        
         // Функция для показа уведомлений
         function showNotification(message, type = 'info') {
             console.log(`[${type.toUpperCase()}] ${message}`);
@@ -2492,22 +4764,52 @@ HTML_TEMPLATE = '''
             showNotification('Тест завершен: ' + result.message, result.status === 'success' ? 'success' : 'error');
         }
 
-        async function refreshDashboard() {
-            loadPlatformStats();
-            loadEngagementTrends();
-            loadContentPlans();
-            loadTopPosts();
-            loadRecentActions();
-            loadGrowthForecast();
-        }
+        let snapshotETag = null;
 
-        async function loadPlatformStats() {
+        async function refreshDashboard() {
             try {
-                const response = await fetch('/api/platform-stats');
+                // Один запрос вместо семи; без изменений сервер отвечает 304
+                const response = await fetch('/api/dashboard/snapshot', {
+                    cache: 'no-store',
+                    headers: snapshotETag ? {'If-None-Match': snapshotETag} : {}
+                });
+                if (response.status === 304) {
+                    return;
+                }
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
-                const stats = await response.json();
+                const snapshot = await response.json();
+                snapshotETag = response.headers.get('ETag');
+                loadPlatformStats(snapshot.platform_stats);
+                loadEngagementTrends(snapshot.engagement_trends);
+                loadContentPlans(snapshot.content_plans);
+                loadTopPosts(snapshot.top_posts);
+                loadRecentActions(snapshot.recent_actions);
+                loadGrowthForecast(snapshot.growth_forecast);
+                loadAutomationStatus(snapshot.automation_status);
+            } catch (error) {
+                console.error('Ошибка загрузки снапшота, загружаем по отдельности:', error);
+                loadPlatformStats();
+                loadEngagementTrends();
+                loadContentPlans();
+                loadTopPosts();
+                loadRecentActions();
+                loadGrowthForecast();
+            }
+        }
+
+        async function loadPlatformStats(preloaded) {
+            try {
+                // Данные могут прийти из общего снапшота дашборда
+                let stats = preloaded;
+                if (!stats) {
+                    const response = await fetch('/api/platform-stats');
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    stats = await response.json();
+                }
                 
                 // Обновляем статистику текущей вкладки
                 Object.entries(stats).forEach(([platform, data]) => {
@@ -2549,14 +4851,18 @@ HTML_TEMPLATE = '''
             }
         }
 
-        async function loadEngagementTrends() {
+        async function loadEngagementTrends(preloaded) {
             try {
-                const response = await fetch('/api/engagement-trends');
-                if (!response.ok) {
-                    console.error('Ошибка загрузки трендов, статус:', response.status);
-                    return;
+                // Данные могут прийти из общего снапшота дашборда
+                let data = preloaded;
+                if (!data) {
+                    const response = await fetch('/api/engagement-trends');
+                    if (!response.ok) {
+                        console.error('Ошибка загрузки трендов, статус:', response.status);
+                        return;
+                    }
+                    data = await response.json();
                 }
-                const data = await response.json();
                 
                 const canvas = document.getElementById('engagementChart');
                 if (!canvas) {
@@ -2627,14 +4933,18 @@ HTML_TEMPLATE = '''
             }
         }
 
-        async function loadContentPlans() {
+        async function loadContentPlans(preloaded) {
             try {
-                const response = await fetch('/api/content-plans');
-                if (!response.ok) {
-                    console.error('Ошибка загрузки планов, статус:', response.status);
-                    return;
+                // Данные могут прийти из общего снапшота дашборда
+                let plans = preloaded;
+                if (!plans) {
+                    const response = await fetch('/api/content-plans');
+                    if (!response.ok) {
+                        console.error('Ошибка загрузки планов, статус:', response.status);
+                        return;
+                    }
+                    plans = await response.json();
                 }
-                const plans = await response.json();
                 
                 const container = document.getElementById('contentPlans');
                 if (!container) {
@@ -2727,14 +5037,18 @@ HTML_TEMPLATE = '''
             if (tooltip) tooltip.remove();
         }
         
-        async function loadTopPosts() {
+        async function loadTopPosts(preloaded) {
             try {
-                const response = await fetch('/api/top-posts');
-                if (!response.ok) {
-                    console.error('Ошибка загрузки топ постов, статус:', response.status);
-                    return;
+                // Данные могут прийти из общего снапшота дашборда
+                let posts = preloaded;
+                if (!posts) {
+                    const response = await fetch('/api/top-posts');
+                    if (!response.ok) {
+                        console.error('Ошибка загрузки топ постов, статус:', response.status);
+                        return;
+                    }
+                    posts = await response.json();
                 }
-                const posts = await response.json();
                 
                 const container = document.getElementById('topPosts');
                 if (!container) {
@@ -2769,14 +5083,18 @@ HTML_TEMPLATE = '''
             }
         }
         
-        async function loadRecentActions() {
+        async function loadRecentActions(preloaded) {
             try {
-                const response = await fetch('/api/recent-actions');
-                if (!response.ok) {
-                    console.error('Ошибка загрузки последних действий, статус:', response.status);
-                    return;
+                // Данные могут прийти из общего снапшота дашборда
+                let actions = preloaded;
+                if (!actions) {
+                    const response = await fetch('/api/recent-actions');
+                    if (!response.ok) {
+                        console.error('Ошибка загрузки последних действий, статус:', response.status);
+                        return;
+                    }
+                    actions = await response.json();
                 }
-                const actions = await response.json();
                 
                 const container = document.getElementById('recentActions');
                 if (!container) {
@@ -2805,14 +5123,18 @@ HTML_TEMPLATE = '''
             }
         }
         
-        async function loadGrowthForecast() {
+        async function loadGrowthForecast(preloaded) {
             try {
-                const response = await fetch('/api/growth-forecast');
-                if (!response.ok) {
-                    console.error('Ошибка загрузки прогноза, статус:', response.status);
-                    return;
+                // Данные могут прийти из общего снапшота дашборда
+                let forecast = preloaded;
+                if (!forecast) {
+                    const response = await fetch('/api/growth-forecast');
+                    if (!response.ok) {
+                        console.error('Ошибка загрузки прогноза, статус:', response.status);
+                        return;
+                    }
+                    forecast = await response.json();
                 }
-                const forecast = await response.json();
                 
                 const container = document.getElementById('growthForecast');
                 if (!container) {
@@ -2826,7 +5148,7 @@ HTML_TEMPLATE = '''
                     item.className = 'info-item';
                     item.innerHTML = `
                         <div class="info-label">${platform}</div>
-                        <div class="info-value">+${data.expectedGrowth}</div>
+                        <div class="info-value">${data.expectedGrowth >= 0 ? '+' : ''}${data.expectedGrowth}</div>
                         <div class="${data.percentage > 0 ? 'change-positive' : 'change-negative'}">
                             ${data.percentage > 0 ? '↑' : '↓'} ${Math.abs(data.percentage)}%
                         </div>
@@ -2838,14 +5160,18 @@ HTML_TEMPLATE = '''
             }
         }
         
-        async function loadAutomationStatus() {
+        async function loadAutomationStatus(preloaded) {
             try {
-                const response = await fetch('/api/automation-status');
-                if (!response.ok) {
-                    console.error('Ошибка загрузки статуса автоматизаций, статус:', response.status);
-                    return;
+                // Данные могут прийти из общего снапшота дашборда
+                let status = preloaded;
+                if (!status) {
+                    const response = await fetch('/api/automation-status');
+                    if (!response.ok) {
+                        console.error('Ошибка загрузки статуса автоматизаций, статус:', response.status);
+                        return;
+                    }
+                    status = await response.json();
                 }
-                const status = await response.json();
                 
                 if (!status || typeof status !== 'object') {
                     console.error('Некорректный формат данных статуса');
@@ -3391,46 +5717,317 @@ HTML_TEMPLATE = '''
                 showNotification('Failed to send report: ' + error, 'error');
             }
         }
-    </script>
-</body>
-</html>
 '''
 
+class CompressedAsset:
+    """Неизменяемый ответ: тело заранее сжато gzip/brotli, ETag считается один раз"""
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        raw = body.encode('utf-8')
+        self.etag = hashlib.sha1(raw).hexdigest()[:16]
+        self.encodings = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(raw, quality=11)
+
+    def response(self, max_age=0, immutable=False):
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            accepted = request.accept_encodings
+            encoding = next((name for name in ('br', 'gzip') if name in self.encodings and accepted[name]), 'identity')
+            response = Response(self.encodings[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={max_age}' + (', immutable' if immutable else '')
+        return response
+
+STATIC_ASSETS = {
+    'dashboard.css': CompressedAsset(DASHBOARD_CSS, 'text/css'),
+    'dashboard.js': CompressedAsset(DASHBOARD_JS, 'application/javascript'),
+}
+
+@app.template_global()
+def asset_url(name):
+    # Версия в URL меняется вместе с содержимым - браузер может кэшировать навсегда
+    return f'/assets/{name}?v={STATIC_ASSETS[name].etag}'
+
+@app.route('/assets/<name>')
+def static_asset(name):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    return asset.response(max_age=31536000, immutable=True)
+
+# Шаблоны компилируются один раз при старте, а не ищутся в кэше по исходнику на каждый запрос
+DASHBOARD_PAGE = app.jinja_env.from_string(HTML_TEMPLATE)
+PLATFORM_ANALYSIS_PAGE = CompressedAsset(
+    app.jinja_env.from_string(PLATFORM_ANALYSIS_TEMPLATE).render(), 'text/html'
+)
+
+# Живые API платформ. Аккаунты перечисляются через запятую: одна панель
+# может вести несколько каналов/бизнес-аккаунтов одной платформы
+PLATFORM_APIS = {
+    'youtube': {
+        'base_url': os.environ.get('YOUTUBE_API_BASE', 'https://www.googleapis.com/youtube/v3'),
+        'token_env': 'YOUTUBE_API_KEY', 'accounts_env': 'YOUTUBE_CHANNEL_IDS', 'name': 'YouTube'
+    },
+    'instagram': {
+        'base_url': os.environ.get('INSTAGRAM_API_BASE', 'https://graph.facebook.com/v19.0'),
+        'token_env': 'INSTAGRAM_ACCESS_TOKEN', 'accounts_env': 'INSTAGRAM_ACCOUNT_IDS', 'name': 'Instagram'
+    }
+}
+
+class PlatformStubServer:
+    """Локальная заглушка API YouTube/Instagram для разработки без сети и ключей:
+    отвечает фиксированными данными с искусственной задержкой latency (секунды)"""
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive: клиент переиспользует соединения пула
+            
+            def do_GET(self):
+                time.sleep(stub.latency)
+                url = urlsplit(self.path)
+                body = json.dumps(stub.respond(url.path.rstrip('/').split('/')[1:], parse_qs(url.query))).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+    
+    @staticmethod
+    def respond(parts, query):
+        seed = zlib.crc32('/'.join(parts).encode())
+        if parts == ['channels']:
+            channels = {channel: zlib.crc32(channel.encode()) for channel in query.get('id', [''])[0].split(',')}
+            return {'items': [{'id': channel, 'statistics': {
+                'subscriberCount': str(1000 + seed % 5000), 'viewCount': str(50000 + seed % 200000),
+                'videoCount': str(20 + seed % 80)}} for channel, seed in channels.items()]}
+        if len(parts) == 2 and parts[1] == 'media':
+            return {'data': [{'id': f'{parts[0]}_{i}', 'media_type': ('IMAGE', 'VIDEO', 'CAROUSEL_ALBUM')[i % 3],
+                              'caption': f'Торговая идея #{i + 1}', 'like_count': 40 + (seed + i * 37) % 160,
+                              'comments_count': 3 + (seed + i) % 25,
+                              'timestamp': (datetime.now(timezone.utc) - timedelta(hours=6 * i)).isoformat()}
+                             for i in range(int(query.get('limit', ['10'])[0]))]}
+        if len(parts) == 1:
+            return {'id': parts[0], 'username': f'lucifer_{parts[0]}', 'followers_count': 1500 + seed % 3000,
+                    'media_count': 100 + seed % 50}
+        return {'error': {'message': 'unknown path'}}
+    
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True, name='platform-stub').start()
+        return self.base_url
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_platform_stubs(latency=0.0):
+    """Поднимает по заглушке на платформу (у каждой свой хост:порт и свой пул)
+    и направляет на них клиента; ключи и аккаунты подставляются, если не заданы"""
+    stubs = {}
+    for platform, spec in PLATFORM_APIS.items():
+        stubs[platform] = PlatformStubServer(latency)
+        spec['base_url'] = stubs[platform].start()
+        os.environ.setdefault(spec['token_env'], 'stub-token')
+        os.environ.setdefault(spec['accounts_env'], '1001,1002')
+    return stubs
+
+class PlatformClient:
+    """Асинхронный фронт к API платформ. Один event loop в фоновом потоке,
+    один httpx.AsyncClient с пулом keep-alive соединений на хост; запросы
+    по платформам и аккаунтам идут параллельно, поэтому обновление панели
+    стоит как самая медленная платформа, а не сумма всех"""
+    
+    def __init__(self, safety, timeout=10.0):
+        self.safety = safety
+        self.timeout = timeout
+        self.loop = None
+        self.clients = {}
+        self.lock = threading.Lock()
+    
+    def host_concurrency(self, platform):
+        # Потолок параллельных запросов к хосту - от дневных лимитов платформы:
+        # одно соединение на 50 действий в сутки, от 2 до 16
+        limits = self.safety.platform_limits.get(platform, {})
+        return max(2, min(16, max(limits.values(), default=100) // 50))
+    
+    def run(self, coro):
+        """Выполняет корутину в общем цикле и ждёт результат из синхронного обработчика Flask"""
+        if httpx is None:
+            coro.close()
+            raise RuntimeError('Для живых интеграций нужен пакет httpx')
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True, name='platform-io').start()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(self.timeout * 3)
+        except concurrent.futures.TimeoutError:
+            # Иначе брошенная корутина продолжит работать в цикле и держать соединения пула
+            future.cancel()
+            raise
+    
+    def close(self):
+        with self.lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        async def close_clients():
+            for client in self.clients.values():
+                await client.aclose()
+            self.clients.clear()
+        asyncio.run_coroutine_threadsafe(close_clients(), loop).result(self.timeout)
+        loop.call_soon_threadsafe(loop.stop)
+    
+    def credentials(self, platform):
+        spec = PLATFORM_APIS[platform]
+        token = os.environ.get(spec['token_env'])
+        accounts = [account.strip() for account in os.environ.get(spec['accounts_env'], '').split(',') if account.strip()]
+        if not token or not accounts:
+            raise ValueError(f"{spec['name']} не настроен: задайте {spec['token_env']} и {spec['accounts_env']}")
+        return token, accounts
+    
+    async def get_json(self, platform, path, params):
+        base_url = PLATFORM_APIS[platform]['base_url']
+        host = urlsplit(base_url).netloc
+        # Клиенты создаются только в потоке цикла, блокировка не нужна
+        client = self.clients.get(host)
+        if client is None:
+            concurrency = self.host_concurrency(platform)
+            # Лимит соединений и есть потолок параллельности: лишние запросы ждут свободное
+            # соединение, но не дольше timeout - ожидание пула тоже ограничено
+            client = self.clients[host] = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            )
+        response = await client.get(base_url + path, params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    async def youtube_analytics(self):
+        key, channels = self.credentials('youtube')
+        # channels.list принимает до 50 id за вызов
+        batches = [channels[i:i + 50] for i in range(0, len(channels), 50)]
+        pages = await asyncio.gather(*(self.get_json('youtube', '/channels', {
+            'part': 'statistics', 'id': ','.join(batch), 'key': key}) for batch in batches))
+        accounts = []
+        for page in pages:
+            for item in page.get('items', []):
+                stats = item.get('statistics', {})
+                accounts.append({'channel_id': item.get('id'), 'subscribers': int(stats.get('subscriberCount', 0)),
+                                 'total_views': int(stats.get('viewCount', 0)), 'videos_count': int(stats.get('videoCount', 0))})
+        subscribers = sum(account['subscribers'] for account in accounts)
+        total_views = sum(account['total_views'] for account in accounts)
+        videos_count = sum(account['videos_count'] for account in accounts)
+        # Публичная статистика канала не содержит лайков: вовлечённость - средние
+        # просмотры видео относительно подписчиков
+        engagement_rate = round(total_views / videos_count / subscribers * 100, 2) if videos_count and subscribers else 0
+        return {'subscribers': subscribers, 'total_views': total_views, 'videos_count': videos_count,
+                'engagement_rate': min(engagement_rate, 100.0), 'accounts': accounts}
+    
+    async def instagram_account(self, account_id, token, limit):
+        profile, media = await asyncio.gather(
+            self.get_json('instagram', f'/{account_id}', {
+                'fields': 'username,followers_count,media_count', 'access_token': token}),
+            self.get_json('instagram', f'/{account_id}/media', {
+                'fields': 'id,caption,media_type,like_count,comments_count,timestamp',
+                'limit': limit, 'access_token': token})
+        )
+        followers = profile.get('followers_count', 0)
+        posts = []
+        for item in media.get('data', []):
+            likes, comments = item.get('like_count', 0), item.get('comments_count', 0)
+            posts.append({'id': item.get('id'), 'account': profile.get('username'),
+                          'media_type': item.get('media_type'), 'caption': item.get('caption', ''),
+                          'likes': likes, 'comments': comments, 'timestamp': item.get('timestamp'),
+                          'engagement_rate': round((likes + comments) / followers * 100, 2) if followers else 0})
+        return {'account_id': account_id, 'username': profile.get('username'), 'followers': followers,
+                'posts_count': profile.get('media_count', 0), 'posts': posts}
+    
+    async def instagram_accounts(self, limit=10):
+        token, accounts = self.credentials('instagram')
+        return await asyncio.gather(*(self.instagram_account(account, token, limit) for account in accounts))
+    
+    async def instagram_posts(self, limit=10):
+        posts = [post for account in await self.instagram_accounts(limit) for post in account['posts']]
+        return sorted(posts, key=lambda post: post['timestamp'] or '', reverse=True)
+    
+    async def snapshot(self):
+        """Все платформы разом; ошибка одной платформы не роняет остальные"""
+        async def timed(platform, coro):
+            started = time.perf_counter()
+            try:
+                result = {'data': await coro}
+            except Exception as e:
+                result = {'error': str(e)}
+            result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return platform, result
+        started = time.perf_counter()
+        results = dict(await asyncio.gather(
+            timed('youtube', self.youtube_analytics()),
+            timed('instagram', self.instagram_accounts())
+        ))
+        return {'platforms': results, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+
 # Initialize the application components
 print("🚀 LUCIFER ANALYTICAL ENTITY - ЗАПУСК СИСТЕМЫ")
 init_database()
-print("✅ База данных инициализирована")
 
-safety_controller = SafetyController()
+safety_controller = SafetyController(create_limit_backend())
 analytics_engine = AnalyticsEngine()
 
 # Initialize automation classes  
 instagram_dm_automation = InstagramDMAutomation(safety_controller)
-content_generator = ContentGenerator(safety_controller)
+content_dedup_index = NearDuplicateIndex()
+content_generator = ContentGenerator(safety_controller, dedup_index=content_dedup_index)
 smart_auto_reply = SmartAutoReply()
+growth_forecaster = GrowthForecaster(analytics_engine)
 report_generator = ReportGenerator(analytics_engine)
+crosspost_queue = CrosspostQueue(workers=3)
+crosspost_queue.start()
+platform_client = PlatformClient(safety_controller)
+atexit.register(platform_client.close)
+if os.environ.get('PLATFORM_API_STUB') == '1':
+    # Разработка без сети: API платформ подменяются локальными заглушками
+    platform_stubs = start_platform_stubs(float(os.environ.get('PLATFORM_API_STUB_LATENCY', '0.2')))
 
 @app.route('/')
 def dashboard():
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
+        conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT platform, followers, engagement, views FROM platform_stats ORDER BY timestamp DESC LIMIT 4')
+        # Последний снимок по каждой платформе, а не 4 последние строки истории
+        cursor.execute('SELECT platform, followers, engagement, views FROM platform_latest')
         stats = {}
         for row in cursor.fetchall():
             stats[row[0]] = {'followers': row[1], 'engagement': row[2], 'views': row[3]}
-        conn.close()
         analysis = analytics_engine.analyze_platform_stats(stats) if stats else None
         alerts = [] if analysis and not analysis.get('error') else ['Система требует настройки']
     except Exception as e:
         analysis = None
         alerts = [f'Ошибка загрузки: {str(e)}']
-    return render_template_string(HTML_TEMPLATE, analysis=analysis, alerts=alerts)
+    return DASHBOARD_PAGE.render(analysis=analysis, alerts=alerts)
 
 @app.route('/platform-analysis')
 def platform_analysis():
     """Страница детального анализа платформ с обучающими материалами"""
-    return render_template_string(PLATFORM_ANALYSIS_TEMPLATE)
+    # Страница статическая: отдаём заранее сжатые байты с ETag
+    return PLATFORM_ANALYSIS_PAGE.response()
 
 @app.route('/api/analyze')
 def api_analyze():
@@ -3440,31 +6037,44 @@ def api_analyze():
             'instagram': {'followers': random.randint(50, 300), 'engagement': round(random.uniform(1, 6), 2)},
             'youtube': {'followers': random.randint(200, 800), 'engagement': round(random.uniform(3, 10), 2)}
         }
-        conn = sqlite3.connect('lucifer_analytics.db')
+        conn = get_db()
         cursor = conn.cursor()
         for platform, stats in test_stats.items():
-            cursor.execute('INSERT INTO platform_stats (platform, followers, engagement, views) VALUES (?, ?, ?, ?)',
-                         (platform, stats['followers'], stats['engagement'], random.randint(1000, 5000)))
+            cursor.execute('INSERT INTO platform_stats (platform, followers, engagement, views, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (platform, stats['followers'], stats['engagement'], random.randint(1000, 5000), int(time.time())))
         conn.commit()
-        conn.close()
         return jsonify({'status': 'success', 'message': 'Анализ завершен'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/platform-stats/bulk', methods=['POST'])
+def api_platform_stats_bulk():
+    try:
+        # Тело читаем потоково: формат по Content-Type или ?format=ndjson|csv
+        data_format = request.args.get('format') or (
+            'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+        )
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        records = iter_stats_csv(lines) if data_format == 'csv' else iter_stats_ndjson(lines)
+        chunk_size = min(max(request.args.get('chunk_size', 5000, type=int), 1), 50000)
+        result = ingest_platform_stats(records, chunk_size=chunk_size)
+        return jsonify({'status': 'success', **result})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/api/generate-plan')
 def api_generate_plan():
     try:
         platforms = ['tiktok', 'instagram', 'youtube']
         content_types = ["Провокационный вопрос о трендах", "Образовательный гайд для новичков", "Анализ успешных кейсов", "Ответы на частые вопросы"]
-        conn = sqlite3.connect('lucifer_analytics.db')
+        conn = get_db()
         cursor = conn.cursor()
         for platform in platforms:
             content = random.choice(content_types)
-            time = f"{random.randint(10, 20)}:00"
-            cursor.execute('INSERT INTO content_plan (platform, content_text, schedule_time, status) VALUES (?, ?, ?, "planned")',
-                         (platform, content, time))
+            time_slot = f"{random.randint(10, 20)}:00"
+            cursor.execute('INSERT INTO content_plan (platform, content_text, schedule_time, status, created_at) VALUES (?, ?, ?, "planned", ?)',
+                         (platform, content, time_slot, int(time.time())))
         conn.commit()
-        conn.close()
         return jsonify({'status': 'success', 'message': 'Контент-план создан'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -3473,172 +6083,376 @@ def api_generate_plan():
 def api_test():
     try:
         safety_test = safety_controller.check_action_safety('instagram', 'posts')
-        db_test = "успешно" if os.path.exists('lucifer_analytics.db') else "ошибка"
+        db_test = "успешно" if os.path.exists(DB_PATH) else "ошибка"
         return jsonify({'status': 'success', 'message': f'Безопасность: {safety_test["safe"]}, БД: {db_test}'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def build_platform_stats(cursor):
+    # Последние статистики по каждой платформе одним чтением из platform_latest
+    stats = {platform: {'followers': 0, 'engagement': 0, 'views': 0}
+             for platform in ['tiktok', 'instagram', 'youtube', 'telegram']}
+    
+    cursor.execute('SELECT platform, followers, engagement, views FROM platform_latest')
+    for row in cursor.fetchall():
+        stats[row[0]] = {
+            'followers': row[1],
+            'engagement': row[2],
+            'views': row[3]
+        }
+    return stats
+
+def build_engagement_trends(cursor):
+    # Получаем данные за последние 7 записей для графика
+    cursor.execute('''
+        SELECT platform, engagement, timestamp 
+        FROM platform_stats 
+        ORDER BY created_at DESC, id DESC 
+        LIMIT 21
+    ''')
+    
+    data = {'labels': [], 'datasets': []}
+    platforms_data = {}
+    
+    for row in cursor.fetchall():
+        platform, engagement, timestamp = row
+        if platform not in platforms_data:
+            platforms_data[platform] = []
+        platforms_data[platform].append({
+            'x': timestamp,
+            'y': engagement
+        })
+    
+    # Создаем датасеты для Chart.js
+    colors = {'tiktok': '#ff0050', 'instagram': '#e4405f', 'youtube': '#ff0000', 'telegram': '#0088cc'}
+    
+    for platform, values in platforms_data.items():
+        data['datasets'].append({
+            'label': platform.upper(),
+            'data': values[-7:],  # Последние 7 точек
+            'borderColor': colors.get(platform, '#dc143c'),
+            'backgroundColor': colors.get(platform, '#dc143c') + '20',
+            'tension': 0.3
+        })
+    return data
+
+def build_content_plans(cursor):
+    cursor.execute('''
+        SELECT platform, content_text, schedule_time, status 
+        FROM content_plan 
+        ORDER BY rowid DESC 
+        LIMIT 10
+    ''')
+    
+    plans = []
+    for row in cursor.fetchall():
+        plans.append({
+            'platform': row[0],
+            'content': row[1],
+            'time': row[2],
+            'status': row[3]
+        })
+    return plans
+
+def build_top_posts():
+    # Генерируем тестовые данные для топ постов
+    return [
+        {'platform': 'instagram', 'title': 'Трейдинг сигналы EUR/USD', 'likes': 1250, 'views': 8500, 'comments': 145},
+        {'platform': 'tiktok', 'title': 'Как я заработал на крипте', 'likes': 3400, 'views': 25000, 'comments': 380},
+        {'platform': 'youtube', 'title': 'Обучение трейдингу с нуля', 'likes': 890, 'views': 4500, 'comments': 67},
+        {'platform': 'telegram', 'title': 'VIP сигнал BTC/USDT', 'likes': 450, 'views': 2100, 'comments': 89},
+        {'platform': 'instagram', 'title': 'Результаты недели +15%', 'likes': 980, 'views': 6700, 'comments': 112}
+    ]
+
+def build_recent_actions():
+    return [
+        {'description': 'Опубликован пост в Instagram', 'time': '5 мин назад'},
+        {'description': 'Автоответ отправлен 3 пользователям', 'time': '12 мин назад'},
+        {'description': 'Сгенерирован контент для TikTok', 'time': '25 мин назад'},
+        {'description': 'Кросспостинг выполнен на 3 платформы', 'time': '1 час назад'},
+        {'description': 'Отчёт отправлен на email', 'time': '2 часа назад'}
+    ]
+
+def build_growth_forecast(cursor):
+    return growth_forecaster.forecast(cursor)
+
+def build_automation_status(cursor):
+    cursor.execute('SELECT feature, enabled FROM automation_status')
+    
+    status = {}
+    for row in cursor.fetchall():
+        status[row[0]] = bool(row[1])
+    return status
+
 @app.route('/api/platform-stats')
 def api_platform_stats():
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
-        cursor = conn.cursor()
-        
-        # Получаем последние статистики по каждой платформе
-        stats = {}
-        platforms = ['tiktok', 'instagram', 'youtube', 'telegram']
-        
-        for platform in platforms:
-            cursor.execute('SELECT followers, engagement, views FROM platform_stats WHERE platform = ? ORDER BY timestamp DESC LIMIT 1', (platform,))
-            row = cursor.fetchone()
-            if row:
-                stats[platform] = {
-                    'followers': row[0],
-                    'engagement': row[1],
-                    'views': row[2]
-                }
-            else:
-                stats[platform] = {'followers': 0, 'engagement': 0, 'views': 0}
-        
-        conn.close()
-        return jsonify(stats)
+        return jsonify(build_platform_stats(get_db().cursor()))
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/api/engagement-trends')
 def api_engagement_trends():
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
-        cursor = conn.cursor()
-        
-        # Получаем данные за последние 7 записей для графика
-        cursor.execute('''
-            SELECT platform, engagement, timestamp 
-            FROM platform_stats 
-            ORDER BY timestamp DESC 
-            LIMIT 21
-        ''')
-        
-        data = {'labels': [], 'datasets': []}
-        platforms_data = {}
-        
-        for row in cursor.fetchall():
-            platform, engagement, timestamp = row
-            if platform not in platforms_data:
-                platforms_data[platform] = []
-            platforms_data[platform].append({
-                'x': timestamp,
-                'y': engagement
-            })
-        
-        # Создаем датасеты для Chart.js
-        colors = {'tiktok': '#ff0050', 'instagram': '#e4405f', 'youtube': '#ff0000', 'telegram': '#0088cc'}
-        
-        for platform, values in platforms_data.items():
-            data['datasets'].append({
-                'label': platform.upper(),
-                'data': values[-7:],  # Последние 7 точек
-                'borderColor': colors.get(platform, '#dc143c'),
-                'backgroundColor': colors.get(platform, '#dc143c') + '20',
-                'tension': 0.3
-            })
-        
-        conn.close()
-        return jsonify(data)
+        return jsonify(build_engagement_trends(get_db().cursor()))
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/api/content-plans')
 def api_content_plans():
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT platform, content_text, schedule_time, status 
-            FROM content_plan 
-            ORDER BY rowid DESC 
-            LIMIT 10
-        ''')
-        
-        plans = []
-        for row in cursor.fetchall():
-            plans.append({
-                'platform': row[0],
-                'content': row[1],
-                'time': row[2],
-                'status': row[3]
-            })
-        
-        conn.close()
-        return jsonify(plans)
+        return jsonify(build_content_plans(get_db().cursor()))
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/api/top-posts')
 def api_top_posts():
     try:
-        # Генерируем тестовые данные для топ постов
-        posts = [
-            {'platform': 'instagram', 'title': 'Трейдинг сигналы EUR/USD', 'likes': 1250, 'views': 8500, 'comments': 145},
-            {'platform': 'tiktok', 'title': 'Как я заработал на крипте', 'likes': 3400, 'views': 25000, 'comments': 380},
-            {'platform': 'youtube', 'title': 'Обучение трейдингу с нуля', 'likes': 890, 'views': 4500, 'comments': 67},
-            {'platform': 'telegram', 'title': 'VIP сигнал BTC/USDT', 'likes': 450, 'views': 2100, 'comments': 89},
-            {'platform': 'instagram', 'title': 'Результаты недели +15%', 'likes': 980, 'views': 6700, 'comments': 112}
-        ]
-        return jsonify(posts)
+        return jsonify(build_top_posts())
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/api/recent-actions')
 def api_recent_actions():
     try:
-        actions = [
-            {'description': 'Опубликован пост в Instagram', 'time': '5 мин назад'},
-            {'description': 'Автоответ отправлен 3 пользователям', 'time': '12 мин назад'},
-            {'description': 'Сгенерирован контент для TikTok', 'time': '25 мин назад'},
-            {'description': 'Кросспостинг выполнен на 3 платформы', 'time': '1 час назад'},
-            {'description': 'Отчёт отправлен на email', 'time': '2 часа назад'}
-        ]
-        return jsonify(actions)
+        return jsonify(build_recent_actions())
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/api/growth-forecast')
 def api_growth_forecast():
     try:
-        forecast = {
-            'Instagram': {'expectedGrowth': 250, 'percentage': 16.3},
-            'TikTok': {'expectedGrowth': 380, 'percentage': 28.5},
-            'YouTube': {'expectedGrowth': 120, 'percentage': 8.2},
-            'Telegram': {'expectedGrowth': 200, 'percentage': 12.5}
-        }
-        return jsonify(forecast)
+        return jsonify(build_growth_forecast(get_db().cursor()))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/growth-forecast/batch')
+def api_growth_forecast_batch():
+    try:
+        horizon = min(max(request.args.get('horizon', 30, type=int), 1), 365)
+        return jsonify(growth_forecaster.forecast_all(horizon, get_db().cursor()))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/analytics/platforms')
+def api_analytics_platforms():
+    try:
+        return jsonify(analytics_engine.platform_metrics(get_db().cursor()))
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/api/automation-status')
 def api_automation_status():
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT feature, enabled FROM automation_status')
-        
-        status = {}
-        for row in cursor.fetchall():
-            status[row[0]] = bool(row[1])
-        
-        conn.close()
-        return jsonify(status)
+        return jsonify(build_automation_status(get_db().cursor()))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+class DashboardSnapshotCache:
+    """Снапшот дашборда в памяти процесса: короткий TTL плюс сверка версий таблиц"""
+
+    TABLES = ('platform_stats', 'content_plan', 'automation_status')
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.payload = None
+        self.etag = None
+        self.versions = None
+        self.checked_at = 0.0
+
+    def is_fresh(self):
+        return self.payload is not None and time.monotonic() - self.checked_at < self.ttl
+
+    def get(self):
+        with self.lock:
+            if self.is_fresh():
+                return self.payload, self.etag
+            # TTL истёк: одна дешёвая сверка версий вместо пересборки всех payload
+            cursor = get_db().cursor()
+            versions = read_table_versions(cursor, self.TABLES)
+            if self.payload is None or versions != self.versions:
+                self.payload = self.build(cursor)
+                body = json.dumps(self.payload, sort_keys=True, ensure_ascii=False)
+                self.etag = hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+                self.versions = versions
+            self.checked_at = time.monotonic()
+            return self.payload, self.etag
+
+    def invalidate(self):
+        with self.lock:
+            self.checked_at = 0.0
+
+    def build(self, cursor):
+        return {
+            'platform_stats': build_platform_stats(cursor),
+            'engagement_trends': build_engagement_trends(cursor),
+            'content_plans': build_content_plans(cursor),
+            'top_posts': build_top_posts(),
+            'recent_actions': build_recent_actions(),
+            'growth_forecast': build_growth_forecast(cursor),
+            'automation_status': build_automation_status(cursor),
+            'timestamp': datetime.now().isoformat()
+        }
+
+dashboard_snapshot_cache = DashboardSnapshotCache(ttl=5)
+db_write_listeners.append(dashboard_snapshot_cache.invalidate)
+
+@app.route('/api/dashboard/snapshot')
+def api_dashboard_snapshot():
+    try:
+        # Вкладка без изменений получает 304, пока снапшот свежий - без запросов к БД
+        if dashboard_snapshot_cache.is_fresh() and request.if_none_match.contains(dashboard_snapshot_cache.etag):
+            response = Response(status=304)
+            response.set_etag(dashboard_snapshot_cache.etag)
+            return response
+        payload, etag = dashboard_snapshot_cache.get()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(payload)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)})
 
+class LiveEventHub:
+    """Push-обновления дашборда (SSE): один поток-наблюдатель на процесс сверяет версии
+    таблиц и уровни лимитов и рассылает дельты всем подписчикам.
+    Под gthread каждый открытый поток занимает поток воркера целиком, поэтому число
+    потоков на воркер ограничено max_streams: остаток --threads обслуживает обычные
+    запросы, а сверх лимита клиент получает 503 и переходит на опрос"""
+
+    TABLES = ('platform_stats', 'content_plan', 'instagram_dms', 'automation_status')
+    SAFETY_LEVELS = (0.5, 0.8, 1.0)
+    RESYNC = 'event: resync\ndata: {}\n\n'
+
+    def __init__(self, poll_interval=1.0, max_queue=100, max_streams=None):
+        self.poll_interval = poll_interval
+        self.max_queue = max_queue
+        if max_streams is None:
+            # По умолчанию под --threads=512 из .replit: 32 потока остаются на API-запросы
+            max_streams = int(os.environ.get('SSE_MAX_STREAMS', '480'))
+        self.max_streams = max_streams
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.watcher = None
+        self.versions = None
+        self.safety_levels = {}
+
+    def subscribe(self):
+        """None - лимит потоков воркера исчерпан"""
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self.lock:
+            if len(self.subscribers) >= self.max_streams:
+                return None
+            self.subscribers.add(subscriber)
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self.watch_loop, name='live-events', daemon=True)
+                self.watcher.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        message = f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Клиент не успевает читать - просим его перечитать снапшот целиком
+                self.unsubscribe(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(self.RESYNC)
+
+    def watch_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.subscribers:
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Ошибка live-обновлений: {e}")
+
+    def poll(self):
+        cursor = get_db().cursor()
+        versions = read_table_versions(cursor, self.TABLES)
+        changed = set() if self.versions is None else {
+            table for table, version in versions.items() if self.versions.get(table) != version
+        }
+        self.versions = versions
+
+        if 'platform_stats' in changed:
+            self.publish('platform_stats', build_platform_stats(cursor))
+            self.publish('engagement_trends', build_engagement_trends(cursor))
+        if 'content_plan' in changed:
+            self.publish('content_plans', build_content_plans(cursor))
+        if 'instagram_dms' in changed:
+            self.publish('dm_stats', instagram_dm_automation.get_dm_stats())
+        if 'automation_status' in changed:
+            self.publish('automation_status', build_automation_status(cursor))
+        self.poll_safety()
+
+    def poll_safety(self):
+        for platform, limits in safety_controller.platform_limits.items():
+            for action_type, limit in limits.items():
+                count = safety_controller.get_recent_actions(platform, action_type, 24)
+                level = sum(1 for threshold in self.SAFETY_LEVELS if count >= limit * threshold)
+                key = (platform, action_type)
+                previous = self.safety_levels.get(key, 0)
+                self.safety_levels[key] = level
+                if level != previous:
+                    self.publish('safety', {
+                        'platform': platform,
+                        'action_type': action_type,
+                        'count': count,
+                        'limit': limit,
+                        'usage': round(count / limit, 2)
+                    })
+
+live_event_hub = LiveEventHub()
+
+@app.route('/api/events')
+def api_events():
+    subscriber = live_event_hub.subscribe()
+    if subscriber is None:
+        return jsonify({'error': 'Слишком много live-подключений, используйте опрос'}), 503, {'Retry-After': '60'}
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Комментарий-пинг держит соединение через прокси
+                    yield ': keepalive\n\n'
+                    continue
+                yield message
+                if message == LiveEventHub.RESYNC:
+                    # Отстающий клиент отписан - закрываем поток, EventSource переподключится
+                    return
+        finally:
+            live_event_hub.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/toggle-automation', methods=['POST'])
 def api_toggle_automation():
     try:
         feature = request.json.get('feature')
         
-        conn = sqlite3.connect('lucifer_analytics.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # Получаем текущий статус
@@ -3649,10 +6463,8 @@ def api_toggle_automation():
             new_status = 0 if current[0] else 1
             cursor.execute('UPDATE automation_status SET enabled = ? WHERE feature = ?', (new_status, feature))
             conn.commit()
-            conn.close()
             return jsonify({'status': 'success', 'enabled': bool(new_status)})
         else:
-            conn.close()
             return jsonify({'status': 'error', 'message': 'Feature not found'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -3660,20 +6472,21 @@ def api_toggle_automation():
 @app.route('/api/generate-ai-content')
 def api_generate_ai_content():
     try:
-        # Используем существующий генератор контента
-        generator = ContentGenerator(safety_controller)
-        content = generator.generate_trading_content()
+        # Используем существующий генератор контента; почти-дубликаты перегенерируются
+        content = content_generator.generate_unique_content('instagram')
+        if content is None:
+            return jsonify({'error': 'Не удалось сгенерировать пост, отличный от недавних'})
         
         if not content.get('error'):
             # Сохраняем в план контента
-            conn = sqlite3.connect('lucifer_analytics.db')
+            now_epoch = int(time.time())
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO content_plan (platform, content_text, schedule_time, status)
-                VALUES ('instagram', ?, datetime('now'), 'draft')
-            ''', (content['content'],))
+                INSERT INTO content_plan (platform, content_text, schedule_time, status, created_at, schedule_epoch)
+                VALUES ('instagram', ?, datetime(?, 'unixepoch'), 'draft', ?, ?)
+            ''', (content['content'], now_epoch, now_epoch, now_epoch))
             conn.commit()
-            conn.close()
             
         return jsonify(content)
     except Exception as e:
@@ -3690,18 +6503,52 @@ def api_check_dms():
 @app.route('/api/export-report')
 def api_export_report():
     try:
-        report = report_generator.generate_daily_report()
-        # В реальности здесь бы генерировался файл отчёта
-        return jsonify({'status': 'success', 'url': '#', 'report': report})
+        report, _ = report_generator.get_daily_report()
+        # Сам файл собирается потоково по ссылке; здесь только сводка и адрес выгрузки
+        export_format = request.args.get('format', 'csv')
+        return jsonify({
+            'status': 'success',
+            'url': f'/api/export/platform_stats?format={export_format}',
+            'exports': {table: f'/api/export/{table}?format={export_format}' for table in EXPORT_TABLES},
+            'report': report
+        })
     except Exception as e:
         return jsonify({'error': str(e)})
 
+@app.route('/api/export/<table>')
+def api_export_table(table):
+    try:
+        if table not in EXPORT_TABLES:
+            return jsonify({'status': 'error', 'message': f'Неизвестная таблица: {table}'}), 404
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'status': 'error', 'message': f'Неподдерживаемый формат: {export_format}'}), 400
+        if export_format == 'parquet' and pq is None:
+            return jsonify({'status': 'error', 'message': 'Для Parquet нужен пакет pyarrow'}), 400
+        
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = parse_stats_timestamp(since) if since else None
+        until = parse_stats_timestamp(until) if until else None
+        page_size = min(max(request.args.get('page_size', 5000, type=int), 100), 50000)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    pages = iter_export_pages(table, since, until, page_size)
+    # stream_with_context держит соединение из пула до конца выгрузки
+    return Response(stream_with_context(EXPORT_WRITERS[export_format](table, pages)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{table}_{datetime.now().strftime("%Y%m%d_%H%M")}.{extension}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/toggle-crosspost', methods=['POST'])
 def api_toggle_crosspost():
     try:
         enabled = request.json.get('enabled', False)
         
-        conn = sqlite3.connect('lucifer_analytics.db')
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE automation_status 
@@ -3709,7 +6556,6 @@ def api_toggle_crosspost():
             WHERE feature = 'crossposting'
         ''', (1 if enabled else 0,))
         conn.commit()
-        conn.close()
         
         return jsonify({'status': 'success', 'enabled': enabled})
     except Exception as e:
@@ -3726,7 +6572,7 @@ def api_instagram_dm_automation():
         if action == 'enable':
             instagram_dm_automation.enabled = True
             # Обновление статуса в БД
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE automation_status 
@@ -3734,12 +6580,11 @@ def api_instagram_dm_automation():
                 WHERE feature = 'dm_automation'
             ''', (datetime.now().isoformat(),))
             conn.commit()
-            conn.close()
             return jsonify({'status': 'success', 'message': 'DM автоматизация включена'})
             
         elif action == 'disable':
             instagram_dm_automation.enabled = False
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE automation_status 
@@ -3747,7 +6592,6 @@ def api_instagram_dm_automation():
                 WHERE feature = 'dm_automation'
             ''')
             conn.commit()
-            conn.close()
             return jsonify({'status': 'success', 'message': 'DM автоматизация выключена'})
             
         elif action == 'process_dm':
@@ -3760,6 +6604,66 @@ def api_instagram_dm_automation():
     stats = instagram_dm_automation.get_dm_stats()
     return jsonify(stats)
 
+@app.route('/api/youtube/analytics')
+def api_youtube_analytics():
+    try:
+        return jsonify(platform_client.run(platform_client.youtube_analytics()))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/instagram/posts')
+def api_instagram_posts():
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        return jsonify(platform_client.run(platform_client.instagram_posts(limit)))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/connect-instagram', methods=['POST'])
+def api_connect_instagram():
+    """Проверка токена на всех аккаунтах и первый снимок их статистики"""
+    try:
+        accounts = platform_client.run(platform_client.instagram_accounts())
+        # platform_stats хранит одну точку на платформу и момент времени (ключ дедупликации
+        # (platform, created_at)): аккаунты сводятся в одну строку - сумма подписчиков и
+        # вовлечённость, взвешенная по подписчикам
+        followers = sum(account['followers'] for account in accounts)
+        weighted = sum(account['followers'] * sum(post['engagement_rate'] for post in account['posts']) / len(account['posts'])
+                       for account in accounts if account['posts'])
+        ingest_platform_stats([{
+            'platform': 'instagram',
+            'followers': followers,
+            'engagement': round(weighted / followers, 2) if followers else 0.0,
+            'views': 0,
+            'timestamp': int(time.time())
+        }])
+        return jsonify({'status': 'success', 'accounts': [{'username': account['username'], 'followers': account['followers']}
+                                                         for account in accounts]})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/api/platforms/live')
+def api_platforms_live():
+    try:
+        return jsonify(platform_client.run(platform_client.snapshot()))
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/instagram/dm-batch', methods=['POST'])
+def api_instagram_dm_batch():
+    try:
+        data = request.json or {}
+        dms = data.get('dms', []) if isinstance(data, dict) else None
+        if not isinstance(dms, list):
+            return jsonify({'status': 'error', 'message': 'dms должен быть списком'}), 400
+        for index, dm in enumerate(dms):
+            if not isinstance(dm, dict):
+                return jsonify({'status': 'error',
+                                'message': f'dms[{index}]: ожидается объект с sender_id и message_text'}), 400
+        return jsonify(instagram_dm_automation.process_dm_batch(dms))
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/api/content/generate-trading', methods=['POST'])
 def api_generate_trading_content():
     try:
@@ -3787,6 +6691,25 @@ def api_generate_trading_content():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/content/generate-batch', methods=['POST'])
+def api_generate_content_batch():
+    try:
+        data = request.json or {}
+        count = min(max(int(data.get('count', 100)), 1), 10000)
+        content_type = data.get('type', 'random')
+        # С seed набор кандидатов воспроизводим; без него - общий генератор приложения
+        generator = content_generator
+        if data.get('seed') is not None:
+            generator = ContentGenerator(safety_controller, seed=data['seed'])
+        
+        return jsonify({
+            'status': 'success',
+            'count': count,
+            'posts': generator.generate_many(count, content_type)
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/api/automation/crosspost', methods=['POST'])
 def api_crosspost():
     try:
@@ -3804,27 +6727,29 @@ def api_crosspost():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/automation/crosspost/<int:job_id>')
+def api_crosspost_status(job_id):
+    try:
+        job = crosspost_queue.get_status(job_id)
+        if job is None:
+            return jsonify({'status': 'error', 'message': 'Задача не найдена'}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/api/reports/daily')
 def api_daily_report():
     try:
-        report = report_generator.generate_daily_report()
+        # Готовый отчёт из кэша; новая строка в daily_reports появляется только при изменении данных
+        report, cached = report_generator.get_daily_report()
         
         if report.get('error'):
             return jsonify({'status': 'error', 'message': report['error']})
         
-        # Сохранение отчета в БД
-        conn = sqlite3.connect('lucifer_analytics.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO daily_reports (report_date, report_data, sent)
-            VALUES (?, ?, 1)
-        ''', (report['date'], json.dumps(report)))
-        conn.commit()
-        conn.close()
-        
         return jsonify({
             'status': 'success',
-            'report': report
+            'report': report,
+            'cached': cached
         })
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -3832,10 +6757,27 @@ def api_daily_report():
 @app.route('/api/reports/weekly')
 def api_weekly_report():
     try:
-        report = report_generator.generate_weekly_report()
+        report, cached = report_generator.get_weekly_report()
         return jsonify({
             'status': 'success',
-            'report': report
+            'report': report,
+            'cached': cached
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+@app.route('/api/reports/range')
+def api_range_report():
+    try:
+        until = parse_stats_timestamp(request.args.get('until'))
+        since = parse_stats_timestamp(request.args.get('since', until - 30 * 86400))
+        if since >= until:
+            return jsonify({'status': 'error', 'message': 'since должен быть раньше until'})
+        report, cached = report_generator.get_range_report(since, until)
+        return jsonify({
+            'status': 'success',
+            'report': report,
+            'cached': cached
         })
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
@@ -3843,7 +6785,7 @@ def api_weekly_report():
 @app.route('/api/automation/detailed-status')
 def api_automation_detailed_status():
     try:
-        conn = sqlite3.connect('lucifer_analytics.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -3861,13 +6803,13 @@ def api_automation_detailed_status():
             }
         
         # Добавление текущих метрик
-        cursor.execute('SELECT COUNT(*) FROM instagram_dms WHERE datetime(timestamp) >= datetime("now", "-24 hours")')
+        since = int(time.time()) - 86400
+        cursor.execute('SELECT COUNT(*) FROM instagram_dms WHERE created_at >= ?', (since,))
         dm_count_24h = cursor.fetchone()[0]
         
-        cursor.execute('SELECT COUNT(*) FROM content_plan WHERE status = "posted" AND datetime(schedule_time) >= datetime("now", "-24 hours")')
+        cursor.execute("SELECT COUNT(*) FROM content_plan WHERE status = 'posted' AND schedule_epoch >= ?", (since,))
         posts_24h = cursor.fetchone()[0]
         
-        conn.close()
         
         # Проверка лимитов безопасности
         safety_status = {
@@ -3907,6 +6849,30 @@ def api_smart_reply():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/smart-reply/templates', methods=['GET', 'POST'])
+def api_smart_reply_templates():
+    try:
+        if request.method == 'POST':
+            data = request.json or {}
+            try:
+                smart_auto_reply.reload(
+                    templates=data.get('templates'),
+                    keywords=data.get('keywords'),
+                    priorities=data.get('priorities')
+                )
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+        else:
+            smart_auto_reply.refresh()
+        return jsonify({
+            'status': 'success',
+            'templates': smart_auto_reply.templates,
+            'keywords': smart_auto_reply.keywords,
+            'priorities': smart_auto_reply.priorities
+        })
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
 @app.route('/api/try-feature', methods=['POST'])
 def api_try_feature():
     try:
@@ -3922,84 +6888,787 @@ def api_try_feature():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+class StatsPartitionManager:
+    """Месячные партиции истории platform_stats в отдельных файлах SQLite.
+    Горячая таблица platform_stats принимает все записи (и триггеры роллапов);
+    закрытый месяц, вышедший из горячего окна, переносится в свой файл: строки
+    копируются, файл становится read-only, и из горячей таблицы удаляются ровно
+    скопированные строки - id не больше stats_partitions.max_id этого месяца.
+    Строка, пришедшая в уже запечатанный месяц позже, остаётся в горячей таблице
+    до следующего переноса и видна в истории. Сырую историю читают iter_history
+    и экспорт, отсекая партиции по диапазону; отчёты и прогноз берут роллапы.
+    Удаление месяца - удаление файла"""
+    
+    COLUMNS = 'id, platform, followers, engagement, views, timestamp, created_at'
+    
+    def __init__(self, directory=None, hot_days=7, keep_months=None, chunk_rows=5000, pause=0.05):
+        self.directory = directory or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'stats_partitions')
+        self.hot_days = hot_days
+        if keep_months is None:
+            # Сколько прошлых месяцев хранить; 0 - всю историю
+            keep_months = int(os.environ.get('STATS_PARTITION_KEEP_MONTHS', '0'))
+        self.keep_months = keep_months
+        self.chunk_rows = chunk_rows
+        self.pause = pause
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def month_bounds(ts):
+        start = datetime.fromtimestamp(ts, timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start.strftime('%Y%m'), int(start.timestamp()), int(end.timestamp())
+    
+    def partitions(self, since=None, until=None, cursor=None):
+        """Партиции, пересекающие [since, until): отсечение по границам месяца"""
+        cursor = cursor or get_db().cursor()
+        cursor.execute('''
+            SELECT month, path, start_epoch, end_epoch, rows FROM stats_partitions
+            WHERE end_epoch > ? AND start_epoch < ?
+            ORDER BY start_epoch
+        ''', (since if since is not None else -2 ** 62, until if until is not None else 2 ** 62))
+        return cursor.fetchall()
+    
+    def sealed_until(self, cursor=None):
+        cursor = cursor or get_db().cursor()
+        return cursor.execute('SELECT COALESCE(MAX(end_epoch), 0) FROM stats_partitions').fetchone()[0]
+    
+    def existing_keys(self, keys, cursor=None):
+        """Ключи (platform, created_at) из keys, уже лежащие в запечатанных партициях:
+        точечные запросы по индексу created_at, по одному открытию файла на месяц"""
+        cursor = cursor or get_db().cursor()
+        registry = dict(cursor.execute('SELECT month, path FROM stats_partitions').fetchall())
+        by_month = collections.defaultdict(set)
+        for key in keys:
+            by_month[self.month_bounds(key[1])[0]].add(key)
+        found = set()
+        for month, month_keys in by_month.items():
+            if month not in registry:
+                continue
+            part = self.open_partition(registry[month])
+            try:
+                for key in month_keys:
+                    if part.execute('SELECT 1 FROM platform_stats WHERE platform = ? AND created_at = ? LIMIT 1',
+                                    key).fetchone():
+                        found.add(key)
+            finally:
+                part.close()
+        return found
+    
+    def history_floor(self, now=None):
+        """Начало самого старого хранимого месяца; 0 - хранится вся история"""
+        if not self.keep_months:
+            return 0
+        _, floor, _ = self.month_bounds(now or time.time())
+        for _ in range(self.keep_months):
+            _, floor, _ = self.month_bounds(floor - 1)
+        return floor
+    
+    def seal_closed_months(self):
+        """Переносит в файлы все закрытые месяцы старше горячего окна; повторный запуск
+        дописывает в запечатанный месяц опоздавшие строки (INSERT OR IGNORE по id)
+        и доудаляет скопированное, если прошлый перенос прервался"""
+        with self.lock:
+            conn = get_db()
+            cutoff = int(time.time()) - self.hot_days * 86400
+            oldest = conn.execute('SELECT MIN(created_at) FROM platform_stats').fetchone()[0]
+            sealed = []
+            if oldest is None:
+                return sealed
+            os.makedirs(self.directory, exist_ok=True)
+            month, start, end = self.month_bounds(oldest)
+            while end <= cutoff:
+                has_rows = conn.execute('''
+                    SELECT 1 FROM platform_stats WHERE created_at >= ? AND created_at < ? LIMIT 1
+                ''', (start, end)).fetchone()
+                if has_rows:
+                    sealed.append(self._seal(conn, month, start, end))
+                month, start, end = self.month_bounds(end)
+            return sealed
+    
+    def _seal(self, conn, month, start, end):
+        path = os.path.join(self.directory, f'platform_stats_{month}.db')
+        if os.path.exists(path):
+            os.chmod(path, 0o644)
+        conn.commit()
+        conn.execute('ATTACH DATABASE ? AS stats_part', (path,))
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stats_part.platform_stats (
+                    id INTEGER PRIMARY KEY,
+                    platform TEXT NOT NULL,
+                    followers INTEGER DEFAULT 0,
+                    engagement REAL DEFAULT 0.0,
+                    views INTEGER DEFAULT 0,
+                    timestamp DATETIME,
+                    created_at INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS stats_part.idx_platform_stats_created ON platform_stats (created_at)')
+            # Пишется только файл партиции: блокировка записи основной БД не берётся
+            conn.execute(f'''
+                INSERT OR IGNORE INTO stats_part.platform_stats ({self.COLUMNS})
+                SELECT {self.COLUMNS} FROM main.platform_stats
+                WHERE created_at >= ? AND created_at < ?
+            ''', (start, end))
+            conn.commit()
+            rows, min_created, max_created, max_id = conn.execute('''
+                SELECT COUNT(*), MIN(created_at), MAX(created_at), MAX(id) FROM stats_part.platform_stats
+            ''').fetchone()
+        finally:
+            conn.execute('DETACH DATABASE stats_part')
+        os.chmod(path, 0o444)
+        # Реестр фиксируется до удаления: прерванный перенос оставит в горячей таблице
+        # копии с id <= max_id, их скрывает iter_history и доудалит следующий запуск
+        conn.execute('''
+            INSERT INTO stats_partitions (month, path, start_epoch, end_epoch, rows, min_created, max_created,
+                                          sealed_at, max_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (month) DO UPDATE SET
+                rows = excluded.rows, min_created = excluded.min_created, max_created = excluded.max_created,
+                sealed_at = excluded.sealed_at, max_id = excluded.max_id
+        ''', (month, path, start, end, rows, min_created, max_created, int(time.time()), max_id))
+        conn.commit()
+        return {'month': month, 'rows': rows, 'moved': self._remove_copied(conn, start, end, max_id)}
+    
+    def _remove_copied(self, conn, start, end, max_id):
+        """Удаляет из горячей таблицы только скопированные строки месяца (id <= max_id,
+        id монотонны) порциями по индексу created_at, с паузами для других писателей"""
+        moved = 0
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute('''
+                    DELETE FROM platform_stats WHERE id IN (
+                        SELECT id FROM platform_stats
+                        WHERE created_at >= ? AND created_at < ? AND id <= ?
+                        LIMIT ?
+                    )
+                ''', (start, end, max_id, self.chunk_rows))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            moved += cursor.rowcount
+            if cursor.rowcount < self.chunk_rows:
+                return moved
+            time.sleep(self.pause)
+    
+    def drop_partition(self, month):
+        """O(1): строка реестра и файл, без сканирования и DELETE по строкам"""
+        conn = get_db()
+        row = conn.execute('SELECT path FROM stats_partitions WHERE month = ?', (month,)).fetchone()
+        if not row:
+            return False
+        conn.execute('DELETE FROM stats_partitions WHERE month = ?', (month,))
+        conn.commit()
+        try:
+            os.chmod(row[0], 0o644)
+            os.remove(row[0])
+        except FileNotFoundError:
+            pass
+        return True
+    
+    def drop_expired(self):
+        floor = self.history_floor()
+        if not floor:
+            return []
+        conn = get_db()
+        expired = [row[0] for row in conn.execute('SELECT month FROM stats_partitions WHERE end_epoch <= ?', (floor,))]
+        for month in expired:
+            self.drop_partition(month)
+        return expired
+    
+    def open_partition(self, path):
+        # Без immutable: опоздавшие строки дописываются в запечатанный месяц при следующем переносе
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    
+    def iter_history(self, since=None, until=None, page_size=5000):
+        """Страницы истории за [since, until): нужные партиции по порядку, затем горячая
+        таблица без строк, уже скопированных в партиции"""
+        filters, params = [], []
+        if since is not None:
+            filters.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            filters.append('created_at < ?')
+            params.append(until)
+        
+        cursor = get_db().cursor()
+        for _, path, _, _, _ in self.partitions(since, until, cursor):
+            part = self.open_partition(path)
+            try:
+                yield from self._pages(part.cursor(), filters, params, page_size)
+            finally:
+                part.close()
+        # Партиция без max_id (запечатана до v14) скрывает весь свой месяц до переноса
+        hot_filters = filters + ['''NOT EXISTS (
+            SELECT 1 FROM stats_partitions s
+            WHERE platform_stats.created_at >= s.start_epoch AND platform_stats.created_at < s.end_epoch
+              AND platform_stats.id <= COALESCE(s.max_id, 9223372036854775807)
+        )''']
+        yield from self._pages(cursor, hot_filters, params, page_size)
+    
+    def _pages(self, cursor, filters, params, page_size):
+        last_id = -1
+        where = ' AND '.join(filters + ['id > ?'])
+        while True:
+            cursor.execute(f'''
+                SELECT {self.COLUMNS} FROM platform_stats WHERE {where}
+                ORDER BY id LIMIT ?
+            ''', (*params, last_id, page_size))
+            page = cursor.fetchall()
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last_id = page[-1][0]
+
+stats_partitions = StatsPartitionManager()
+
+@app.route('/api/maintenance/partitions')
+def api_stats_partitions():
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        cursor = get_db().cursor()
+        partitions = stats_partitions.partitions(parse_stats_timestamp(since) if since else None,
+                                                 parse_stats_timestamp(until) if until else None, cursor)
+        return jsonify({
+            'directory': stats_partitions.directory,
+            'hot_since': datetime.fromtimestamp(stats_partitions.sealed_until(cursor), timezone.utc).isoformat(),
+            'keep_months': stats_partitions.keep_months,
+            'history_floor': datetime.fromtimestamp(stats_partitions.history_floor(), timezone.utc).isoformat(),
+            'partitions': [{'month': month, 'rows': rows,
+                            'from': datetime.fromtimestamp(start, timezone.utc).isoformat(),
+                            'to': datetime.fromtimestamp(end, timezone.utc).isoformat(),
+                            'bytes': os.path.getsize(path) if os.path.exists(path) else None}
+                           for month, path, start, end, rows in partitions]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+# Срок хранения по таблицам. days можно переопределить переменной RETENTION_DAYS_<ТАБЛИЦА>
+# (0 - не чистить). range_column/step задают шаг порций: по rowid или по колонке ключа
+RETENTION_POLICIES = {
+    # platform_stats здесь нет: строки уходят из горячей таблицы переносом в месячные
+    # партиции (StatsPartitionManager), а хранение ограничивает STATS_PARTITION_KEEP_MONTHS
+    'stats_rollup_hourly': {'column': 'bucket', 'days': 90, 'range_column': 'bucket', 'step': 7 * 86400},
+    'instagram_dms': {'column': 'created_at', 'days': 180},
+    'instagram_dm_deferred': {'column': 'created_at', 'days': 7},
+    # Запланированные посты не удаляются, как бы давно они ни были созданы
+    'content_plan': {'column': 'created_at', 'days': 90, 'where': "status != 'scheduled'"},
+    'daily_reports': {'column': 'created_at', 'days': 180},
+    'job_runs': {'column': 'started_at', 'days': 30}
+}
+
+class RetentionEngine:
+    """Очистка по срокам хранения короткими порциями: каждая порция - отдельная
+    транзакция на диапазон rowid (или ключа), между порциями пауза, чтобы запросы
+    дашборда успевали получить блокировку записи. После удаления освобождённые
+    страницы возвращаются инкрементальным VACUUM тоже порциями"""
+    
+    def __init__(self, policies=None, chunk_rows=5000, pause=0.05, vacuum_pages=2000):
+        self.policies = {}
+        for table, policy in (policies or RETENTION_POLICIES).items():
+            policy = dict(policy)
+            override = os.environ.get(f'RETENTION_DAYS_{table.upper()}')
+            if override is not None:
+                policy['days'] = int(override)
+            self.policies[table] = policy
+        self.chunk_rows = chunk_rows
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.last_report = None
+    
+    def run(self, tables=None):
+        started = time.perf_counter()
+        conn = get_db()
+        report = {'tables': {}, 'started_at': datetime.now().isoformat()}
+        for table in tables or self.policies:
+            policy = self.policies[table]
+            if policy['days'] > 0:
+                report['tables'][table] = self.purge(conn, table, policy)
+        report['vacuum'] = self.vacuum(conn)
+        report['deleted'] = sum(item['deleted'] for item in report['tables'].values())
+        report['lock_ms'] = round(sum(item['lock_ms'] for item in report['tables'].values())
+                                  + report['vacuum']['lock_ms'], 1)
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        self.last_report = report
+        return report
+    
+    def purge(self, conn, table, policy):
+        range_column = policy.get('range_column', 'rowid')
+        step = policy.get('step', self.chunk_rows)
+        condition = f"{policy['column']} < ?"
+        if policy.get('where'):
+            condition += f" AND {policy['where']}"
+        cutoff = int(time.time()) - policy['days'] * 86400
+        
+        # Границы диапазона читаются без блокировки записи
+        low, high = conn.execute(f'SELECT MIN({range_column}), MAX({range_column}) FROM {table} WHERE {condition}',
+                                 (cutoff,)).fetchone()
+        deleted, chunks, lock_total, lock_max = 0, 0, 0.0, 0.0
+        while low is not None and low <= high:
+            lock_started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute(f'''
+                    DELETE FROM {table}
+                    WHERE {range_column} >= ? AND {range_column} < ? AND {condition}
+                ''', (low, low + step, cutoff))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            lock_ms = (time.perf_counter() - lock_started) * 1000
+            lock_total += lock_ms
+            lock_max = max(lock_max, lock_ms)
+            deleted += max(cursor.rowcount, 0)
+            chunks += 1
+            low += step
+            if low <= high:
+                time.sleep(self.pause)
+        return {'deleted': deleted, 'chunks': chunks, 'lock_ms': round(lock_total, 1),
+                'max_lock_ms': round(lock_max, 1), 'retention_days': policy['days']}
+    
+    def vacuum(self, conn):
+        """PRAGMA incremental_vacuum порциями; без auto_vacuum=INCREMENTAL ничего не делает"""
+        result = {'pages_freed': 0, 'lock_ms': 0.0}
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            result['skipped'] = 'auto_vacuum не INCREMENTAL: flask convert-incremental-vacuum'
+            return result
+        while True:
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free_pages:
+                break
+            lock_started = time.perf_counter()
+            # execute() делает один шаг прагмы (одна страница); executescript выполняет её до конца
+            conn.executescript(f'PRAGMA incremental_vacuum({self.vacuum_pages});')
+            result['lock_ms'] += (time.perf_counter() - lock_started) * 1000
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            result['pages_freed'] += free_pages - remaining
+            if remaining >= free_pages:
+                break
+            time.sleep(self.pause)
+        result['lock_ms'] = round(result['lock_ms'], 1)
+        return result
+
+retention_engine = RetentionEngine()
+
+@app.cli.command('convert-incremental-vacuum')
+def convert_incremental_vacuum():
+    """Однократный перевод существующей БД в auto_vacuum=INCREMENTAL.
+    Полный VACUUM переписывает файл под эксклюзивной блокировкой - запускать в окно обслуживания"""
+    conn = get_db()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        print("✅ auto_vacuum уже INCREMENTAL")
+        return
+    started = time.perf_counter()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    print(f"✅ БД переведена в auto_vacuum=INCREMENTAL за {time.perf_counter() - started:.1f} с")
+
+@app.route('/api/maintenance/retention')
+def api_retention_status():
+    try:
+        return jsonify({'policies': retention_engine.policies, 'last_run': retention_engine.last_report})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+class ScheduledJob:
+    """Задача планировщика: период в секундах (every) или время суток "HH:MM" (at, локальное)"""
+    
+    def __init__(self, name, func, every=None, at=(), feature=None, catch_up=False):
+        self.name = name
+        self.func = func
+        self.every = every
+        self.at = tuple(tuple(int(part) for part in slot.split(':')) for slot in at)
+        self.feature = feature
+        self.catch_up = catch_up
+        self.running = False
+        self.next_run = None
+        self.stats = {'runs': 0, 'failures': 0, 'overlaps': 0, 'missed': 0,
+                      'last_run': None, 'last_duration_ms': None, 'last_status': None}
+    
+    def _day_slots(self, day):
+        return [datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute).timestamp()
+                for hour, minute in self.at]
+    
+    def next_after(self, ts):
+        if self.every:
+            return ts + self.every
+        today = datetime.fromtimestamp(ts).date()
+        return min(slot for day in (today, today + timedelta(days=1))
+                   for slot in self._day_slots(day) if slot > ts)
+    
+    def previous_before(self, ts):
+        if self.every:
+            return ts - self.every
+        today = datetime.fromtimestamp(ts).date()
+        return max(slot for day in (today - timedelta(days=1), today)
+                   for slot in self._day_slots(day) if slot <= ts)
+    
+    def missed_between(self, due, now):
+        """Сколько срабатываний пропущено в (due, now]: они схлопываются в один запуск"""
+        if self.every:
+            return int((now - due) // self.every)
+        missed, slot = 0, self.next_after(due)
+        while slot <= now and missed < 1000:
+            missed += 1
+            slot = self.next_after(slot)
+        return missed
+
+class LeaderLease:
+    """Аренда лидерства в строке leader_leases: лидер продлевает её каждые heartbeat
+    секунд, остальные процессы забирают просроченную аренду. Лидер сам считает
+    себя лидером только до истечения аренды с запасом, так что два лидера
+    одновременно не работают даже при зависшем heartbeat"""
+    
+    def __init__(self, name, ttl=10, heartbeat=3, on_elected=None):
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.on_elected = on_elected
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+        self.valid_until = 0.0
+        # Номер срока лидерства: растёт при каждом избрании этого процесса
+        self.generation = 0
+        self.stopped = threading.Event()
+    
+    @property
+    def is_leader(self):
+        return time.time() < self.valid_until
+    
+    def try_acquire(self):
+        now = time.time()
+        conn = get_db()
+        cursor = conn.execute('''
+            UPDATE leader_leases
+            SET holder = ?, expires_at = ?, heartbeat_at = ?,
+                acquired_at = CASE WHEN holder = ? THEN acquired_at ELSE ? END
+            WHERE name = ? AND (holder = ? OR expires_at < ?)
+        ''', (self.holder, now + self.ttl, now, self.holder, now, self.name, self.holder, now))
+        if cursor.rowcount == 0:
+            conn.execute('''
+                INSERT OR IGNORE INTO leader_leases (name, holder, expires_at, heartbeat_at, acquired_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (self.name, self.holder, now + self.ttl, now, now))
+            acquired = conn.execute('SELECT changes()').fetchone()[0] == 1
+        else:
+            acquired = True
+        conn.commit()
+        was_leader = self.is_leader
+        # Запас в один heartbeat: перестаём действовать раньше, чем аренду смогут забрать
+        self.valid_until = now + self.ttl - self.heartbeat if acquired else 0.0
+        if acquired and not was_leader:
+            self.generation += 1
+            print(f"✅ Процесс {self.holder} стал лидером ({self.name})")
+            if self.on_elected:
+                self.on_elected()
+        return acquired
+    
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.try_acquire()
+            except Exception as e:
+                self.valid_until = 0.0
+                print(f"❌ Ошибка продления аренды лидера: {e}")
+            finally:
+                finish_thread_db()
+            self.stopped.wait(self.heartbeat)
+    
+    def release(self):
+        """Досрочный отказ от аренды при штатной остановке: преемник заберёт её сразу"""
+        self.stopped.set()
+        if not self.valid_until:
+            return
+        self.valid_until = 0.0
+        try:
+            conn = get_db()
+            conn.execute('UPDATE leader_leases SET expires_at = 0 WHERE name = ? AND holder = ?',
+                         (self.name, self.holder))
+            conn.commit()
+        except Exception:
+            pass
+    
+    def status(self):
+        cursor = get_db().cursor()
+        cursor.execute('''
+            SELECT holder, expires_at, heartbeat_at, acquired_at FROM leader_leases WHERE name = ?
+        ''', (self.name,))
+        row = cursor.fetchone()
+        return {
+            'self': self.holder,
+            'is_leader': self.is_leader,
+            'leader': row[0] if row and row[1] > time.time() else None,
+            'heartbeat_at': datetime.fromtimestamp(row[2]).isoformat() if row else None,
+            'leader_since': datetime.fromtimestamp(row[3]).isoformat() if row else None
+        }
+
+JOB_SKIPPED = 'skipped'
+
+class JobScheduler:
+    """Планировщик на куче таймеров: поток-диспетчер спит ровно до ближайшего срока
+    и отдаёт задачу в ограниченный пул потоков, так что долгая задача не задерживает
+    остальные. Пропущенные срабатывания схлопываются в один запуск, повторный запуск
+    ещё работающей задачи не выполняется и учитывается как наложение.
+    С leader задачи выполняются только в процессе-лидере, остальные лишь ведут расписание.
+    Задача, которой в этот раз нечего делать, возвращает JOB_SKIPPED"""
+    
+    def __init__(self, workers=3, leader=None):
+        self.leader = leader
+        self.jobs = {}
+        self.heap = []
+        self.sequence = 0
+        self.started = False
+        self.recovered_generation = None
+        self.cond = threading.Condition()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.stopped = False
+    
+    def add_job(self, name, func, every=None, at=(), feature=None, catch_up=False):
+        job = ScheduledJob(name, func, every=every, at=at, feature=feature, catch_up=catch_up)
+        self.jobs[name] = job
+        self._push(job, job.next_after(time.time()))
+        return job
+    
+    def _push(self, job, due):
+        with self.cond:
+            job.next_run = due
+            self.sequence += 1
+            heapq.heappush(self.heap, (due, self.sequence, job))
+            self.cond.notify()
+    
+    def recover(self):
+        """Догоняющий запуск задач, чей срок наступил, пока процесс не работал.
+        Вызывается и из on_elected, и при старте run(): догоняем один раз за срок лидерства"""
+        generation = self.leader.generation if self.leader is not None else 0
+        with self.cond:
+            # До run() расписание ещё не собрано - догонит сам run()
+            if not self.started or self.recovered_generation == generation:
+                return
+            self.recovered_generation = generation
+        cursor = get_db().cursor()
+        now = time.time()
+        for job in self.jobs.values():
+            if not job.catch_up:
+                continue
+            cursor.execute('SELECT MAX(scheduled_for) FROM job_runs WHERE job = ?', (job.name,))
+            last = cursor.fetchone()[0]
+            previous = job.previous_before(now)
+            # Без истории (первый запуск) не догоняем; старше суток - тоже
+            if last is None or previous <= last + 1 or now - previous >= 86400:
+                continue
+            with self.cond:
+                # Догоняющий запуск этого срока уже в куче (прошлое избрание) - второй не нужен
+                if any(queued_job is job and queued_due <= previous for queued_due, _, queued_job in self.heap):
+                    continue
+                job.stats['missed'] += 1
+                self._push(job, previous)
+    
+    def run(self):
+        with self.cond:
+            self.started = True
+        if self.leader is None or self.leader.is_leader:
+            self.recover()
+        while not self.stopped:
+            with self.cond:
+                while True:
+                    if self.stopped:
+                        return
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    due, _, job = self.heap[0]
+                    delay = due - time.time()
+                    if delay <= 0:
+                        heapq.heappop(self.heap)
+                        break
+                    self.cond.wait(delay)
+            self._dispatch(job, due)
+    
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.pool.shutdown(wait=False)
+    
+    def _dispatch(self, job, due):
+        now = time.time()
+        missed = job.missed_between(due, now)
+        job.stats['missed'] += missed
+        # Если в куче уже есть плановый запуск (после догоняющего), второй не добавляем
+        with self.cond:
+            queued = [queued_due for queued_due, _, queued_job in self.heap if queued_job is job]
+        if queued:
+            job.next_run = min(queued)
+        else:
+            self._push(job, job.next_after(now))
+        if self.leader is not None and not self.leader.is_leader:
+            return
+        if job.running:
+            job.stats['overlaps'] += 1
+            self._record(job, due, now, 0.0, 'overlap', None, missed)
+            return
+        job.running = True
+        self.pool.submit(self._execute, job, due, missed)
+    
+    def _execute(self, job, due, missed):
+        started = time.time()
+        status, error = 'completed', None
+        self._update_status(job, 'running')
+        try:
+            if job.func() == JOB_SKIPPED:
+                status = JOB_SKIPPED
+        except Exception as e:
+            status, error = 'failed', str(e)
+            print(f"❌ Задача {job.name} завершилась ошибкой: {e}")
+        finally:
+            job.running = False
+            finish_thread_db()
+        duration_ms = (time.time() - started) * 1000
+        job.stats['runs'] += 1
+        job.stats['failures'] += status == 'failed'
+        job.stats['last_run'] = datetime.fromtimestamp(started).isoformat()
+        job.stats['last_duration_ms'] = round(duration_ms, 1)
+        job.stats['last_status'] = status
+        self._record(job, due, started, duration_ms, status, error, missed)
+        self._update_status(job, status, started)
+    
+    def _record(self, job, due, started, duration_ms, status, error, missed):
+        try:
+            conn = get_db()
+            conn.execute('''
+                INSERT INTO job_runs (job, scheduled_for, started_at, late_ms, duration_ms, status, error, missed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (job.name, int(due), int(started), round((started - due) * 1000, 1),
+                  round(duration_ms, 1), status, error, missed))
+            conn.commit()
+        except Exception as e:
+            print(f"❌ Не удалось записать историю задачи {job.name}: {e}")
+    
+    def _update_status(self, job, status, started=None):
+        if not job.feature:
+            return
+        try:
+            conn = get_db()
+            if started is None:
+                conn.execute('UPDATE automation_status SET status = ? WHERE feature = ?', (status, job.feature))
+            else:
+                conn.execute('''
+                    UPDATE automation_status SET last_run = ?, next_run = ?, status = ?
+                    WHERE feature = ?
+                ''', (datetime.fromtimestamp(started).isoformat(),
+                      datetime.fromtimestamp(job.next_run).strftime('%Y-%m-%d %H:%M:%S'), status, job.feature))
+            conn.commit()
+        except Exception as e:
+            print(f"❌ Не удалось обновить статус {job.feature}: {e}")
+    
+    def status(self):
+        return {name: dict(job.stats, running=job.running, feature=job.feature,
+                           next_run=datetime.fromtimestamp(job.next_run).isoformat() if job.next_run else None)
+                for name, job in self.jobs.items()}
+
+scheduler_lease = LeaderLease('background_jobs', ttl=10, heartbeat=3)
+job_scheduler = JobScheduler(workers=3, leader=scheduler_lease)
+# Новый лидер догоняет задачи, которые предыдущий не успел выполнить
+scheduler_lease.on_elected = job_scheduler.recover
+atexit.register(scheduler_lease.release)
+
+@app.route('/api/automation/jobs')
+def api_automation_jobs():
+    try:
+        cursor = get_db().cursor()
+        cursor.execute('''
+            SELECT job, scheduled_for, started_at, late_ms, duration_ms, status, error, missed
+            FROM job_runs ORDER BY id DESC LIMIT 50
+        ''')
+        history = [{
+            'job': row[0],
+            'scheduled_for': datetime.fromtimestamp(row[1]).isoformat(),
+            'started_at': datetime.fromtimestamp(row[2]).isoformat(),
+            'late_ms': row[3],
+            'duration_ms': row[4],
+            'status': row[5],
+            'error': row[6],
+            'missed': row[7]
+        } for row in cursor.fetchall()]
+        return jsonify({'jobs': job_scheduler.status(), 'leader': scheduler_lease.status(), 'history': history})
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
 def background_tasks():
     def cleanup_task():
         try:
-            conn = sqlite3.connect('lucifer_analytics.db')
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM platform_stats WHERE timestamp < datetime("now", "-7 days")')
-            conn.commit()
-            conn.close()
-            print("✅ Фоновая очистка выполнена")
+            # Сначала закрытые месяцы уходят в партиции, затем очистка по RETENTION_POLICIES;
+            # дневной роллап хранится бессрочно
+            sealed = stats_partitions.seal_closed_months()
+            if sealed:
+                print(f"✅ Запечатаны партиции platform_stats: {sealed}")
+            report = retention_engine.run()
+            dropped = stats_partitions.drop_expired()
+            if dropped:
+                print(f"✅ Удалены устаревшие партиции: {dropped}")
+            print(f"✅ Фоновая очистка выполнена: удалено {report['deleted']} строк, "
+                  f"блокировка записи {report['lock_ms']} мс за {report['seconds']} с")
         except Exception as e:
             print(f"❌ Ошибка фоновой задачи: {e}")
+            raise
     
     def send_daily_report():
         try:
-            report = report_generator.generate_daily_report()
-            if not report.get('error'):
-                # Здесь можно добавить отправку email или в Telegram
-                print(f"✅ Ежедневный отчет сгенерирован: {report['date']}")
-                # Обновление статуса
-                conn = sqlite3.connect('lucifer_analytics.db')
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE automation_status 
-                    SET last_run = ?, next_run = ?, status = 'completed'
-                    WHERE feature = 'daily_reports'
-                ''', (datetime.now().isoformat(), 
-                      (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d 09:00:00')))
-                conn.commit()
-                conn.close()
+            report, _ = report_generator.get_daily_report()
+            if report.get('error'):
+                # Статус в automation_status выставляет планировщик по исходу задачи
+                raise RuntimeError(report['error'])
+            # Здесь можно добавить отправку email или в Telegram
+            print(f"✅ Ежедневный отчет сгенерирован: {report['date']}")
         except Exception as e:
             print(f"❌ Ошибка ежедневного отчета: {e}")
+            raise
     
     def send_weekly_report():
         try:
-            if datetime.now().weekday() == 0:  # Понедельник
-                report = report_generator.generate_weekly_report()
-                if not report.get('error'):
-                    print(f"✅ Недельный отчет сгенерирован: Неделя {report['week_number']}")
-                    # Обновление статуса
-                    conn = sqlite3.connect('lucifer_analytics.db')
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        UPDATE automation_status 
-                        SET last_run = ?, next_run = ?, status = 'completed'
-                        WHERE feature = 'weekly_reports'
-                    ''', (datetime.now().isoformat(),
-                          (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d 09:00:00')))
-                    conn.commit()
-                    conn.close()
+            if datetime.now().weekday() != 0:  # Отчёт только по понедельникам
+                return JOB_SKIPPED
+            report, _ = report_generator.get_weekly_report()
+            if report.get('error'):
+                raise RuntimeError(report['error'])
+            print(f"✅ Недельный отчет сгенерирован: Неделя {report['week_number']}")
         except Exception as e:
             print(f"❌ Ошибка недельного отчета: {e}")
+            raise
     
     def auto_generate_content():
         try:
             # Проверяем, включена ли автоматическая генерация
-            conn = sqlite3.connect('lucifer_analytics.db')
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute('SELECT enabled FROM automation_status WHERE feature = "content_generation"')
             result = cursor.fetchone()
-            conn.close()
             
-            if result and result[0]:
-                # Генерируем и планируем контент
-                schedule_result = content_generator.schedule_content(['instagram', 'telegram'])
-                if schedule_result.get('scheduled'):
-                    print(f"✅ Контент запланирован: {schedule_result['scheduled']} постов")
+            if not (result and result[0]):
+                return JOB_SKIPPED
+            # Генерируем и планируем контент
+            schedule_result = content_generator.schedule_content(['instagram', 'telegram'])
+            if schedule_result.get('error'):
+                raise RuntimeError(schedule_result['error'])
+            if schedule_result.get('scheduled'):
+                print(f"✅ Контент запланирован: {schedule_result['scheduled']} постов")
         except Exception as e:
             print(f"❌ Ошибка автогенерации контента: {e}")
+            raise
     
     def send_scheduled_report():
         try:
             # Check if email reporting is enabled and configured
             if email_reporter.enabled:
-                conn = sqlite3.connect('lucifer_analytics.db')
+                conn = get_db()
                 cursor = conn.cursor()
                 cursor.execute('SELECT report_frequency FROM email_settings ORDER BY id DESC LIMIT 1')
                 result = cursor.fetchone()
-                conn.close()
                 
                 if result:
                     frequency = result[0]
@@ -4025,25 +7694,34 @@ def background_tasks():
         except Exception as e:
             print(f"❌ Error in scheduled email report: {e}")
     
+    def process_deferred_dms():
+        try:
+            result = instagram_dm_automation.process_deferred_dms()
+            if result['status'] == 'error':
+                raise RuntimeError(result['message'])
+            if result.get('processed'):
+                print(f"✅ Отложенные DM обработаны: {result['processed']}, осталось в очереди: {result['deferred']}")
+        except Exception as e:
+            print(f"❌ Ошибка обработки отложенных DM: {e}")
+            raise
+    
     # Schedule tasks
-    schedule.every(6).hours.do(cleanup_task)
-    schedule.every().day.at("09:00").do(send_daily_report)  # Ежедневный отчет в 9:00
-    schedule.every().day.at("09:00").do(send_weekly_report)  # Проверка на недельный отчет по понедельникам
-    schedule.every().day.at("09:00").do(auto_generate_content)  # Генерация контента на 9:00
-    schedule.every().day.at("14:00").do(auto_generate_content)  # Генерация контента на 14:00
-    schedule.every().day.at("19:00").do(auto_generate_content)  # Генерация контента на 19:00
+    job_scheduler.add_job('cleanup', cleanup_task, every=6 * 3600)
+    job_scheduler.add_job('deferred_dms', process_deferred_dms, every=15 * 60)
+    job_scheduler.add_job('daily_report', send_daily_report, at=('09:00',),  # Ежедневный отчет в 9:00
+                          feature='daily_reports', catch_up=True)
+    job_scheduler.add_job('weekly_report', send_weekly_report, at=('09:00',),  # Проверка на недельный отчет по понедельникам
+                          feature='weekly_reports')
+    job_scheduler.add_job('auto_content', auto_generate_content, at=('09:00', '14:00', '19:00'),  # Генерация контента
+                          feature='content_generation', catch_up=True)
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    job_scheduler.run()
 
-# Start background tasks only once (for the main worker process)
-import os
-if not os.environ.get('BACKGROUND_STARTED'):
-    bg_thread = threading.Thread(target=background_tasks, daemon=True)
-    bg_thread.start()
-    os.environ['BACKGROUND_STARTED'] = 'true'
-    print("✅ Фоновые задачи запущены")
+# Расписание ведёт каждый процесс, а выполняет задачи только держатель аренды
+# leader_leases: при N воркерах gunicorn задачи идут один раз на всё развёртывание
+threading.Thread(target=scheduler_lease.run, daemon=True, name='leader-lease').start()
+threading.Thread(target=background_tasks, daemon=True, name='job-scheduler').start()
+print("✅ Фоновые задачи запущены")
 
 print("✅ Система готова к работе!")
 print("🌐 Дашборд доступен по веб-ссылке")
@@ -0,0 +1,48 @@
+import importlib
+import os
+import subprocess
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = 'main_1758965294462'
+# Рабочий процесс импортирует приложение целиком - как воркер gunicorn
+WORKER_PRELUDE = f'import sys\nsys.path.insert(0, {APP_DIR!r})\nimport {MODULE} as main\n'
+
+
+@pytest.fixture(scope='session')
+def app_dir(tmp_path_factory):
+    """Каталог с БД и файлами состояния: DB_PATH относительный, поэтому рабочий каталог теста"""
+    return tmp_path_factory.mktemp('app')
+
+
+@pytest.fixture(scope='session')
+def main(app_dir):
+    os.chdir(app_dir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    return importlib.import_module(MODULE)
+
+
+@pytest.fixture
+def client(main):
+    return main.app.test_client()
+
+
+def run_workers(cwd, body, count, env=None, timeout=120, prelude=WORKER_PRELUDE):
+    """Запускает count отдельных процессов Python с общим рабочим каталогом.
+    Индекс процесса - в WORKER_INDEX; возвращает stdout каждого, падение процесса - ошибка теста"""
+    processes = []
+    for index in range(count):
+        worker_env = dict(os.environ, WORKER_INDEX=str(index), **(env or {}))
+        processes.append(subprocess.Popen(
+            [sys.executable, '-c', prelude + body], cwd=cwd, env=worker_env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        ))
+    outputs = []
+    for process in processes:
+        stdout, stderr = process.communicate(timeout=timeout)
+        assert process.returncode == 0, stderr[-2000:]
+        outputs.append(stdout)
+    return outputs
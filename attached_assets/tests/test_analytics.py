@@ -0,0 +1,97 @@
+import math
+import statistics
+import time
+
+import pytest
+
+
+def percentile(values, q):
+    """Линейная интерполяция между соседними порядковыми статистиками, как в numpy"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def reference_metrics(rows, window=7):
+    """Прежний расчёт на чистом Python по строкам (followers, engagement, views) в порядке времени"""
+    followers = [row[0] for row in rows]
+    engagement = [row[1] for row in rows]
+    window = min(window, len(engagement))
+    base = followers[-window]
+    std = statistics.pstdev(engagement)
+    return {
+        'samples': len(rows),
+        'followers': followers[-1],
+        'engagement': round(engagement[-1], 2),
+        'views': rows[-1][2],
+        'engagement_rolling_mean': round(sum(engagement[-window:]) / window, 2),
+        'followers_growth_rate': round((followers[-1] - base) / base * 100 if base else 0.0, 2),
+        'engagement_percentiles': {f'p{q}': round(percentile(engagement, q), 2) for q in (25, 50, 90)},
+        'engagement_zscore': round((engagement[-1] - statistics.fmean(engagement)) / std if std else 0.0, 2)
+    }
+
+
+@pytest.fixture
+def stats(main):
+    start = int(time.time()) - 3 * 86400
+    inserted = []
+
+    def insert(rows):
+        records = [{'platform': 'analytics-test', 'followers': followers, 'engagement': engagement,
+                    'views': views, 'timestamp': start + (len(inserted) + i) * 600}
+                   for i, (followers, engagement, views) in enumerate(rows)]
+        assert main.ingest_platform_stats(records)['inserted'] == len(rows)
+        inserted.extend(rows)
+        return inserted
+
+    yield insert
+    conn = main.get_db()
+    conn.execute("DELETE FROM platform_stats WHERE platform = 'analytics-test'")
+    conn.commit()
+
+
+def test_refresh_appends_new_rows_incrementally(main, stats):
+    engine = main.AnalyticsEngine()
+    rows = stats([(1000 + i * 7, 2.0 + (i % 5) * 0.3, i * 11) for i in range(20)])
+    assert engine.platform_metrics()['analytics-test'] == reference_metrics(rows)
+    history, last_id = engine.history, engine.last_id
+
+    rows = stats([(1200 + i * 3, 4.5 - i * 0.2, 500 + i) for i in range(5)])
+    metrics = engine.platform_metrics()['analytics-test']
+    # Новые строки дописаны в ту же историю, без полного перечитывания
+    assert engine.history is history
+    assert engine.last_id > last_id
+    assert metrics == reference_metrics(rows)
+
+    # Без новых записей версия та же: готовый результат без пересчёта
+    assert engine.platform_metrics() is engine.platform_metrics()
+
+
+def test_refresh_reloads_history_after_delete(main, stats):
+    engine = main.AnalyticsEngine()
+    rows = stats([(500 + i, 1.0 + i * 0.1, i) for i in range(12)])
+    assert engine.platform_metrics()['analytics-test']['samples'] == 12
+    history = engine.history
+
+    conn = main.get_db()
+    conn.execute("DELETE FROM platform_stats WHERE platform = 'analytics-test' AND followers >= 508")
+    conn.commit()
+    metrics = engine.platform_metrics()['analytics-test']
+    assert engine.history is not history
+    assert metrics == reference_metrics(rows[:8])
+
+
+@pytest.mark.parametrize('values', [
+    [(10, 1.0), (20, 2.5), (15, 4.0)],
+    [(7, 0.0)],
+    [(0, 3.3), (0, 3.3)],
+])
+def test_analyze_platform_stats_matches_python_sums(main, values):
+    stats = {f'p{i}': {'followers': followers, 'engagement': engagement}
+             for i, (followers, engagement) in enumerate(values)}
+    result = main.AnalyticsEngine().analyze_platform_stats(stats)
+    assert result['total_followers'] == sum(s['followers'] for s in stats.values())
+    assert result['avg_engagement'] == round(sum(s['engagement'] for s in stats.values()) / len(stats), 2)
+    assert result['top_platform'] == max(stats.items(), key=lambda item: item[1]['followers'])[0]
@@ -0,0 +1,67 @@
+import sqlite3
+
+
+def test_generate_many_matches_single_generation(main):
+    batch = main.ContentGenerator(None, seed=7).generate_many(50)
+    single = main.ContentGenerator(None, seed=7)
+    assert [post['content'] for post in batch] == [single.generate_trading_content()['content'] for _ in range(50)]
+    assert all('{' not in post['content'] for post in batch)
+
+
+class FailingCommit:
+    """Соединение, у которого COMMIT не проходит (например, database is locked)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def commit(self):
+        raise sqlite3.OperationalError('database is locked')
+
+
+def test_dedup_index_only_sees_committed_posts(main, monkeypatch):
+    index = main.NearDuplicateIndex()
+    index.sync()
+    generator = main.ContentGenerator(None, seed=3, dedup_index=index)
+    known = len(index.docs)
+    conn = main.get_db()
+    monkeypatch.setattr(main, 'get_db', lambda: FailingCommit(conn))
+
+    assert 'error' in generator.schedule_content(['dedup-test'])
+    assert len(index.docs) == known
+    assert conn.execute("SELECT COUNT(*) FROM content_plan WHERE platform = 'dedup-test'").fetchone()[0] == 0
+
+    monkeypatch.undo()
+    try:
+        assert generator.schedule_content(['dedup-test'])['scheduled'] >= 1
+        assert len(index.docs) > known
+    finally:
+        conn.execute("DELETE FROM content_plan WHERE platform = 'dedup-test'")
+        conn.commit()
+
+
+def test_local_add_does_not_skip_other_workers_posts(main):
+    """Два воркера на разных соединениях: свой add() не прячет чужую строку с меньшим id"""
+    index = main.NearDuplicateIndex()
+    index.sync()
+    ours, theirs = main.get_db(), sqlite3.connect(main.DB_PATH)
+    text = 'Сосед опубликовал уникальный разбор EUR/USD с уровнями поддержки и сопротивления'
+    try:
+        theirs.execute("INSERT INTO content_plan (platform, content_text, schedule_time, created_at) "
+                       "VALUES ('dedup-pair', ?, '10:00', strftime('%s', 'now'))", (text,))
+        theirs.commit()
+        cursor = ours.execute("INSERT INTO content_plan (platform, content_text, schedule_time, created_at) "
+                              "VALUES ('dedup-pair', 'Дисциплина побеждает талант', '11:00', strftime('%s', 'now'))")
+        ours.commit()
+        index.add(cursor.lastrowid, 'dedup-pair', 'Дисциплина побеждает талант')
+
+        duplicate_id, similarity = index.find_duplicate('dedup-pair', text)
+        assert duplicate_id is not None and duplicate_id < cursor.lastrowid
+        assert similarity == 1.0
+        assert index.last_id == cursor.lastrowid
+    finally:
+        theirs.close()
+        ours.execute("DELETE FROM content_plan WHERE platform = 'dedup-pair'")
+        ours.commit()
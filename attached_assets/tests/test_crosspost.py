@@ -0,0 +1,26 @@
+def test_lost_claim_does_not_delay_platform(main):
+    queue = main.CrosspostQueue(workers=0)
+    with main.app.app_context():
+        job_id = queue.submit('пост', ['telegram'])
+        conn = main.get_db()
+        # Шаг уже захватил воркер другого процесса
+        conn.execute("UPDATE crosspost_steps SET status = 'running' WHERE job_id = ?", (job_id,))
+        conn.commit()
+
+    step_id, platform, reservation = queue.next_step()
+    assert queue.next_slot['telegram'] > 0
+    assert queue.run_step(step_id, platform) is False
+    queue.release_slot(platform, reservation)
+    assert queue.next_slot['telegram'] == 0
+
+
+def test_claimed_step_keeps_platform_delay(main, monkeypatch):
+    monkeypatch.setattr(main, 'crosspost_to_platform', lambda content, platform: {'platform': platform, 'status': 'success'})
+    queue = main.CrosspostQueue(workers=0)
+    with main.app.app_context():
+        job_id = queue.submit('пост', ['telegram'])
+    step_id, platform, reservation = queue.next_step()
+    assert queue.run_step(step_id, platform) is True
+    assert queue.next_slot['telegram'] == reservation[1]
+    with main.app.app_context():
+        assert queue.get_status(job_id)['status'] == 'completed'
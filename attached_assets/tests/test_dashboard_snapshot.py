@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture
+def snapshot(main, client):
+    """Свежий снапшот: кэш сброшен, первый ответ - 200 с ETag"""
+    main.dashboard_snapshot_cache.invalidate()
+    response = client.get('/api/dashboard/snapshot')
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_revalidation_within_ttl_makes_no_queries(main, client, snapshot, monkeypatch):
+    calls = []
+    get_db = main.get_db
+    monkeypatch.setattr(main, 'get_db', lambda: calls.append(1) or get_db())
+
+    response = client.get('/api/dashboard/snapshot', headers={'If-None-Match': snapshot})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == snapshot
+    assert calls == []
+
+
+def test_rebuilds_when_table_versions_change(main, client, snapshot):
+    # Запись мимо запросов (другой воркер, фоновая задача): до конца TTL снапшот прежний
+    conn = main.get_db()
+    conn.execute("INSERT INTO platform_stats (platform, followers, created_at) VALUES ('snapshot-test', 1, 0)")
+    conn.commit()
+    try:
+        assert client.get('/api/dashboard/snapshot', headers={'If-None-Match': snapshot}).status_code == 304
+
+        main.dashboard_snapshot_cache.checked_at = 0.0  # TTL истёк
+        response = client.get('/api/dashboard/snapshot', headers={'If-None-Match': snapshot})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != snapshot
+    finally:
+        conn.execute("DELETE FROM platform_stats WHERE platform = 'snapshot-test'")
+        conn.commit()
+
+
+def test_unchanged_versions_revalidate_after_ttl(main, client, snapshot):
+    main.dashboard_snapshot_cache.checked_at = 0.0
+    response = client.get('/api/dashboard/snapshot', headers={'If-None-Match': snapshot})
+    assert response.status_code == 304
+    assert main.dashboard_snapshot_cache.is_fresh()
+
+
+def test_writing_request_invalidates_on_teardown(main, client, snapshot):
+    assert main.dashboard_snapshot_cache.is_fresh()
+    client.post('/api/toggle-crosspost', json={'enabled': False})
+    assert not main.dashboard_snapshot_cache.is_fresh()
+    # Запрос только на чтение кэш не сбрасывает
+    client.get('/api/dashboard/snapshot')
+    client.get('/api/platform-stats')
+    assert main.dashboard_snapshot_cache.is_fresh()
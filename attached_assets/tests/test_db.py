@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+import time
+
+
+def run_in_thread(func):
+    result = {}
+
+    def target():
+        try:
+            result['value'] = func()
+        finally:
+            result.setdefault('value', None)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return result['value']
+
+
+def test_background_get_db_keeps_open_transaction(main):
+    def job():
+        conn = main.get_db()
+        conn.execute("INSERT INTO automation_status (feature, enabled) VALUES ('nested_get_db', 0)")
+        # Вспомогательная функция снова берёт соединение посреди транзакции
+        assert main.get_db() is conn and conn.in_transaction
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM automation_status WHERE feature = 'nested_get_db'").fetchone()[0]
+
+    assert run_in_thread(job) == 1
+
+
+def test_finish_thread_db_rolls_back_failed_task(main):
+    def job():
+        conn = main.get_db()
+        conn.execute("INSERT INTO automation_status (feature, enabled) VALUES ('failed_task', 0)")
+        main.finish_thread_db()
+        return conn.in_transaction, conn.execute(
+            "SELECT COUNT(*) FROM automation_status WHERE feature = 'failed_task'").fetchone()[0]
+
+    assert run_in_thread(job) == (False, 0)
+
+
+def test_fresh_database_is_incremental_without_vacuum(main):
+    with main.app.app_context():
+        conn = main.get_db()
+        # Новый файл получает режим при первом подключении, миграция v11 VACUUM не запускает
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(main.SCHEMA_MIGRATIONS)
+
+
+def requests_per_second(client, path, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        assert client.get(path).status_code == 200
+    return count / (time.perf_counter() - started)
+
+
+def test_platform_stats_rps_pooled_vs_connect_per_request(main, client, monkeypatch):
+    """Бенчмарк: /api/platform-stats на соединениях пула против прежнего connect() на запрос"""
+    requests_per_second(client, '/api/platform-stats', 50)  # прогрев пула и кэша выражений
+    pooled = requests_per_second(client, '/api/platform-stats', 2000)
+
+    # Прежняя схема: новое соединение на каждый запрос, без пула и его PRAGMA
+    monkeypatch.setattr(main, 'get_db', lambda: sqlite3.connect(main.DB_PATH))
+    per_request = requests_per_second(client, '/api/platform-stats', 2000)
+
+    print(f'\n/api/platform-stats: пул {pooled:,.0f} rps, connect на запрос {per_request:,.0f} rps')
+    assert pooled > per_request
@@ -0,0 +1,27 @@
+import time
+
+
+def test_forecast_reads_rollups_beyond_hot_window(main):
+    conn = main.get_db()
+    today = int(time.time()) // 86400 * 86400
+    # Старая история есть только в дневных роллапах: сырые строки уже перенесены
+    conn.executemany('''
+        INSERT INTO stats_rollup_daily (platform, bucket, samples, sum_followers, min_followers,
+                                        max_followers, sum_engagement, sum_views)
+        VALUES ('forecast-test', ?, 2, ?, ?, ?, 0, 0)
+    ''', [(today - day * 86400, 2 * (1000 - day * 10), 1000 - day * 10, 1000 - day * 10) for day in range(60, 5, -1)])
+    conn.executemany('''
+        INSERT INTO platform_stats (platform, followers, engagement, views, timestamp, created_at)
+        VALUES ('forecast-test', ?, 0, 0, datetime(?, 'unixepoch'), ?)
+    ''', [(1000 - day * 10, today - day * 86400, today - day * 86400) for day in range(5, -1, -1)])
+    conn.commit()
+    try:
+        forecaster = main.GrowthForecaster(main.AnalyticsEngine(), lookback_days=90)
+        model = forecaster.forecast_all(cursor=conn.cursor())['forecast-test']
+        assert model['history_days'] == 61
+        assert 9 < model['trend_per_day'] < 11
+    finally:
+        conn.execute("DELETE FROM platform_stats WHERE platform = 'forecast-test'")
+        conn.execute("DELETE FROM stats_rollup_daily WHERE platform = 'forecast-test'")
+        conn.execute("DELETE FROM stats_rollup_hourly WHERE platform = 'forecast-test'")
+        conn.commit()
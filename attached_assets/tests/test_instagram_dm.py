@@ -0,0 +1,156 @@
+import sqlite3
+import time
+
+import pytest
+
+
+class CountingSafety:
+    """Выдаёт ёмкость без ограничений и запоминает, сколько действий запрошено"""
+
+    def __init__(self):
+        self.requested = []
+        self.released = []
+
+    def reserve_actions(self, platform, action_type, requested):
+        self.requested.append(requested)
+        return requested
+
+    def release_actions(self, platform, action_type, count, reserved_at):
+        if count > 0:
+            self.released.append(count)
+
+
+def test_deferred_dm_answered_meanwhile_does_not_spend_capacity(main):
+    safety = CountingSafety()
+    automation = main.InstagramDMAutomation(safety)
+    conn = main.get_db()
+    conn.execute('DELETE FROM instagram_dm_deferred')
+    conn.executemany('INSERT INTO instagram_dm_deferred (sender_id, message_text, created_at) VALUES (?, ?, 0)',
+                     [('dm-sender-1', 'хочу в VIP'), ('dm-sender-2', 'сколько стоит?')])
+    conn.commit()
+    # Пока первое сообщение ждало в очереди, на него ответил обычный путь
+    assert automation.process_dm_batch([{'sender_id': 'dm-sender-1', 'message_text': 'хочу в VIP'}])['processed'] == 1
+    safety.requested.clear()
+
+    result = automation.process_deferred_dms()
+    assert (result['processed'], result['duplicates'], result['deferred']) == (1, 1, 0)
+    assert safety.requested == [1]
+    assert conn.execute('SELECT COUNT(*) FROM instagram_dm_deferred').fetchone()[0] == 0
+
+
+@pytest.fixture
+def dm_rows(main):
+    yield
+    conn = main.get_db()
+    conn.execute("DELETE FROM instagram_dms WHERE sender_id LIKE 'seen-%'")
+    conn.commit()
+
+
+def dm_capacity(automation):
+    return automation.safety_controller.ledger.count('instagram', 'dms', 24)
+
+
+def batch(automation, senders, text='хочу в VIP'):
+    return automation.process_dm_batch([{'sender_id': sender, 'message_text': text} for sender in senders])
+
+
+def test_duplicate_missing_after_restart_returns_capacity(main, dm_rows):
+    first = main.InstagramDMAutomation(main.SafetyController(main.ActionLedger()))
+    assert batch(first, [f'seen-restart-{i}' for i in range(8)])['processed'] == 8
+
+    # После рестарта rebuild загружает только самые новые capacity строк
+    restarted = main.InstagramDMAutomation(main.SafetyController(main.ActionLedger()))
+    restarted.processed_dms = main.SeenDMFilter(capacity=4)
+    restarted.processed_dms.rebuild(main.get_db().cursor())
+    old_hash = main.dm_message_hash('хочу в VIP')
+    assert not restarted.processed_dms.might_contain('seen-restart-0', old_hash)
+
+    result = batch(restarted, ['seen-restart-0'])
+    assert (result['processed'], result['duplicates']) == (0, 1)
+    assert dm_capacity(restarted) == 0
+    assert restarted.process_new_dm('seen-restart-1', 'хочу в VIP')['status'] == 'duplicate'
+    assert dm_capacity(restarted) == 0
+
+
+def test_duplicate_written_by_other_worker_returns_capacity(main, dm_rows):
+    # Два воркера: у каждого свой фильтр, БД общая
+    ours = main.InstagramDMAutomation(main.SafetyController(main.ActionLedger()))
+    theirs = main.InstagramDMAutomation(main.SafetyController(main.ActionLedger()))
+    assert theirs.process_new_dm('seen-worker-1', 'сколько стоит?')['status'] == 'success'
+    assert batch(theirs, ['seen-worker-2'], 'сколько стоит?')['processed'] == 1
+
+    assert ours.process_new_dm('seen-worker-1', 'сколько стоит?')['status'] == 'duplicate'
+    result = batch(ours, ['seen-worker-2', 'seen-worker-3'], 'сколько стоит?')
+    assert (result['processed'], result['duplicates']) == (1, 1)
+    assert dm_capacity(ours) == 1
+
+
+def test_filter_overflow_keeps_duplicates_out_of_capacity(main, dm_rows):
+    automation = main.InstagramDMAutomation(main.SafetyController(main.ActionLedger()))
+    automation.processed_dms = main.SeenDMFilter(capacity=4)
+    # Каждый ответ - отдельная запись в фильтр: на пятой он пересобирается по capacity // 2 строкам
+    for i in range(6):
+        assert batch(automation, [f'seen-overflow-{i}'])['processed'] == 1
+    assert not automation.processed_dms.might_contain('seen-overflow-0', main.dm_message_hash('хочу в VIP'))
+    spent = dm_capacity(automation)
+
+    result = batch(automation, [f'seen-overflow-{i}' for i in range(6)])
+    assert (result['processed'], result['duplicates']) == (0, 6)
+    assert dm_capacity(automation) == spent
+
+
+class FailingCommit:
+    """Соединение, у которого COMMIT не проходит (например, database is locked)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def commit(self):
+        raise sqlite3.OperationalError('database is locked')
+
+
+def test_failed_write_releases_reserved_capacity(main, dm_rows, monkeypatch):
+    automation = main.InstagramDMAutomation(main.SafetyController(main.ActionLedger()))
+    conn = main.get_db()
+    monkeypatch.setattr(main, 'get_db', lambda: FailingCommit(conn))
+
+    assert batch(automation, [f'seen-fail-{i}' for i in range(5)])['status'] == 'error'
+    assert automation.process_new_dm('seen-fail-0', 'хочу в VIP')['status'] == 'error'
+    assert dm_capacity(automation) == 0
+    assert conn.execute("SELECT COUNT(*) FROM instagram_dms WHERE sender_id LIKE 'seen-fail-%'").fetchone()[0] == 0
+
+    monkeypatch.undo()
+    assert batch(automation, [f'seen-fail-{i}' for i in range(5)])['processed'] == 5
+    assert dm_capacity(automation) == 5
+
+
+@pytest.mark.parametrize('payload', [{'dms': ['x']}, {'dms': [{'sender_id': 'a'}, 7]}, {'dms': 'x'}, ['x']])
+def test_dm_batch_rejects_malformed_items(client, payload):
+    response = client.post('/api/instagram/dm-batch', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+def test_dm_batch_10k_throughput(main, dm_rows):
+    """Бенчмарк: 10k DM одним пакетом, затем тот же пакет повторно - одни дубли"""
+    safety = CountingSafety()
+    automation = main.InstagramDMAutomation(safety)
+    dms = [{'sender_id': f'seen-bench-{i % 2500}', 'message_text': f'сколько стоит VIP, вопрос {i}'}
+           for i in range(10_000)]
+
+    started = time.perf_counter()
+    first = automation.process_dm_batch(dms)
+    first_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    again = automation.process_dm_batch(dms)
+    again_seconds = time.perf_counter() - started
+    print(f'\nprocess_dm_batch: 10k DM за {first_seconds:.2f} с ({10_000 / first_seconds:,.0f}/с), '
+          f'повтор {again_seconds:.2f} с')
+
+    assert (first['processed'], first['duplicates'], first['deferred']) == (10_000, 0, 0)
+    assert (again['processed'], again['duplicates']) == (0, 10_000)
+    assert safety.requested == [10_000, 0] and not safety.released
+    assert first_seconds < 30 and again_seconds < 30
@@ -0,0 +1,129 @@
+import json
+import time
+
+import pytest
+
+from conftest import run_workers
+
+
+class ElectedLease:
+    """Аренда, которую этот процесс уже держит: срок лидерства задаёт тест"""
+
+    is_leader = True
+    generation = 1
+
+
+@pytest.fixture
+def scheduler(main):
+    scheduler = main.JobScheduler(workers=1, leader=ElectedLease())
+    yield scheduler
+    scheduler.stop()
+    conn = main.get_db()
+    conn.execute("DELETE FROM job_runs WHERE job LIKE 'jobs-test%'")
+    conn.commit()
+
+
+def queued(scheduler, name):
+    return sorted(due for due, _, job in scheduler.heap if job.name == name)
+
+
+def test_recover_runs_once_per_election(main, scheduler):
+    job = scheduler.add_job('jobs-test-catch-up', lambda: None, every=3600, catch_up=True)
+    conn = main.get_db()
+    conn.execute('''
+        INSERT INTO job_runs (job, scheduled_for, started_at, late_ms, duration_ms, status, error, missed)
+        VALUES (?, ?, ?, 0, 0, 'completed', NULL, 0)
+    ''', (job.name, int(time.time()) - 3 * 3600, int(time.time()) - 3 * 3600))
+    conn.commit()
+
+    # До run() расписание не собрано: ранний on_elected ничего не догоняет
+    scheduler.recover()
+    assert len(queued(scheduler, job.name)) == 1
+
+    scheduler.started = True
+    scheduler.recover()
+    scheduler.recover()  # on_elected и старт run() в одном сроке лидерства
+    assert len(queued(scheduler, job.name)) == 2
+    assert job.stats['missed'] == 1
+
+    # Новое избрание, пока догоняющий запуск ещё в куче, не добавляет второй
+    scheduler.leader.generation += 1
+    scheduler.recover()
+    assert len(queued(scheduler, job.name)) == 2
+
+
+@pytest.mark.parametrize('func, status', [
+    (lambda: None, 'completed'),
+    (lambda: 'skipped', 'skipped'),
+    (lambda: 1 / 0, 'failed'),
+])
+def test_run_status_reflects_job_outcome(main, scheduler, func, status):
+    job = scheduler.add_job(f'jobs-test-{status}', func, every=3600)
+    scheduler._execute(job, time.time(), 0)
+    assert job.stats['last_status'] == status
+    assert job.stats['failures'] == (status == 'failed')
+    row = main.get_db().execute('SELECT status FROM job_runs WHERE job = ? ORDER BY id DESC LIMIT 1',
+                                (job.name,)).fetchone()
+    assert row[0] == status
+
+
+LEASE_WORKER = '''
+import json, os, threading, time
+start_at = float(os.environ['START_AT'])
+lease = main.LeaderLease('lease-test', ttl=3, heartbeat=1)
+time.sleep(max(0.0, start_at - time.time()))
+threading.Thread(target=lease.run, daemon=True).start()
+samples, stopped_at = [], None
+while time.time() < start_at + 12:
+    now, leader = time.time(), lease.is_leader
+    samples.append((now, leader))
+    # Лидер в окне [3; 3.5) с начала перестаёт продлевать аренду, но не отдаёт её - как зависший процесс
+    if leader and stopped_at is None and start_at + 3 <= now < start_at + 3.5:
+        lease.stopped.set()
+        stopped_at = now
+    time.sleep(0.02)
+print(json.dumps({'samples': samples, 'stopped_at': stopped_at, 'generation': lease.generation}))
+'''
+
+
+def leader_intervals(samples):
+    intervals, begin, last = [], None, None
+    for now, leader in samples:
+        if leader and begin is None:
+            begin = now
+        elif not leader and begin is not None:
+            intervals.append((begin, last))
+            begin = None
+        last = now
+    if begin is not None:
+        intervals.append((begin, last))
+    return intervals
+
+
+def test_leader_lease_single_leader_and_takeover(tmp_path):
+    start_at = time.time() + 6
+    outputs = run_workers(tmp_path, LEASE_WORKER, 3, env={'START_AT': str(start_at)}, timeout=60)
+    results = [json.loads(output.strip().splitlines()[-1]) for output in outputs]
+    intervals = [leader_intervals(result['samples']) for result in results]
+
+    # Ни в один момент два процесса не считают себя лидерами
+    spans = sorted((begin, end, index) for index, worker in enumerate(intervals) for begin, end in worker)
+    for (_, end, first), (begin, _, second) in zip(spans, spans[1:]):
+        assert end < begin, (first, second)
+
+    # Первый срок: ровно один лидер, он и перестаёт продлевать аренду
+    holders = [index for index, worker in enumerate(intervals) if worker and worker[0][0] < start_at + 2]
+    assert len(holders) == 1
+    holder = holders[0]
+    stopped_at = results[holder]['stopped_at']
+    assert stopped_at is not None and all(result['stopped_at'] is None
+                                          for index, result in enumerate(results) if index != holder)
+
+    # Аренду забирает другой процесс: после истечения ttl, не позже ttl + 2 heartbeat
+    successors = [(begin, index) for index, worker in enumerate(intervals) if index != holder
+                  for begin, _ in worker if begin > stopped_at]
+    assert successors
+    takeover, successor = min(successors)
+    assert takeover - stopped_at < 3 + 2 + 0.5
+    assert results[successor]['generation'] == 1
+    assert intervals[holder][-1][1] < takeover
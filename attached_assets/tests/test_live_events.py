@@ -0,0 +1,120 @@
+import asyncio
+import os
+import resource
+import signal
+import socket
+import sqlite3
+import subprocess
+import time
+
+import pytest
+
+from conftest import APP_DIR, MODULE
+
+DASHBOARDS = 500
+# Конфигурация как в .replit: каждый SSE-поток держит поток gthread-воркера
+GUNICORN_ARGS = ['--workers=2', '--worker-class=gthread', '--threads=512', '--timeout=120']
+
+
+async def open_stream(port):
+    """(статус, reader, writer) для GET /api/events"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /api/events HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.readuntil(b'\r\n\r\n')
+    return status, reader, writer
+
+
+async def read_until(reader, marker, timeout):
+    buffer = b''
+    deadline = time.monotonic() + timeout
+    while marker not in buffer:
+        chunk = await asyncio.wait_for(reader.read(4096), max(0.01, deadline - time.monotonic()))
+        if not chunk:
+            raise ConnectionError('поток закрыт сервером')
+        buffer += chunk
+    return buffer
+
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split()[1])
+
+
+async def idle_dashboards(port, db_path):
+    streams = await asyncio.gather(*(open_stream(port) for _ in range(DASHBOARDS)))
+    accepted = [(reader, writer) for status, reader, writer in streams if status == 200]
+    assert len(accepted) == DASHBOARDS, f'принято {len(accepted)} из {DASHBOARDS}'
+    await asyncio.gather(*(read_until(reader, b'retry:', 20) for reader, _ in accepted))
+
+    # Пока открыты все потоки, обычные запросы обслуживаются оставшимися потоками воркеров
+    started = time.monotonic()
+    assert await asyncio.wait_for(get(port, '/api/platform-stats'), 10) == 200
+    api_seconds = time.monotonic() - started
+
+    # Наблюдатель снимает исходные версии таблиц через poll_interval после первой подписки
+    await asyncio.sleep(2)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO platform_stats (platform, followers, created_at) VALUES ('instagram', 1, ?)",
+                 (int(time.time()),))
+    conn.commit()
+    started = time.monotonic()
+    await asyncio.gather(*(read_until(reader, b'event: platform_stats', 30) for reader, _ in accepted))
+    fanout_seconds = time.monotonic() - started
+    for _, writer in accepted:
+        writer.close()
+    return api_seconds, fanout_seconds
+
+
+@pytest.fixture
+def gunicorn_server(tmp_path):
+    pytest.importorskip('gunicorn')
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < 4 * DASHBOARDS:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, 8 * DASHBOARDS), hard))
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        ['gunicorn', f'--bind=127.0.0.1:{port}', *GUNICORN_ARGS, '--pythonpath', APP_DIR, f'{MODULE}:app'],
+        cwd=tmp_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, 'gunicorn не запустился'
+                time.sleep(0.2)
+        yield port, str(tmp_path / 'lucifer_analytics.db')
+    finally:
+        # Штатная остановка ждала бы, пока каждый SSE-поток заметит отключение клиента
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait(timeout=30)
+
+
+def test_500_idle_dashboards_under_gthread(gunicorn_server):
+    port, db_path = gunicorn_server
+    api_seconds, fanout_seconds = asyncio.run(idle_dashboards(port, db_path))
+    print(f'\n{DASHBOARDS} SSE-потоков: API за {api_seconds * 1000:.0f} мс, дельта всем за {fanout_seconds:.2f} с')
+    assert api_seconds < 2
+    assert fanout_seconds < 10
+
+
+def test_streams_over_worker_cap_get_503(main, client):
+    hub = main.live_event_hub
+    saved = hub.max_streams
+    hub.max_streams = len(hub.subscribers)
+    try:
+        response = client.get('/api/events')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '60'
+    finally:
+        hub.max_streams = saved
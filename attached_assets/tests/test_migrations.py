@@ -0,0 +1,111 @@
+import re
+import sqlite3
+import time
+
+import pytest
+
+from conftest import APP_DIR, MODULE, run_workers
+
+WINDOW_TABLES = ('platform_stats', 'instagram_dms', 'content_plan', 'daily_reports',
+                 'stats_rollup_hourly', 'stats_rollup_daily', 'job_runs', 'instagram_dm_deferred')
+TIME_PREDICATE = re.compile(r'\b(created_at|schedule_epoch|bucket|started_at)\s*(>=|>|<|<=|BETWEEN)')
+
+
+def traced(conn, action):
+    """Выполняет action и возвращает все SQL-запросы с подставленными параметрами"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        action()
+    finally:
+        conn.set_trace_callback(None)
+    return statements
+
+
+def full_scans(conn, statement):
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement)]
+    return [step for step in plan if any(re.fullmatch(f'SCAN {table}( .*)?', step) for table in WINDOW_TABLES)]
+
+
+def window_queries(statements):
+    return [statement for statement in statements
+            if statement.lstrip().upper().startswith(('SELECT', 'DELETE', 'UPDATE'))
+            and TIME_PREDICATE.search(statement)
+            and any(table in statement for table in WINDOW_TABLES)]
+
+
+def test_window_queries_are_index_range_scans(main, client):
+    with main.app.app_context():
+        conn = main.get_db()
+        now = int(time.time())
+        conn.executemany('INSERT INTO platform_stats (platform, followers, engagement, views, created_at) VALUES (?, ?, ?, ?, ?)',
+                         [('instagram', 100 + i, 2.5, 10, now - i * 3600) for i in range(500)])
+        conn.commit()
+
+        def exercise():
+            main.report_generator.generate_daily_report()
+            main.report_generator.generate_weekly_report()
+            main.report_generator.generate_range_report(now - 30 * 86400, now)
+            main.api_automation_detailed_status()
+            main.retention_engine.run()
+
+        statements = window_queries(traced(conn, exercise))
+        # Отчёты, статус автоматизаций и очистка - каждый оконный запрос проверяется по плану
+        assert len(statements) >= 8
+        scans = {' '.join(statement.split()): full_scans(conn, statement) for statement in statements}
+        assert {statement: steps for statement, steps in scans.items() if steps} == {}
+
+
+@pytest.mark.parametrize('statement, index', [
+    ('SELECT COUNT(*) FROM instagram_dms WHERE created_at >= 0', 'idx_instagram_dms_created'),
+    ("SELECT COUNT(*) FROM content_plan WHERE status = 'posted' AND schedule_epoch >= 0", 'idx_content_plan_status_schedule'),
+    ("SELECT followers FROM platform_stats WHERE platform = 'instagram' AND created_at >= 0", 'idx_platform_stats_platform_created'),
+    ('SELECT MIN(rowid), MAX(rowid) FROM platform_stats WHERE created_at < 0', 'idx_platform_stats_created'),
+])
+def test_window_indexes_are_used(main, statement, index):
+    with main.app.app_context():
+        plan = ' '.join(row[3] for row in main.get_db().execute('EXPLAIN QUERY PLAN ' + statement))
+    assert f'USING COVERING INDEX {index}' in plan or f'USING INDEX {index}' in plan, plan
+
+
+def test_failed_migration_rolls_back_completely(main, tmp_path, monkeypatch):
+    conn = sqlite3.connect(tmp_path / 'broken.db')
+
+    def half_applied(cursor):
+        cursor.execute('CREATE TABLE half_applied (id INTEGER)')
+        cursor.execute('ALTER TABLE half_applied ADD COLUMN created_at INTEGER')
+        raise RuntimeError('сбой посреди миграции')
+
+    monkeypatch.setattr(main, 'SCHEMA_MIGRATIONS', [half_applied])
+    with pytest.raises(RuntimeError):
+        main.migrate_database(conn)
+    assert not conn.in_transaction
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_applied'").fetchone() is None
+
+
+STARTUP_PRELUDE = f'''
+import os, sys, time
+sys.path.insert(0, {APP_DIR!r})
+time.sleep(max(0.0, float(os.environ['START_AT']) - time.time()))
+import {MODULE} as main
+'''
+
+STARTUP_WORKER = '''
+with main.app.app_context():
+    conn = main.get_db()
+    print(conn.execute('PRAGMA user_version').fetchone()[0])
+'''
+
+
+def test_concurrent_startup_migrates_once(main, tmp_path):
+    """Несколько воркеров стартуют на пустой БД одновременно, как под gunicorn"""
+    outputs = run_workers(tmp_path, STARTUP_WORKER, 4, env={'START_AT': str(time.time() + 2)},
+                          prelude=STARTUP_PRELUDE)
+    for output in outputs:
+        assert 'Ошибка' not in output, output
+        assert output.strip().splitlines()[-1] == str(len(main.SCHEMA_MIGRATIONS))
+    conn = sqlite3.connect(tmp_path / 'lucifer_analytics.db')
+    # Каждая миграция выполнена ровно одним воркером, начальные статусы не задвоены
+    assert sum(output.count('✅ Миграция БД v1:') for output in outputs) == 1
+    assert conn.execute('SELECT COUNT(*) FROM automation_status').fetchone()[0] == 5
@@ -0,0 +1,61 @@
+import gzip
+import time
+
+from flask import render_template_string
+
+
+def mean_ms(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) * 1000 / count
+
+
+def test_page_latency_precompiled_vs_per_request_render(main, client):
+    """Бенчмарк: / и /platform-analysis против прежней компиляции шаблона на каждый запрос"""
+    headers = {'Accept-Encoding': 'gzip'}
+    for path in ('/', '/platform-analysis'):
+        client.get(path, headers=headers)  # прогрев
+
+    dashboard = mean_ms(lambda: client.get('/', headers=headers), 300)
+    analysis = mean_ms(lambda: client.get('/platform-analysis', headers=headers), 300)
+    with main.app.test_request_context('/'):
+        dashboard_before = mean_ms(lambda: render_template_string(main.HTML_TEMPLATE, analysis=None, alerts=[]), 30)
+        analysis_before = mean_ms(lambda: render_template_string(main.PLATFORM_ANALYSIS_TEMPLATE), 30)
+
+    print(f'\n/: {dashboard_before:.2f} -> {dashboard:.2f} мс; '
+          f'/platform-analysis: {analysis_before:.2f} -> {analysis:.2f} мс')
+    assert dashboard < dashboard_before
+    assert analysis < analysis_before
+
+
+def test_static_page_etag_revalidation(client):
+    first = client.get('/platform-analysis')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = client.get('/platform-analysis', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_content_encoding_negotiation(client):
+    identity = client.get('/platform-analysis')
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['Vary'] == 'Accept-Encoding'
+
+    compressed = client.get('/platform-analysis', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == identity.data
+    assert len(compressed.data) < len(identity.data)
+
+    refused = client.get('/platform-analysis', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in refused.headers
+
+
+def test_versioned_assets_are_immutable(main, client):
+    asset = main.STATIC_ASSETS['dashboard.js']
+    response = client.get(main.asset_url('dashboard.js'))
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert client.get('/assets/dashboard.js', headers={'If-None-Match': f'"{asset.etag}"'}).status_code == 304
+    assert client.get('/assets/missing.js').status_code == 404
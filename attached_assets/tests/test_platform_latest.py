@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+PLATFORM = 'latest-test'
+
+
+@pytest.fixture
+def conn(main):
+    conn = main.get_db()
+    yield conn
+    conn.execute('DELETE FROM platform_stats WHERE platform = ?', (PLATFORM,))
+    conn.execute('DELETE FROM platform_latest WHERE platform = ?', (PLATFORM,))
+    conn.commit()
+
+
+def insert(conn, followers, created_at):
+    cursor = conn.execute('''
+        INSERT INTO platform_stats (platform, followers, engagement, views, created_at) VALUES (?, ?, 1.0, 0, ?)
+    ''', (PLATFORM, followers, created_at))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def latest(conn):
+    return conn.execute('SELECT stats_id, followers FROM platform_latest WHERE platform = ?', (PLATFORM,)).fetchone()
+
+
+def test_out_of_order_insert_keeps_newest_snapshot(conn):
+    newest = insert(conn, 300, 3000)
+    insert(conn, 100, 1000)  # запоздавшая старая точка не вытесняет свежую
+    assert latest(conn) == (newest, 300)
+    same_time = insert(conn, 310, 3000)
+    assert latest(conn) == (same_time, 310)
+
+
+def test_deleting_latest_falls_back_to_previous(conn):
+    oldest = insert(conn, 50, 500)
+    previous = insert(conn, 100, 1000)
+    current = insert(conn, 200, 2000)
+    # Удаление не текущей строки снимок не трогает
+    conn.execute('DELETE FROM platform_stats WHERE id = ?', (oldest,))
+    conn.commit()
+    assert latest(conn) == (current, 200)
+    conn.execute('DELETE FROM platform_stats WHERE id = ?', (current,))
+    conn.commit()
+    assert latest(conn) == (previous, 100)
+    # Удаление последней строки платформы убирает и её снимок
+    conn.execute('DELETE FROM platform_stats WHERE id = ?', (previous,))
+    conn.commit()
+    assert latest(conn) is None
+
+
+def test_migration_backfills_existing_rows(main, tmp_path):
+    conn = sqlite3.connect(tmp_path / 'backfill.db')
+    conn.execute('''
+        CREATE TABLE platform_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, platform TEXT, followers INTEGER, engagement REAL,
+            views INTEGER, timestamp DATETIME, created_at INTEGER
+        )
+    ''')
+    conn.executemany('INSERT INTO platform_stats (platform, followers, engagement, views, created_at) VALUES (?, ?, 0, 0, ?)',
+                     [('instagram', 10, 100), ('instagram', 30, 300), ('instagram', 20, 200),
+                      ('tiktok', 5, 50), ('tiktok', 6, 50)])
+    main.migration_platform_latest(conn.cursor())
+    rows = conn.execute('SELECT platform, followers, created_at FROM platform_latest ORDER BY platform').fetchall()
+    # При равном времени побеждает больший id - как и в триггере удаления
+    assert rows == [('instagram', 30, 300), ('tiktok', 6, 50)]
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('httpx')
+
+
+@pytest.fixture
+def stubs(main, monkeypatch):
+    """Заглушки API на локальных портах; PLATFORM_APIS и ключи возвращаются после теста"""
+    servers = {}
+    for platform, spec in main.PLATFORM_APIS.items():
+        servers[platform] = main.PlatformStubServer()
+        monkeypatch.setitem(spec, 'base_url', servers[platform].start())
+        monkeypatch.setenv(spec['token_env'], 'stub-token')
+        monkeypatch.setenv(spec['accounts_env'], '1001,1002')
+    yield servers
+    for server in servers.values():
+        server.stop()
+
+
+@pytest.fixture
+def platform_client(main):
+    client = main.PlatformClient(main.safety_controller, timeout=2.0)
+    yield client
+    client.close()
+
+
+def test_snapshot_collects_all_accounts_in_parallel(stubs, platform_client):
+    for server in stubs.values():
+        server.latency = 0.3
+    snapshot = platform_client.run(platform_client.snapshot())
+
+    youtube = snapshot['platforms']['youtube']['data']
+    assert [account['channel_id'] for account in youtube['accounts']] == ['1001', '1002']
+    assert youtube['subscribers'] == sum(account['subscribers'] for account in youtube['accounts'])
+    instagram = snapshot['platforms']['instagram']['data']
+    assert [account['username'] for account in instagram] == ['lucifer_1001', 'lucifer_1002']
+    assert all(len(account['posts']) == 10 for account in instagram)
+    # Пять запросов по 0.3 с подряд заняли бы 1.5 с
+    assert snapshot['elapsed_ms'] < 1200
+
+
+def test_pool_wait_is_bounded(stubs, platform_client):
+    platform_client.run(platform_client.youtube_analytics())
+    client, = platform_client.clients.values()
+    assert client.timeout.pool == platform_client.timeout
+
+
+def test_run_cancels_coroutine_on_timeout(main):
+    client = main.PlatformClient(main.safety_controller, timeout=0.05)
+    cancelled = threading.Event()
+
+    async def hang():
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    try:
+        with pytest.raises(TimeoutError):
+            client.run(hang())
+        assert cancelled.wait(2)
+    finally:
+        client.close()
+
+
+def test_connect_instagram_stores_one_row_for_all_accounts(main, client, stubs, platform_client, monkeypatch):
+    monkeypatch.setattr(main, 'platform_client', platform_client)
+    conn = main.get_db()
+    started = int(time.time())
+    try:
+        response = client.post('/api/connect-instagram').get_json()
+        assert response['status'] == 'success'
+        rows = conn.execute("SELECT followers FROM platform_stats WHERE platform = 'instagram' AND created_at >= ?",
+                            (started,)).fetchall()
+        assert rows == [(sum(account['followers'] for account in response['accounts']),)]
+    finally:
+        conn.execute("DELETE FROM platform_stats WHERE platform = 'instagram' AND created_at >= ?", (started,))
+        conn.commit()
@@ -0,0 +1,83 @@
+import json
+import time
+
+import pytest
+
+
+def test_cached_report_is_not_shared_with_callers(main):
+    generator = main.ReportGenerator(main.AnalyticsEngine())
+    until = int(time.time())
+    with main.app.app_context():
+        report, cached = generator.get_range_report(until - 86400, until)
+        expected = repr(report)
+        assert cached is False
+        # Вызывающий правит свой экземпляр - в том числе вложенные словари
+        report['tampered'] = True
+        for value in report.values():
+            if isinstance(value, (dict, list)):
+                value.clear()
+
+        again, cached = generator.get_range_report(until - 86400, until)
+        assert cached is True
+        assert repr(again) == expected
+
+
+def keys(main, generator):
+    cursor = main.get_db().cursor()
+    hour = int(time.time()) // 3600
+    return generator.cache_key(cursor, 'daily', hour), generator.cache_key(cursor, 'weekly', hour)
+
+
+def test_cache_key_follows_table_versions(main):
+    generator = main.ReportGenerator(main.AnalyticsEngine())
+    conn = main.get_db()
+    daily, weekly = keys(main, generator)
+    assert keys(main, generator) == (daily, weekly)
+
+    # instagram_dms входит только в ежедневный отчёт
+    conn.execute("INSERT INTO instagram_dms (sender_id, message_text, message_hash, created_at) "
+                 "VALUES ('report-key', 'x', 'report-key', strftime('%s', 'now'))")
+    conn.commit()
+    changed_daily, same_weekly = keys(main, generator)
+    assert changed_daily != daily and same_weekly == weekly
+
+    conn.execute("DELETE FROM instagram_dms WHERE sender_id = 'report-key'")
+    conn.commit()
+    assert keys(main, generator)[0] not in (daily, changed_daily)
+
+
+def test_range_report_recomputed_after_new_stats(main):
+    generator = main.ReportGenerator(main.AnalyticsEngine())
+    until = int(time.time())
+    with main.app.app_context():
+        assert generator.get_range_report(until - 3600, until)[1] is False
+        assert generator.get_range_report(until - 3600, until)[1] is True
+        main.ingest_platform_stats([{'platform': 'report-test', 'followers': 1, 'timestamp': until - 60}])
+        try:
+            assert generator.get_range_report(until - 3600, until)[1] is False
+        finally:
+            conn = main.get_db()
+            conn.execute("DELETE FROM platform_stats WHERE platform = 'report-test'")
+            conn.commit()
+
+
+def test_persisted_daily_report_is_reused_without_new_rows(main, monkeypatch):
+    first = main.ReportGenerator(main.AnalyticsEngine())
+    conn = main.get_db()
+    with main.app.app_context():
+        report, cached = first.get_daily_report()
+        assert 'error' not in report
+        key = keys(main, first)[0]
+        rows = conn.execute('SELECT COUNT(*) FROM daily_reports WHERE cache_key = ?', (key,)).fetchone()[0]
+        assert rows == 1 or cached
+
+        # Пустой LRU - как у соседнего воркера или после рестарта: отчёт читается из daily_reports
+        second = main.ReportGenerator(main.AnalyticsEngine())
+        monkeypatch.setattr(second, 'generate_daily_report', lambda: pytest.fail('отчёт пересчитан'))
+        again, cached = second.get_daily_report()
+        assert cached is True
+        assert again == json.loads(json.dumps(report))
+
+        for generator in (first, second, first):
+            assert generator.get_daily_report()[1] is True
+    assert conn.execute('SELECT COUNT(*) FROM daily_reports WHERE cache_key = ?', (key,)).fetchone()[0] == 1
@@ -0,0 +1,121 @@
+import random
+import time
+
+import pytest
+
+
+@pytest.fixture
+def smart(main):
+    yield main.smart_auto_reply
+    conn = main.get_db()
+    conn.execute('DELETE FROM smart_reply_overrides')
+    conn.commit()
+    main.smart_auto_reply.refresh()
+
+
+def reply_key(smart, text):
+    reply = smart.get_smart_reply(text)
+    return next(key for key, template in smart.templates.items() if template == reply)
+
+
+def test_inflected_forms_and_yo_folding(main, smart):
+    assert reply_key(smart, 'Хочу научиться торговать') == 'обучение'
+    assert reply_key(smart, 'Можно обучиться с нуля?') == 'обучение'
+    assert reply_key(smart, 'Что с ценой на доступ?') == 'цена'
+    assert reply_key(smart, 'СТОИМОСТЬ подписки') == 'цена'
+    assert reply_key(smart, 'Есть прогнозы на неделю?') == 'сигналы'
+    assert reply_key(smart, 'привет') == 'default'
+
+    smart.reload(keywords={'обучение': ['учёба']})
+    assert reply_key(smart, 'как насчёт учеба-интенсива') == 'обучение'
+    assert reply_key(smart, 'УЧЁБА') == 'обучение'
+
+
+def test_priority_ties_follow_template_order(main, smart):
+    # По умолчанию приоритет - порядок шаблонов, место слова в тексте не важно
+    assert reply_key(smart, 'сколько стоит vip') == 'vip'
+    assert reply_key(smart, 'vip: сколько стоит') == 'vip'
+
+    smart.reload(priorities={'цена': 0})
+    assert reply_key(smart, 'сколько стоит vip') == 'цена'
+
+    # Равные приоритеты: побеждает шаблон, объявленный раньше
+    smart.reload(priorities={'vip': 0})
+    assert reply_key(smart, 'сколько стоит vip') == 'vip'
+    assert reply_key(smart, 'курс и цена vip') == 'обучение'
+
+
+@pytest.mark.parametrize('payload', [
+    {'keywords': {'vip': 'премиум'}},
+    {'keywords': {'vip': ['премиум', 5]}},
+    {'priorities': {'vip': '1'}},
+    {'priorities': {'vip': True}},
+    {'priorities': {'нет_такого': 1}},
+    {'keywords': {'default': ['привет']}},
+    {'templates': {'vip': ''}},
+    {'templates': ['vip']},
+])
+def test_bad_reload_is_rejected_without_side_effects(main, smart, client, payload):
+    before = client.get('/api/smart-reply/templates').get_json()
+
+    response = client.post('/api/smart-reply/templates', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+    assert main.get_db().execute('SELECT COUNT(*) FROM smart_reply_overrides').fetchone()[0] == 0
+
+    # Следующая корректная перезагрузка и ответы работают как прежде
+    response = client.post('/api/smart-reply/templates', json={'keywords': {'vip': ['премиум', 'элитн']}})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['keywords']['vip'] == ['премиум', 'элитн']
+    assert data['templates'] == before['templates']
+    assert reply_key(smart, 'Элитный доступ есть?') == 'vip'
+
+
+def test_reload_reaches_every_instance(main, smart):
+    # Второй экземпляр - как SmartAutoReply в соседнем воркере gunicorn
+    other = main.SmartAutoReply()
+    other.refresh()
+    smart.reload(templates={'vip': 'VIP: напишите менеджеру'}, keywords={'vip': ['элитн']})
+
+    assert other.get_smart_reply('элитный клуб') == 'VIP: напишите менеджеру'
+    assert other.keywords['vip'] == ['элитн']
+
+    # Правки накапливаются: вторая перезагрузка не теряет первую
+    other.reload(priorities={'vip': -1})
+    assert smart.get_smart_reply('курс в элитном клубе') == 'VIP: напишите менеджеру'
+    assert smart.templates['vip'] == 'VIP: напишите менеджеру'
+
+
+def test_keyword_matching_benchmark(main):
+    """Бенчмарк: 1k ключевых слов по 20 шаблонам, 100k сообщений"""
+    rng = random.Random(11)
+    alphabet = 'абвгдежзиклмнопрстуфхцчшщыэюя'
+
+    def word():
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 9)))
+
+    templates = {f't{i}': f'ответ {i}' for i in range(20)}
+    templates['default'] = 'ответ по умолчанию'
+    keywords = {f't{i}': [word() for _ in range(50)] for i in range(20)}
+    vocabulary = [w for words in keywords.values() for w in words]
+    messages = [' '.join(rng.choice(vocabulary) if rng.random() < 0.05 else word() for _ in range(12))
+                for _ in range(100_000)]
+
+    automaton = main.SmartAutoReply.build_automaton(templates, keywords, {})
+    started = time.perf_counter()
+    matched = [automaton.match(text) for text in messages]
+    elapsed = time.perf_counter() - started
+    print(f'\nSmartAutoReply: 100k сообщений за {elapsed:.2f} с, {len(messages) / elapsed:,.0f} сообщений/с')
+
+    # Прежний линейный поиск по шаблонам как эталон на выборке
+    def linear(text):
+        for key in templates:
+            if key != 'default' and any(w in text for w in [key] + keywords[key]):
+                return key
+        return None
+
+    sample = range(0, len(messages), 50)
+    assert [matched[i] for i in sample] == [linear(messages[i]) for i in sample]
+    assert sum(key is not None for key in matched) > 10_000
+    assert elapsed < 30
@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import run_workers
+
+
+def epoch(year, month, day=1):
+    return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.fixture
+def partitions(main, tmp_path):
+    """Отдельный каталог партиций; месяцы 2019 года не пересекаются с данными других тестов"""
+    manager = main.StatsPartitionManager(directory=str(tmp_path), chunk_rows=50, pause=0)
+    yield manager
+    conn = main.get_db()
+    conn.execute("DELETE FROM stats_partitions WHERE month LIKE '2019%'")
+    conn.execute('DELETE FROM platform_stats WHERE created_at < ?', (epoch(2020, 1),))
+    conn.commit()
+
+
+def insert_rows(main, rows):
+    conn = main.get_db()
+    conn.executemany('''
+        INSERT INTO platform_stats (platform, followers, engagement, views, timestamp, created_at)
+        VALUES (?, ?, 0.0, 0, datetime(?, 'unixepoch'), ?)
+    ''', [(platform, followers, created_at, created_at) for platform, followers, created_at in rows])
+    conn.commit()
+
+
+def hot_count(main, since, until):
+    return main.get_db().execute(
+        'SELECT COUNT(*) FROM platform_stats WHERE created_at >= ? AND created_at < ?', (since, until)
+    ).fetchone()[0]
+
+
+def history(manager, since, until):
+    return [row for page in manager.iter_history(since, until) for row in page]
+
+
+def test_seal_moves_month_out_of_hot_table(main, partitions):
+    start = epoch(2019, 3)
+    insert_rows(main, [('telegram', i, start + i * 3600) for i in range(120)])
+
+    sealed = {item['month']: item for item in partitions.seal_closed_months()}
+    assert sealed['201903'] == {'month': '201903', 'rows': 120, 'moved': 120}
+    assert hot_count(main, start, epoch(2019, 4)) == 0
+    assert len(history(partitions, start, epoch(2019, 4))) == 120
+    # Отсечение по диапазону: соседний месяц не открывает партицию марта
+    assert partitions.partitions(epoch(2019, 4), epoch(2019, 5)) == []
+
+
+def test_late_row_in_sealed_month_is_not_lost(main, partitions):
+    start = epoch(2019, 5)
+    insert_rows(main, [('vk', i, start + i * 60) for i in range(240)])
+    partitions.seal_closed_months()
+
+    # Опоздавшая строка приходит в уже запечатанный месяц и видна до следующего переноса
+    insert_rows(main, [('vk', 999, start + 86400 * 10 + 7)])
+    main.retention_engine.run()
+    assert len(history(partitions, start, epoch(2019, 6))) == 241
+
+    resealed = {item['month']: item for item in partitions.seal_closed_months()}
+    assert resealed['201905']['rows'] == 241
+    assert hot_count(main, start, epoch(2019, 6)) == 0
+    assert len(history(partitions, start, epoch(2019, 6))) == 241
+
+
+def test_interrupted_move_does_not_duplicate_history(main, partitions, monkeypatch):
+    start = epoch(2019, 7)
+    insert_rows(main, [('youtube', i, start + i * 60) for i in range(30)])
+    # Реестр записан, но удаление из горячей таблицы не успело выполниться
+    monkeypatch.setattr(partitions, '_remove_copied', lambda conn, start, end, max_id: 0)
+    partitions.seal_closed_months()
+    assert hot_count(main, start, epoch(2019, 8)) == 30
+    assert len(history(partitions, start, epoch(2019, 8))) == 30
+
+    monkeypatch.undo()
+    partitions.seal_closed_months()
+    assert hot_count(main, start, epoch(2019, 8)) == 0
+
+
+def test_drop_expired_by_history_floor(main, partitions, monkeypatch):
+    insert_rows(main, [('telegram', 1, epoch(2019, 9, 5)), ('telegram', 2, epoch(2019, 10, 5))])
+    partitions.seal_closed_months()
+    monkeypatch.setattr(partitions, 'history_floor', lambda now=None: epoch(2019, 10))
+
+    assert partitions.drop_expired() == ['201909']
+    months = [row[0] for row in partitions.partitions(epoch(2019, 1), epoch(2020, 1))]
+    assert months == ['201910']
+
+
+def test_history_floor_counts_calendar_months(main):
+    manager = main.StatsPartitionManager(keep_months=2)
+    assert manager.history_floor(epoch(2024, 3, 15)) == epoch(2024, 1)
+    assert main.StatsPartitionManager(keep_months=0).history_floor() == 0
+
+
+def test_reingest_of_sealed_row_is_duplicate(main, partitions):
+    created_at = epoch(2019, 11, 3)
+    record = {'platform': 'telegram', 'followers': 10, 'timestamp': created_at}
+    assert main.ingest_platform_stats([record])['inserted'] == 1
+    partitions.seal_closed_months()
+    samples = main.get_db().execute(
+        "SELECT SUM(samples) FROM stats_rollup_daily WHERE platform = 'telegram' AND bucket = ?",
+        (created_at - created_at % 86400,)
+    ).fetchone()[0]
+
+    result = main.ingest_platform_stats([record, dict(record, timestamp=created_at + 1)])
+    assert (result['inserted'], result['duplicates']) == (1, 1)
+    assert main.get_db().execute(
+        "SELECT SUM(samples) FROM stats_rollup_daily WHERE platform = 'telegram' AND bucket = ?",
+        (created_at - created_at % 86400,)
+    ).fetchone()[0] == samples + 1
+
+
+def test_ingest_rejects_rows_older_than_history_floor(main, monkeypatch):
+    monkeypatch.setattr(main.stats_partitions, 'keep_months', 1)
+    result = main.ingest_platform_stats([{'platform': 'vk', 'timestamp': epoch(2019, 1, 5)}])
+    assert (result['inserted'], result['rejected']) == (0, 1)
+
+
+INGEST_WORKER = '''
+import json, time
+now = int(time.time()) - 86400
+records = ({'platform': ('instagram', 'tiktok', 'youtube', 'telegram')[i % 4], 'followers': i,
+            'engagement': 1.5, 'views': i * 3, 'timestamp': now + i // 4} for i in range(1_000_000))
+first = main.ingest_platform_stats(records)
+again = main.ingest_platform_stats({'platform': 'tiktok', 'timestamp': now + i} for i in range(10_000))
+print(json.dumps({'first': first, 'again': again}))
+'''
+
+
+def test_ingest_1m_rows_benchmark(tmp_path):
+    """Бенчмарк: 1M строк через ingest_platform_stats на отдельной БД, с триггерами роллапов"""
+    output, = run_workers(tmp_path, INGEST_WORKER, 1, timeout=600)
+    result = json.loads(output.strip().splitlines()[-1])
+    first, again = result['first'], result['again']
+    print(f"\ningest_platform_stats: 1M строк за {first['seconds']} с, {first['rows_per_second']:,} строк/с")
+    assert (first['inserted'], first['duplicates'], first['rejected']) == (1_000_000, 0, 0)
+    assert (again['inserted'], again['duplicates']) == (0, 10_000)
+    assert first['rows_per_second'] > 10_000